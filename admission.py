@@ -0,0 +1,252 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import math
+import threading
+import time
+
+# Düşük sayı önce çalışır: konuşması süren çağrılar yeni çağrılardan önce gelir
+IN_PROGRESS = 0
+NEW_CALL = 1
+SPECULATIVE = 2
+
+
+class SchedulerTimeout(Exception):
+    pass
+
+
+class TokenBucket:
+    """Continuously refilling bucket for a per-minute quota; rate 0 means unlimited."""
+
+    def __init__(self, per_minute, burst_seconds=10.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds) if per_minute else 0.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, amount):
+        # Kapasiteden büyük istekler de dolu kovadan geçebilsin
+        return not self.rate or self.level >= min(amount, self.capacity)
+
+    def take(self, amount):
+        if self.rate:
+            self.level -= amount
+
+    def drain(self):
+        self.level = min(self.level, 0.0)
+
+    def wait_time(self, amount):
+        if not self.rate:
+            return 0.0
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+
+class _Waiter:
+    __slots__ = ("rank", "tokens", "wake", "admitted", "cancelled")
+
+    def __init__(self, rank, tokens, wake):
+        self.rank = rank
+        self.tokens = tokens
+        self.wake = wake
+        self.admitted = False
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return self.rank < other.rank
+
+
+class CompletionScheduler:
+    """Admission control in front of the OpenAI completion call.
+
+    Turns are admitted in order of their deadline while RPM/TPM token
+    buckets and the concurrency limit allow it; turns of calls in progress
+    get head_start seconds on first turns, and speculative requests wait
+    behind both. A 429 drains the buckets and pauses admission for the
+    server's Retry-After. Both blocking and asyncio callers wait in the
+    same queue.
+    """
+
+    def __init__(self, rpm=0, tpm=0, max_concurrency=64, busy_queue=50, burst_seconds=10.0,
+                 head_start=0.25):
+        self.requests = TokenBucket(rpm, burst_seconds)
+        self.tokens = TokenBucket(tpm, burst_seconds)
+        self.max_concurrency = max_concurrency
+        self.busy_queue = busy_queue
+        self.head_start = head_start
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.stats = {"admitted": 0, "queued": 0, "timeouts": 0, "rate_limited": 0}
+        self._waiting = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.requests.refill(now)
+        self.tokens.refill(now)
+
+    def _admissible(self, tokens, now):
+        return (self.in_flight < self.max_concurrency and now >= self.paused_until
+                and self.requests.available(1) and self.tokens.available(tokens))
+
+    def _dispatch(self):
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiting:
+            head = self._waiting[0]
+            if head.cancelled:
+                heapq.heappop(self._waiting)
+                continue
+            if not self._admissible(head.tokens, now):
+                break
+            heapq.heappop(self._waiting)
+            self._admit(head.tokens)
+            head.admitted = True
+            head.wake()
+
+    def _admit(self, tokens):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.in_flight += 1
+        self.stats["admitted"] += 1
+
+    def _retry_in(self, tokens):
+        # Kuyruktaki bekleyenin yeniden denemesi gereken en geç süre
+        now = time.monotonic()
+        hint = max(self.paused_until - now, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+        return min(max(hint, 0.01), 1.0)
+
+    def _rank(self, priority, deadline):
+        # Katı öncelikte ilk turlar, sonradan gelen devam turlarının arkasında bütçeleri bitene
+        # kadar bekleyebilir; bu yüzden turlar son tarihlerine göre sıralanır
+        due = math.inf if deadline is None else deadline
+        if priority == NEW_CALL:
+            due += self.head_start
+        return priority >= SPECULATIVE, due, priority, next(self._seq)
+
+    def _enqueue(self, priority, tokens, wake, deadline):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if not self._waiting and self._admissible(tokens, now):
+                self._admit(tokens)
+                return None
+            waiter = _Waiter(self._rank(priority, deadline), tokens, wake)
+            heapq.heappush(self._waiting, waiter)
+            self.stats["queued"] += 1
+            self._dispatch()
+            return waiter
+
+    def _wait_timeout(self, tokens, deadline):
+        timeout = self._retry_in(tokens)
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+        return timeout
+
+    def _poll(self, waiter, deadline):
+        # Zamanlayıcıyla kova dolmuş olabilir; tekrar dağıt, süre dolduysa vazgeç
+        with self._lock:
+            self._dispatch()
+            if waiter.admitted or deadline is None or time.monotonic() < deadline:
+                return
+            waiter.cancelled = True
+            self.stats["timeouts"] += 1
+        raise SchedulerTimeout("no OpenAI capacity before the turn deadline")
+
+    def _abandon(self, waiter):
+        with self._lock:
+            if waiter.admitted:
+                self.in_flight -= 1
+                self._dispatch()
+            else:
+                waiter.cancelled = True
+
+    def acquire(self, tokens, priority=NEW_CALL, deadline=None):
+        event = threading.Event()
+        waiter = self._enqueue(priority, tokens, event.set, deadline)
+        while waiter is not None and not waiter.admitted:
+            timeout = self._wait_timeout(tokens, deadline)
+            if timeout > 0 and event.wait(timeout):
+                continue
+            self._poll(waiter, deadline)
+
+    async def acquire_async(self, tokens, priority=NEW_CALL, deadline=None):
+        loop = asyncio.get_running_loop()
+        admitted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: admitted.done() or admitted.set_result(True))
+
+        waiter = self._enqueue(priority, tokens, wake, deadline)
+        try:
+            while waiter is not None and not waiter.admitted:
+                timeout = self._wait_timeout(tokens, deadline)
+                try:
+                    await asyncio.wait_for(asyncio.shield(admitted), max(timeout, 0))
+                except asyncio.TimeoutError:
+                    self._poll(waiter, deadline)
+        except asyncio.CancelledError:
+            # Hedge'i kaybeden görev iptal edildi; kuyruktaki yerini ya da slotunu bırak
+            self._abandon(waiter)
+            raise
+
+    @contextlib.contextmanager
+    def slot(self, tokens, priority=NEW_CALL, deadline=None):
+        self.acquire(tokens, priority, deadline)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextlib.asynccontextmanager
+    async def slot_async(self, tokens, priority=NEW_CALL, deadline=None):
+        await self.acquire_async(tokens, priority, deadline)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._dispatch()
+
+    def rate_limited(self, retry_after):
+        with self._lock:
+            self.stats["rate_limited"] += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            self.requests.drain()
+            self.tokens.drain()
+
+    def saturated(self):
+        # Yeni bir istek şu anda beklemeden kabul edilemez mi?
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return self._queued() > 0 or not self._admissible(0, now)
+
+    def overloaded(self):
+        with self._lock:
+            return self._queued() >= self.busy_queue or self.paused_until - time.monotonic() > 5
+
+    def queued(self):
+        with self._lock:
+            return self._queued()
+
+    def _queued(self):
+        return sum(1 for waiter in self._waiting if not waiter.cancelled)
+
+
+def retry_after(error, default=1.0):
+    # OpenAI 429 cevabındaki bekleme süresi (retry-after-ms ya da retry-after)
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers.get(header)) * scale
+        except (TypeError, ValueError):
+            continue
+    return default
@@ -1,17 +1,103 @@
 from flask import Flask, request, Response
+import openai
 from openai import OpenAI
 import os
+import json
 import logging
-import re
-from gmail_mailer import send_email
-import tiktoken
-import xml.etree.ElementTree as ET
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from gmail_mailer import enqueue_email
+import admission
+from admission import CompletionScheduler
+import audio_cache
+from conversation_window import ConversationWindow, count_pinned_tokens, count_tokens, get_encoding
+from conversation_analyzer import ConversationAnalyzer
+import call_flow
+import call_journal
+import conversation_summary
+from deadline import CompletionDeadline
+from speculative import SpeculativeCompletions
+from streaming import StreamClaimed, TurnStream
+import gmail_mailer
+import metrics
+import warmup
+from metrics import stage
+from session_store import SESSION_TTL, TTLCache, create_session_store, register_prompt
+import twiml
 
 app = Flask(__name__)
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# 429 ve geçici hatalar istemci yerine zamanlayıcı tarafından yeniden denenir
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "0"))
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=OPENAI_MAX_RETRIES)
 logging.basicConfig(level=logging.INFO)
-
-session_memory = {}
+warmup.use_tiktoken_cache()
+
+MAX_CONTEXT_TOKENS = 1500
+CHAT_MODEL = "gpt-4o"
+
+# Tur başına GPT zaman bütçesi; Twilio webhook'u 15 saniyede zaman aşımına uğrar
+MAX_COMPLETION_TOKENS = int(os.getenv("MAX_COMPLETION_TOKENS", "300"))
+LLM_TURN_BUDGET = float(os.getenv("LLM_TURN_BUDGET", "10"))
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER")) if os.getenv("LLM_HEDGE_AFTER") else None
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL") or None
+LLM_FALLBACK_AFTER = float(os.getenv("LLM_FALLBACK_AFTER", "6"))
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "256"))
+LLM_RETRY_PAUSE = 0.25
+
+# Uzun çağrılarda eski turlar atılmak yerine özetlenip system prompt'tan sonra sabitlenir
+CONTEXT_COMPACTION = os.getenv("CONTEXT_COMPACTION", "1") == "1"
+COMPACT_AT = int(MAX_CONTEXT_TOKENS * float(os.getenv("COMPACT_AT_RATIO", "0.75")))
+COMPACT_KEEP_TOKENS = MAX_CONTEXT_TOKENS // 3
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_MAX_TOKENS = 150
+SUMMARY_TIMEOUT = 20.0
+
+# OpenAI kotası: 0 sınırsız demektir; 429 gelirse kabul yine de duraklatılır
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "0"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "0"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "200"))
+ADMISSION_BUSY_QUEUE = int(os.getenv("ADMISSION_BUSY_QUEUE", "50"))
+OPENAI_BURST_SECONDS = float(os.getenv("OPENAI_BURST_SECONDS", "10"))
+
+# Deferred mod: webhook hemen döner, GPT cevabı /webhook-result ile alınır
+DEFERRED_RESPONSES = os.getenv("DEFERRED_RESPONSES", "0") == "1"
+DEFERRED_WORKERS = int(os.getenv("DEFERRED_WORKERS", "128"))
+DEFERRED_POLL_PAUSE = int(os.getenv("DEFERRED_POLL_PAUSE", "1"))
+DEFERRED_MAX_POLLS = int(os.getenv("DEFERRED_MAX_POLLS", "20"))
+DEFERRED_RESULT_TTL = 600
+DEFERRED_FILLER = twiml.FILLER_MESSAGES
+
+# Akış modu: GPT cevabı geldikçe ilk cümleler hemen söylenir, kalanı /webhook-continue'dan gelir
+STREAMING_RESPONSES = os.getenv("STREAMING_RESPONSES", "0") == "1"
+STREAM_FIRST_CHARS = int(os.getenv("STREAM_FIRST_CHARS", "40"))
+
+# Kalıcı çağrı günlüğü: JOURNAL_DIR ayarlıysa her mesaj arka planda diske de yazılır
+JOURNAL_ABANDON_AFTER = float(os.getenv("JOURNAL_ABANDON_AFTER", "900"))
+CALL_ENDED_STATUSES = {"completed", "busy", "failed", "no-answer", "canceled"}
+CALLER_FIELDS = ("From", "CallerCity", "CallerState")
+
+call_contexts = TTLCache(on_evict=lambda call_sid, context: context.finish())
+sessions = create_session_store(on_evict=lambda call_sid, messages: retire_call_context(call_sid, messages),
+                                on_overflow=lambda call_sid, messages: session_overflowed(call_sid, messages))
+journal = call_journal.create_journal()
+if journal is not None:
+    sessions = call_journal.JournaledSessionStore(sessions, journal)
+pending_turns = {}
+turn_executor = ThreadPoolExecutor(max_workers=DEFERRED_WORKERS, thread_name_prefix="turn")
+llm_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+scheduler = CompletionScheduler(rpm=OPENAI_RPM, tpm=OPENAI_TPM, max_concurrency=OPENAI_MAX_CONCURRENCY,
+                                busy_queue=ADMISSION_BUSY_QUEUE, burst_seconds=OPENAI_BURST_SECONDS)
+completion_deadline = CompletionDeadline(CHAT_MODEL, LLM_TURN_BUDGET, hedge_after=LLM_HEDGE_AFTER,
+                                         fallback_model=LLM_FALLBACK_MODEL, fallback_after=LLM_FALLBACK_AFTER)
+
+# Spekülatif mod: Twilio'nun kısmi konuşma sonuçlarıyla GPT çağrısı erken başlatılır
+SPECULATIVE_COMPLETIONS = twiml.PARTIAL_RESULT_CALLBACK
+SPECULATIVE_MAX_INFLIGHT = int(os.getenv("SPECULATIVE_MAX_INFLIGHT", "2"))
+speculator = (SpeculativeCompletions(turn_executor, max_inflight=SPECULATIVE_MAX_INFLIGHT)
+              if SPECULATIVE_COMPLETIONS else None)
 
 # 🔹 İngilizce system prompt
 SYSTEM_PROMPT_EN = """
@@ -106,361 +192,834 @@ EMAIL CONFIRMATION:
 
 """
 
-def trim_session_memory(memory, max_tokens=1500):
-    encoding = tiktoken.encoding_for_model("gpt-4o")
-    total_tokens = 0
-    trimmed = []
-    for msg in reversed(memory):
-        tokens = len(encoding.encode(msg["content"]))
-        if total_tokens + tokens > max_tokens:
-            break
-        trimmed.insert(0, msg)
-        total_tokens += tokens
-    return trimmed
+register_prompt("en", SYSTEM_PROMPT_EN)
+register_prompt("fr", SYSTEM_PROMPT_FR)
+
+def warm_tokenizer():
+    # BPE dosyaları ilk çağrıda değil burada yüklenir; system prompt sayımları önbelleğe girer
+    get_encoding(CHAT_MODEL)
+    return {lang: count_pinned_tokens(prompt, CHAT_MODEL)
+            for lang, prompt in (("en", SYSTEM_PROMPT_EN), ("fr", SYSTEM_PROMPT_FR))}
+
+class CallContext:
+    # Transcript'ten türetilen, çağrı başına artımlı tutulan durum
+    def __init__(self):
+        self.window = ConversationWindow(max_tokens=MAX_CONTEXT_TOKENS,
+                                         compact_at=COMPACT_AT if CONTEXT_COMPACTION else None)
+        self.analyzer = ConversationAnalyzer()
+        self.caller = {}
+        self.gist = None
+        self.compacting = False
+        self.compactions = 0
+        self.turns = 0
+        self.llm_calls = 0
+        self.local_responses = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.talk_seconds = 0.0
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def sync(self, transcript):
+        with self.lock:
+            self.window.sync(transcript)
+            self.analyzer.sync(transcript)
+        return self
+
+    def prompt_messages(self, *extra):
+        with self.lock:
+            return self.window.messages() + list(extra)
+
+    def finish(self):
+        # Çağrı başına toplamlar yalnızca bir kez histogramlara yazılır
+        if self.finished or not self.turns:
+            return
+        self.finished = True
+        metrics.observe_call(self.turns, self.llm_calls, self.prompt_tokens,
+                             self.completion_tokens, self.talk_seconds)
+
+def get_call_context(call_sid, transcript):
+    context = call_contexts.get(call_sid)
+    if context is None:
+        context = CallContext()
+        call_contexts.set(call_sid, context)
+    return context.sync(transcript)
+
+def retire_call_context(call_sid, history=None):
+    context = call_contexts.pop(call_sid)
+    if history:
+        # Oturum süresi doldu ama kapanış cümlesi hiç söylenmedi
+        summarize_abandoned_call(call_sid, history, context)
+    if context is not None:
+        context.finish()
+
+def session_overflowed(call_sid, history):
+    # Bellek sınırı için atılan çağrı hâlâ hatta olabilir; "kapattı" özeti gönderilmez
+    logging.warning(f"🧹 Dropped {len(history)} messages of {call_sid} to stay under the session store caps; "
+                    f"the call carries on without its history")
+
+def caller_info(form):
+    return {field: form.get(field) for field in CALLER_FIELDS}
+
+def xml_response(body, status=200):
+    return Response(body, status=status, mimetype="text/xml")
+
+def static_response(static):
+    # Sabit TwiML önceden üretilmiş baytlardan, ETag ile servis edilir
+    response = xml_response(static.body)
+    response.set_etag(static.etag)
+    return response.make_conditional(request)
+
+# Aşağıdaki *_request fonksiyonları isteği form/args sözlüklerinden işler; Flask route'ları ve
+# async_app aynı fonksiyonları çağırır, ön yüzler yalnızca HTTP katmanını ve beklemeyi üstlenir
+
+def int_arg(args, name, default=None):
+    value = args.get(name)
+    return int(value) if value and value.isdigit() else default
+
+def welcome_request(form):
+    if scheduler.overloaded():
+        # Süren çağrılar öncelikli; yeni arayana kibarca meşgul mesajı ver
+        logging.warning(f"🚦 Overloaded ({scheduler.queued()} completions queued), turning away a new call")
+        metrics.BUSY_CALLS.inc()
+        return twiml.BUSY
+    record_call_start(form.get("CallSid"), form)
+    return twiml.WELCOME
 
 @app.route("/", methods=["GET", "POST"])
 def welcome():
-    return Response("""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-  <Gather action="/handle-selection" method="POST" input="dtmf" numDigits="1" timeout="5">
-    <Say voice="Polly.Joanna" language="en-US">Welcome to Neatliner Customer Service.</Say>
-    <Say voice="Polly.Celine" language="fr-CA">Bienvenue au service client Neatliner. Pour le service en français, appuyez sur 9.</Say>
-  </Gather>
-  <Redirect>/voice?lang=en</Redirect>
-</Response>""", mimetype="text/xml")
+    return static_response(welcome_request(request.form))
+
+def record_call_start(call_sid, form):
+    if journal is not None and call_sid:
+        journal.call_started(call_sid, caller_info(form))
+
+def selection_request(form):
+    return twiml.SELECTION["fr" if form.get("Digits") == "9" else "en"]
+
+def localized_request(args, statics):
+    return statics[twiml.normalize_lang(args.get("lang", "en"))]
 
 @app.route("/handle-selection", methods=["POST"])
 def handle_selection():
-    digits = request.form.get("Digits")
-    lang = "fr" if digits == "9" else "en"
-    return Response(f"""<?xml version='1.0' encoding='UTF-8'?>
-<Response>
-  <Redirect>/voice?lang={lang}</Redirect>
-</Response>""", mimetype="text/xml")
+    return static_response(selection_request(request.form))
 
 @app.route("/voice", methods=["GET", "POST"])
 def voice_flow():
-    lang = request.args.get("lang", "en")
-    if lang == "fr":
-        voice = "Polly.Celine"
-        language = "fr-CA"
-        welcome_line = "Je suis ici pour vous aider concernant les produits Neatliner. Comment puis-je vous aider aujourd'hui ?"
-    else:
-        voice = "Polly.Joanna"
-        language = "en-US"
-        welcome_line = "I’m here to assist you with anything related to Neatliner products. How can I assist you today?"
-
-    return Response(f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-  <Say voice="{voice}" language="{language}">{welcome_line}</Say>
-  <Gather input="speech" timeout="5" action="/webhook?lang={lang}" method="POST" language="{language}"/>
-</Response>""", mimetype="text/xml")
-
-def estimate_twiml_size(text):
-    root = ET.Element("Response")
-    say = ET.SubElement(root, "Say")
-    say.text = text
-    return len(ET.tostring(root, encoding="utf-8"))
+    return static_response(localized_request(request.args, twiml.VOICE_FLOW))
+
+@app.route("/voice-stream", methods=["GET", "POST"])
+def voice_stream():
+    # WSGI sunucusu Media Streams soketini tutamaz; çağrı düşmesin diye <Gather> akışına dönülür
+    logging.error("❌ MEDIA_STREAMS=1 needs the ASGI entry point (uvicorn async_app:app), using <Gather> instead")
+    return static_response(localized_request(request.args, twiml.VOICE_FLOW))
+
+def order_number_request(form, args):
+    digits = form.get("Digits", "")
+    lang = args.get("lang", "en")
+    logging.info(f"Received DTMF digits: {digits}")
+    return render_turn(order_number_reply(form.get("CallSid"), digits, lang), lang)
 
 @app.route("/order-number", methods=["POST"])
 def handle_order_number():
-    digits = request.form.get("Digits", "")
-    logging.info(f"Received DTMF digits: {digits}")
-    lang = request.args.get("lang", "en")
-    call_sid = request.form.get("CallSid")
+    return xml_response(order_number_request(request.form, request.args))
 
-    logging.info(f"Received DTMF digits: {request.form.get('Digits')}")
-    
+def order_number_reply(call_sid, digits, lang):
     if not digits:
-        message = "Sorry, I didn't receive your input. Please try again." if lang == "en" else "Désolé, je n'ai pas reçu votre saisie. Veuillez réessayer."
-        return twiml_response(message, lang)
+        return "Sorry, I didn't receive your input. Please try again." if lang == "en" else "Désolé, je n'ai pas reçu votre saisie. Veuillez réessayer."
 
     formatted = f"{digits[:3]}-{digits[3:10]}-{digits[10:]}" if len(digits) == 17 else digits
 
-    if call_sid in session_memory:
-        session_memory[call_sid].append({
+    confirm = call_flow.ORDER_CONFIRMATION["fr" if lang == "fr" else "en"].format(order_number=formatted)
+
+    if call_sid in sessions:
+        sessions.append(call_sid, {
             "role": "user",
             "content": f"My order number is {formatted}"
         })
+        # Onay da transcript'e yazılır ki akışın bir sonraki adımı bilinsin
+        sessions.append(call_sid, {"role": "assistant", "content": confirm})
 
-    confirm = f"Thank you. I’ve received your order number: {formatted}. Could you now explain your issue in detail?" \
-              if lang == "en" else \
-              f"Merci. J'ai bien reçu votre numéro de commande : {formatted}. Pourriez-vous maintenant expliquer votre problème en détail ?"
-
-    return twiml_response(confirm, lang)
-
-def extract_last_email(memory):
-    import re
-
-    email_pattern = r"\b[\w\.-]+@[\w\.-]+\.\w+\b"
-
-    for msg in reversed(memory):
-        if msg["role"] == "user":
-            content = msg["content"].lower()
+    return confirm
 
-            # Dönüşümler
-            content = content.replace(" at ", "@")
-            content = content.replace("arobase", "@")
-            content = content.replace(" dot ", ".").replace(" point ", ".")
-            content = re.sub(r"\s+", "", content)     # boşlukları kaldır
-            content = re.sub(r"\.(?=[^@]*@)", "", content)  # @ işaretinden önceki . karakterlerini kaldır
-            content = content.strip(" .")             # baştaki/sondaki nokta ve boşlukları kaldır
-
-            # E-mail yakala
-            matches = re.findall(email_pattern, content)
-            if matches:
-                return matches[-1].lower()  # her ihtimale karşı küçük harfe çevir
-
-    return "Not Provided"
-
-def format_email_for_confirmation(email: str, lang: str = "en") -> str:
-    import re
-
-    match = re.match(r"([\w\.-]+)@([\w\.-]+\.\w+)", email)
-    if not match:
-        return email  # Format uygun değilse olduğu gibi döndür
+@app.route("/repeat-order-number", methods=["GET", "POST"])
+def repeat_order_number():
+    return static_response(localized_request(request.args, twiml.REPEAT_ORDER_NUMBER))
 
-    local_part, domain_part = match.groups()
 
-    if lang == "fr":
-        connector = "arobase"
-        dot_replacement = "point"
-    else:
-        connector = "at"
-        dot_replacement = "dot"
-
-    # Her harf arasına 1 saniyelik durak ekle
-    slow_letters = ""
-    for char in local_part:
-        slow_letters += f"{char.upper()} <break time=\"1s\"/> "
-
-    domain_slow = domain_part.replace(".", f" {dot_replacement} ")
-
-    # Sonuç: A <break/> S <break/> ... at gmail dot com
-    return f"{slow_letters.strip()} {connector} {domain_slow}"
-
-def extract_last_order_number(messages):
-    for msg in reversed(messages):
-        if msg["role"] == "user":
-            spoken = msg["content"].lower()
-
-            # Konuşma biçimlerini normalize et
-            spoken = spoken.replace(" dash ", "-").replace(" tiré ", "-").replace(" hyphen ", "-")
-
-            # Fazla boşlukları sil, çizgi formatına yaklaştır
-            spoken = re.sub(r'\s+', '', spoken)
-
-            # Order number formatını yakala: 702-1234567-9876543
-            match = re.search(r'(\d{3})[-]?(\d{7})[-]?(\d{7})', spoken)
-            if match:
-                return f"{match.group(1)}-{match.group(2)}-{match.group(3)}"
-    return "Not Provided"
-
-def detect_call_type(messages):
-    full_text = " ".join(msg["content"].lower() for msg in messages if msg["role"] == "user")
-    if any(word in full_text for word in ["problem", "problème", "issue"]):
-        return "Complaint"
-    elif any(word in full_text for word in ["request", "demande", "exchange"]):
-        return "Request"
-    elif any(word in full_text for word in ["suggestion", "avis", "proposition"]):
-        return "Suggestion"
-    return "Not Identified"
-
-def extract_platform(messages):
-    full_text = " ".join(msg["content"].lower() for msg in messages if msg["role"] == "user")
-
-    if "amazon" in full_text:
-        return "Amazon"
-    elif "walmart" in full_text:
-        return "Walmart"
-    elif "website" in full_text or "neatliner.com" in full_text:
-        return "Neatliner Website"
-    elif "store" in full_text or "in store" in full_text:
-        return "Physical Store"
-    elif "online" in full_text:
-        return "Online (unspecified)"
-    return "Not Provided"
+def render_turn(text, lang="en", spoken=0):
+    with stage("render"):
+        if spoken:
+            # İlk cümleler zaten söylendi; tür (DTMF, kapanış) yine de cevabın tamamından belirlenir
+            rendered = twiml.build_turn_response(text[spoken:], lang, kind=twiml.classify(text, lang))
+        else:
+            rendered = twiml.build_turn_response(text, lang)
+    logging.info(f"TwiML size: {rendered.size} bytes")
 
-@app.route("/repeat-order-number", methods=["GET", "POST"])
-def repeat_order_number():
-    lang = request.args.get("lang", "en")
-    if lang == "fr":
-        voice = "Polly.Celine"
-        language = "fr-CA"
-        repeat_msg = "Vous n'avez appuyé sur aucune touche. Veuillez entrer votre numéro de commande au clavier téléphonique, puis appuyez sur la touche dièse."
-        goodbye_msg = "Je suis désolé, je n’ai toujours pas reçu d’entrée. Je vais maintenant mettre fin à l’appel."
-    else:
-        voice = "Polly.Joanna"
-        language = "en-US"
-        repeat_msg = "You didn’t press any keys. Please enter your order number using the keypad and press the pound key."
-        goodbye_msg = "I'm sorry, I still didn’t receive any input. I will now end the call."
-
-    return Response(f"""<?xml version="1.0" encoding="UTF-8"?>
-    <Response>
-      <Gather input="dtmf" timeout="10" finishOnKey="#" action="/order-number?lang={lang}" method="POST" language="{language}">
-        <Say voice="{voice}" language="{language}">{repeat_msg}</Say>
-      </Gather>
-      <Say voice="{voice}" language="{language}">{goodbye_msg}</Say>
-      <Hangup/>
-    </Response>""", mimetype="text/xml")
-
-
-def twiml_response(text, lang="en"):
-    text_clean = text.strip()
-
-    if lang == "fr":
-        final_closures = [
-            "Merci d’avoir contacté le service client Neatliner.",
-            "Nous vous recontacterons dans les plus brefs délais. Au revoir !"
-        ]
-        skip_gather_phrases = [
-            "Bienvenue au service client Neatliner",
-            "Merci d’avoir contacté le service client Neatliner",
-            "Malheureusement, je ne peux pas vous aider"
-        ]
-        voice = "Polly.Celine"
-        language = "fr-CA"
+    if rendered.kind == twiml.FINAL:
+        logging.info("🛑 Final or passive phrase detected — returning without <Gather>")
+    return rendered.body
+
+
+def begin_turn(call_sid, speech_result, lang):
+    with stage("session"):
+        # Doğru prompt'u başlat
+        if call_sid not in sessions:
+            system_prompt = SYSTEM_PROMPT_FR if lang == "fr" else SYSTEM_PROMPT_EN
+            sessions.create(call_sid, [
+                {"role": "system", "content": system_prompt}
+            ])
+            logging.info("Initialized new session memory")
+
+        return sessions.append(call_sid, {"role": "user", "content": speech_result})
+
+def estimate_tokens(messages, context=None):
+    # OpenAI TPM'e istek anında prompt + max_tokens sayılır; pencere sayımları yeniden kullanılır
+    if context is not None:
+        known = len(context.window)
+        prompt = context.window.prompt_tokens() + sum(count_tokens(m["content"]) for m in messages[known:])
     else:
-        final_closures = [
-            "Thank you for contacting Neatliner Customer Service.",
-            "Thank you for calling Neatliner Customer Service.",
-            "We’ll follow up with you as soon as possible. Goodbye!"
-        ]
-        skip_gather_phrases = [
-            "Welcome to Neatliner Customer Service",
-            "Thank you for contacting Neatliner Customer Service",
-            "Unfortunately, I cannot assist with other topics"
-        ]
-        voice = "Polly.Joanna"
-        language = "en-US"
-
-    trigger_phrases = ["press the pound key", "press #", "type your order number", "enter your order number", 
-                "appuyez sur la touche dièse", "touche dièse", "tapez votre numéro de commande"]
-
-    # 🔹 SSML içeriği kontrolü
-    is_ssml = "<break" in text_clean or "<speak>" in text_clean
-
-    # 🔹 <Say> etiketi SSML'li veya düz olarak ayarlanır
-    say_tag = (
-        f'<Say voice="{voice}" language="{language}" ssml="true"><![CDATA[{text_clean}]]></Say>'
-        if is_ssml else
-        f'<Say voice="{voice}" language="{language}">{text_clean}</Say>'
+        prompt = sum(count_tokens(m["content"]) for m in messages)
+    return prompt + MAX_COMPLETION_TOKENS
+
+def retry_pause(error, deadline):
+    # Yeniden denenebilir hatada beklenecek süre; değilse hatayı yükselt
+    if isinstance(error, openai.RateLimitError):
+        wait = admission.retry_after(error)
+        logging.warning(f"⚠️ OpenAI rate limit hit, pausing admissions for {wait:.1f}s")
+        scheduler.rate_limited(wait)
+        return 0.0
+    transient = isinstance(error, (openai.APIConnectionError, openai.InternalServerError))
+    if not transient or isinstance(error, openai.APITimeoutError) or \
+       time.monotonic() + LLM_RETRY_PAUSE >= deadline:
+        raise error
+    logging.warning(f"⚠️ OpenAI request failed, retrying: {error}")
+    return LLM_RETRY_PAUSE
+
+def request_completion(messages, context=None, priority=admission.NEW_CALL, stream=None):
+    tokens = estimate_tokens(messages, context)
+
+    def create(model, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                with scheduler.slot(tokens, priority, deadline):
+                    if stream is not None:
+                        return stream_completion(model, messages, deadline, stream, context)
+                    return client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        max_tokens=MAX_COMPLETION_TOKENS,
+                        timeout=max(deadline - time.monotonic(), 0.1)
+                    )
+            except openai.APIError as e:
+                time.sleep(retry_pause(e, deadline))
+
+    with stage("llm"):
+        completion = completion_deadline.run(create, llm_executor)
+    if completion is None:
+        return None
+    return completion if stream is not None else completion_text(completion, context)
+
+def stream_completion(model, messages, deadline, stream, context=None):
+    # Parçalar geldikçe TurnStream'e yazılır; akışı başka bir istek (hedge/yedek) aldıysa bu istek bırakılır
+    attempt = object()
+    chunks = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=MAX_COMPLETION_TOKENS,
+        timeout=max(deadline - time.monotonic(), 0.1),
+        stream=True,
+        stream_options={"include_usage": True}
     )
+    parts = []
+    finish_reason = usage = None
+    try:
+        for chunk in chunks:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.delta.content:
+                if not stream.feed(attempt, choice.delta.content):
+                    raise StreamClaimed(model)
+                parts.append(choice.delta.content)
+            finish_reason = choice.finish_reason or finish_reason
+    finally:
+        chunks.close()
+    record_usage(usage, finish_reason, context)
+    return "".join(parts)
+
+def completion_text(completion, context=None):
+    choice = completion.choices[0]
+    record_usage(getattr(completion, "usage", None), getattr(choice, "finish_reason", None), context)
+    return choice.message.content
+
+def record_usage(usage, finish_reason, context=None):
+    if finish_reason == "length":
+        logging.warning("⚠️ GPT response hit max_tokens and was cut short.")
+    if usage is not None:
+        metrics.TOKENS.inc(usage.prompt_tokens, "prompt")
+        metrics.TOKENS.inc(usage.completion_tokens, "completion")
+        if context is not None:
+            context.prompt_tokens += usage.prompt_tokens
+            context.completion_tokens += usage.completion_tokens
+
+def summarize_turns(previous_gist, messages):
+    request_messages = conversation_summary.summary_request(previous_gist, messages)
+    tokens = sum(count_tokens(m["content"]) for m in request_messages) + SUMMARY_MAX_TOKENS
+    deadline = time.monotonic() + SUMMARY_TIMEOUT
+    try:
+        # Arka plan işi: konuşması süren turların önüne geçmesin
+        with scheduler.slot(tokens, admission.SPECULATIVE, deadline):
+            completion = client.chat.completions.create(
+                model=SUMMARY_MODEL,
+                messages=request_messages,
+                max_tokens=SUMMARY_MAX_TOKENS,
+                timeout=max(deadline - time.monotonic(), 0.1)
+            )
+        return completion_text(completion).strip()
+    except (openai.APIError, admission.SchedulerTimeout) as e:
+        logging.warning(f"⚠️ Summary request failed, keeping the caller's own words: {e}")
+        return conversation_summary.extractive_gist(previous_gist, messages)
+
+def compact_call(call_sid, context):
+    try:
+        history = sessions.get(call_sid)
+        if not history:
+            return
+        with context.lock:
+            context.window.sync(history)
+            context.analyzer.sync(history)
+            if not context.window.needs_compaction():
+                return
+            fold = context.window.fold_candidates(COMPACT_KEEP_TOKENS)
+            metadata = context.analyzer.metadata()
+            previous_gist = context.gist
+
+        with stage("summarize"):
+            gist = summarize_turns(previous_gist, fold.messages)
+        summary = conversation_summary.render_summary(metadata, gist)
+
+        with context.lock:
+            if context.window.fold(fold, summary):
+                context.gist = gist
+                context.compactions += 1
+                metrics.COMPACTIONS.inc()
+                logging.info(f"🗜️ Folded {len(fold.messages)} messages of {call_sid} into the call summary")
+    except Exception as e:
+        logging.error(f"❌ Compaction failed for {call_sid}: {e}")
+    finally:
+        context.compacting = False
+
+def schedule_compaction(call_sid, context):
+    # Cevap henüz pencerede değil; en fazla MAX_COMPLETION_TOKENS ekleyebilir
+    if context.compacting or not context.window.needs_compaction(margin=MAX_COMPLETION_TOKENS):
+        return
+    context.compacting = True
+    turn_executor.submit(compact_call, call_sid, context)
+
+def generate_reply(call_sid, context, lang, history, stream=None):
+    analyzer = context.analyzer
+    user_text = history[-1]["content"]
+    context.llm_calls += 1
+    response_text = None
+
+    speculation = speculator.claim(call_sid, user_text) if speculator is not None else None
+    if speculation is not None:
+        try:
+            response_text = speculation.future.result()
+            if response_text is not None:
+                metrics.TURNS.inc(label_value="speculative")
+                logging.info("🔮 Reusing speculative completion started from partial speech")
+        except Exception as e:
+            logging.warning(f"Speculative completion failed, recomputing: {e}")
+
+    if response_text is None:
+        with stage("trim"):
+            messages = context.prompt_messages()
+        if replaces_reply(analyzer):
+            # Cevap zaten tamamen yeniden yazılacak; akıtmanın anlamı yok
+            stream = None
+        response_text = request_completion(messages, context, turn_priority(history), stream)
+        if response_text is None and stream is not None and stream.text:
+            logging.warning(f"⚠️ Streamed completion cut at the {LLM_TURN_BUDGET}s turn budget, keeping what arrived.")
+            response_text = stream.text
+        if response_text is None:
+            return budget_reprompt(history, analyzer, lang)
+        metrics.TURNS.inc(label_value="llm")
+
+    with stage("postprocess"):
+        return postprocess_reply(response_text, analyzer, lang)
+
+def turn_priority(history):
+    # Daha önce konuşmuş arayanlar yeni çağrılardan önce GPT'ye ulaşır
+    return admission.IN_PROGRESS if len(history) > 2 else admission.NEW_CALL
+
+def budget_reprompt(history, analyzer, lang):
+    logging.warning(f"⚠️ No completion within the {LLM_TURN_BUDGET}s turn budget, reprompting.")
+    metrics.TURNS.inc(label_value="reprompt")
+    metrics.LLM_FALLBACKS.inc(label_value="reprompt")
+    return call_flow.reprompt(history, analyzer, lang)
+
+def replaces_reply(analyzer):
+    # E-posta onayında GPT cevabı tamamen yeniden yazılır
+    return "email" in analyzer.call_type
+
+def postprocess_reply(response_text, analyzer, lang):
+    logging.info(f"GPT response: {response_text}")
+    
+    if replaces_reply(analyzer):
+        response_text = call_flow.email_confirmation(analyzer.email, lang)
 
-    # 🔹 Order number istendiğinde <Gather> ile bekleme + Redirect fallback
-    if any(phrase in text.lower() for phrase in trigger_phrases):
-        return Response(f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Gather input="dtmf" timeout="15" finishOnKey="#" action="/order-number?lang={lang}" method="POST">
-        {say_tag}
-    </Gather>
-    <Redirect>/repeat-order-number?lang={lang}</Redirect>
-</Response>""", mimetype="text/xml")
-
-    # 🔹 Final veya pasif mesajlar: <Gather> olmadan sadece konuşma
-    if any(text_clean.startswith(phrase) for phrase in final_closures + skip_gather_phrases):
-        logging.info("🛑 Final or passive phrase detected — returning without <Gather>")
-        return Response(f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-  {say_tag}
-</Response>""", mimetype="text/xml")
+    if "Please enter your order number" in response_text:
+        order_number = analyzer.order_number
+        if order_number and order_number != "Not Provided":
+            logging.warning("⚠️ GPT repeated order number request even though it was already provided.")
+            response_text = {
+                "en": "Thank you. We've received your order number.",
+                "fr": "Merci. Nous avons bien reçu votre numéro de commande."
+            }[lang]
 
-    # 🔹 Normal akış: konuşma + Gather
-    return Response(f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-  {say_tag}
-  <Gather input="speech" timeout="5" action="/webhook?lang={lang}" method="POST" language="{language}"/>
-</Response>""", mimetype="text/xml")
+    return response_text
 
+def complete_turn(call_sid, lang, caller, stream=None, turn=None):
+    started = time.perf_counter()
+    # Deferred modda bu fonksiyon worker thread'inde çalışır; kendi trace'ini açar
+    own_trace = metrics.active_trace() is None
+    if own_trace:
+        metrics.begin_trace(call_sid, "deferred-turn")
+    context = None
+    closing = False
+    try:
+        context, history, response_text = plan_turn(call_sid, lang)
+        if response_text is None:
+            response_text = generate_reply(call_sid, context, lang, history, stream)
+        if stream is not None:
+            # Oturuma arayanın gerçekten duyduğu cevap yazılır
+            response_text = stream.settle(response_text)
+        closing = record_reply(call_sid, context, response_text, caller, turn)
 
-@app.route("/webhook", methods=["POST"])
-def webhook():
-    call_sid = request.form.get("CallSid")
-    speech_result = request.form.get("SpeechResult", "")
-    lang = request.args.get("lang", "en")
+    except Exception as e:
+        logging.error(f"OpenAI error: {e}")
+        response_text = "I'm sorry, there was a problem connecting to the assistant."
+        if stream is not None:
+            response_text = stream.settle(response_text)
+
+    end_turn(context, started, closing, own_trace)
+    return response_text
+
+def plan_turn(call_sid, lang):
+    # Betikli turlar burada cevaplanır; None dönen cevap GPT'ye gider
+    with stage("session"):
+        history = sessions.get(call_sid) or []
+    with stage("trim"):
+        context = get_call_context(call_sid, history)
+    with stage("flow"):
+        scripted = call_flow.local_reply(history, context.analyzer, lang) if history else None
+    if scripted is None:
+        return context, history, None
+
+    state, response_text = scripted
+    context.local_responses += 1
+    metrics.TURNS.inc(label_value="local")
+    logging.info(f"⚡ Scripted turn ({state}) answered locally: {response_text}")
+    if speculator is not None:
+        speculator.forget(call_sid)
+    return context, history, response_text
+
+def is_closing(text):
+    # Konu dışı çağrıların kapanışı dahil tüm betikli vedalar call_flow'un işaretleriyle tanınır
+    return call_flow.state_of(text) == call_flow.CLOSING
+
+def record_reply(call_sid, context, response_text, caller, turn=None):
+    context.caller = caller
+    message = {"role": "assistant", "content": response_text}
+    with stage("session"):
+        if turn is None:
+            sessions.append(call_sid, message)
+        elif not sessions.append_at(call_sid, turn + 1, message):
+            # Ertelenmiş tur bırakıldı ve yerine özür söylendi (bu ya da başka bir worker'da);
+            # arayan bu cevabı hiç duymadı, oturuma yazılırsa sonraki tur onu söylenmiş sanır
+            logging.warning(f"🗑️ Discarding late reply for abandoned turn {turn} of {call_sid}")
+            return False
+
+    if is_closing(response_text):
+        with stage("email"):
+            send_call_summary(call_sid, context, caller)
+        return True
+    schedule_compaction(call_sid, context)
+    return False
+
+def end_turn(context, started, closing, own_trace):
+    elapsed = time.perf_counter() - started
+    metrics.TURN_SECONDS.observe(elapsed)
+    if context is not None:
+        context.turns += 1
+        context.talk_seconds += elapsed
+        if closing:
+            context.finish()
+    if own_trace:
+        metrics.end_trace()
+
+def send_call_summary(call_sid, context, caller, history=None, abandoned=False):
+    if history is None:
+        history = sessions.get(call_sid) or []
+    transcript = ""
+    for msg in history:
+        if msg["role"] in ["user", "assistant"]:
+            transcript += f"{msg['role'].upper()}: {msg['content'].strip()}\n"
+
+    metadata = {
+        "from_number": caller.get("From"),
+        "location": f"{caller.get('CallerCity') or ''}, {caller.get('CallerState') or ''}".strip(", "),
+        **context.analyzer.metadata()
+    }
+    if abandoned:
+        metadata["call_status"] = "Caller hung up before the end of the call"
+
+    logging.info(f"📊 Call {call_sid}: {context.llm_calls} LLM calls, {context.local_responses} local responses")
+
+    # SMTP gönderimi arka planda; veda TwiML'i beklemeden döner
+    enqueue_email(transcript, call_sid, metadata)
+    if journal is not None:
+        journal.call_summarized(call_sid, "abandoned" if abandoned else "closing")
+
+def summarize_abandoned_call(call_sid, history, context=None, caller=None):
+    # Kapanış cümlesi söylenmişse özet zaten gönderildi; arayan hiç konuşmadıysa gönderilecek bir şey yok
+    assistant_text = call_flow.last_assistant_text(history)
+    if (assistant_text is not None and is_closing(assistant_text)) or \
+       not any(msg["role"] == "user" for msg in history):
+        return False
+    if context is None:
+        context = CallContext().sync(history)
+    logging.info(f"📴 Call {call_sid} ended before the closing line, sending its summary")
+    # Durum bildiriminde olmayan alanlar çağrı başında kaydedilen bilgilerden gelir
+    caller = {**context.caller, **{field: value for field, value in (caller or {}).items() if value}}
+    send_call_summary(call_sid, context, caller, history, abandoned=True)
+    return True
+
+def end_call(call_sid, status, caller):
+    history = sessions.get(call_sid)
+    context = call_contexts.pop(call_sid)
+    if history:
+        summarize_abandoned_call(call_sid, history, context, caller)
+    if journal is not None:
+        journal.call_ended(call_sid, status)
+    if context is not None:
+        context.finish()
+    if speculator is not None:
+        speculator.forget(call_sid)
+    if history is not None:
+        sessions.delete(call_sid)
+
+def recover_calls():
+    # Süreç yeniden başladıysa yarım kalan çağrılar günlükten geri yüklenir.
+    # Her worker bunu import sırasında çalıştırır; kilit sayesinde biri bitirip özet kayıtlarını
+    # diske yazmadan diğeri günlüğü okumaz, terk edilmiş çağrının özeti bir kez gider
+    restored = abandoned = 0
+    with journal.exclusive():
+        now = time.time()
+        for call in journal.open_calls(since=now - 2 * max(SESSION_TTL, JOURNAL_ABANDON_AFTER)).values():
+            if not call.complete() or call.call_sid in sessions:
+                continue
+            history = call.transcript()
+            if now - call.updated > JOURNAL_ABANDON_AFTER:
+                abandoned += summarize_abandoned_call(call.call_sid, history, caller=call.caller)
+                continue
+            # Günlüğe yeniden yazmadan alttaki depoya koy
+            sessions.store.create(call.call_sid, history)
+            context = CallContext().sync(history)
+            context.caller = call.caller
+            call_contexts.set(call.call_sid, context)
+            restored += 1
+        journal.flush()
+    if restored or abandoned:
+        logging.info(f"📒 Recovered {restored} calls from the journal, summarized {abandoned} abandoned calls")
+
+def start_deferred_turn(call_sid, turn, lang, caller):
+    future = turn_executor.submit(complete_turn, call_sid, lang, caller, None, turn)
+    add_pending_turn(call_sid, turn, future)
+
+def add_pending_turn(call_sid, turn, future):
+    now = time.monotonic()
+    # Kapanmış çağrılardan kalan eski sonuçları temizle
+    for key, (_, created) in list(pending_turns.items()):
+        if now - created > DEFERRED_RESULT_TTL:
+            pending_turns.pop(key, None)
+    pending_turns[(call_sid, turn)] = (future, now)
+
+def redirect_body(lang, turn, attempt, lead):
+    lang = twiml.normalize_lang(lang)
+    if lead:
+        lead_tag = twiml.speak(DEFERRED_FILLER[lang], lang)
+    else:
+        lead_tag = twiml.pause(DEFERRED_POLL_PAUSE)
+    target = twiml.url("/webhook-result", lang=lang, turn=turn, attempt=attempt)
+    return twiml.redirect_response(lead_tag, target)
+
+def webhook_request(form, args, start_deferred=start_deferred_turn):
+    # Cevap burada verilebiliyorsa (konuşma yok, ertelenmiş ya da akışlı tur) (TwiML, None);
+    # yoksa (None, (call_sid, lang, caller)) döner ve turu ön yüz kendi yolunca tamamlar
+    call_sid = form.get("CallSid")
+    speech_result = form.get("SpeechResult", "")
+    lang = args.get("lang", "en")
     logging.info("===== Incoming Webhook =====")
     logging.info(f"CallSid: {call_sid}")
     logging.info(f"Caller said: {speech_result}")
 
     if not speech_result:
-        return twiml_response("Sorry, I didn't catch that. Could you please repeat?", lang)
-
-    # Doğru prompt'u başlat
-    if call_sid not in session_memory:
-        system_prompt = SYSTEM_PROMPT_FR if lang == "fr" else SYSTEM_PROMPT_EN
-        session_memory[call_sid] = [
-            {"role": "system", "content": system_prompt}
-        ]
-        logging.info("Initialized new session memory")
+        return render_turn("Sorry, I didn't catch that. Could you please repeat?", lang), None
 
-    session_memory[call_sid].append({"role": "user", "content": speech_result})
+    turn = begin_turn(call_sid, speech_result, lang)
+    caller = caller_info(form)
 
-    trimmed = trim_session_memory([
-        msg for msg in session_memory[call_sid] if msg.get("role") in ["user", "assistant", "system"]
-    ])
+    if DEFERRED_RESPONSES or scheduler.saturated():
+        # GPT cevabı arka planda hazırlanırken (ya da kapasite beklenirken) arayana hemen kısa bir dolgu mesajı dön
+        start_deferred(call_sid, turn, lang, caller)
+        return redirect_body(lang, turn, attempt=1, lead=True), None
 
-    try:
-        trimmed = trim_session_memory(session_memory[call_sid], max_tokens=1500)
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=trimmed
-        )
-        response_text = completion.choices[0].message.content
-
-        if len(response_text) > 3000:
-            logging.warning("⚠️ GPT response too long, trimming for Twilio.")
-            response_text = response_text[:3000] + "..."
-
-        logging.info(f"TwiML size: {estimate_twiml_size(response_text)} bytes")
-        logging.info(f"GPT response: {response_text}")
-        
-        if "email" in detect_call_type(session_memory[call_sid]):
-            email_plain = extract_last_email(session_memory[call_sid])
-            formatted_email = format_email_for_confirmation(email_plain, lang)
-
-            # SSML formatına sarmala
-            formatted_email_ssml = f"<speak>{formatted_email}</speak>"
-            
-            response_text = {
-                "en": f"To confirm, is your email address: {formatted_email_ssml}? If this is correct, please say yes.",
-                "fr": f"Pour confirmer, votre adresse e-mail est-elle : {formatted_email_ssml} ? Si c’est correct, dites oui."
-            }[lang]
+    if STREAMING_RESPONSES:
+        return streamed_turn(call_sid, turn, lang, caller), None
 
-        if "Please enter your order number" in response_text:
-            order_number = extract_last_order_number(session_memory[call_sid])
-            if order_number and order_number != "Not Provided":
-                logging.warning("⚠️ GPT repeated order number request even though it was already provided.")
-                response_text = {
-                    "en": "Thank you. We've received your order number.",
-                    "fr": "Merci. Nous avons bien reçu votre numéro de commande."
-                }[lang]
-        
-        session_memory[call_sid].append({"role": "assistant", "content": response_text})
-
-        if "Thank you for contacting Neatliner Customer Service" in response_text or \
-           "Merci d’avoir contacté le service client Neatliner" in response_text:
-            transcript = ""
-            for msg in session_memory[call_sid]:
-                if msg["role"] in ["user", "assistant"]:
-                    transcript += f"{msg['role'].upper()}: {msg['content'].strip()}\n"
-
-            metadata = {
-                "call_type": detect_call_type(session_memory[call_sid]),
-                "from_number": request.form.get("From"),
-                "location": f"{request.form.get('CallerCity', '')}, {request.form.get('CallerState', '')}".strip(", "),
-                "email": extract_last_email(session_memory[call_sid]),
-                "order_number": extract_last_order_number(session_memory[call_sid]),
-                "platform": extract_platform(session_memory[call_sid])
-            }
-
-            send_email(transcript, call_sid, metadata)
-
-
-    except Exception as e:
-        logging.error(f"OpenAI error: {e}")
-        response_text = "I'm sorry, there was a problem connecting to the assistant."
+    return None, (call_sid, lang, caller)
 
-    return twiml_response(response_text, lang)
+@app.route("/webhook", methods=["POST"])
+def webhook():
+    body, turn = webhook_request(request.form, request.args)
+    if body is None:
+        call_sid, lang, caller = turn
+        body = render_turn(complete_turn(call_sid, lang, caller), lang)
+    return xml_response(body)
+
+def streamed_turn(call_sid, turn, lang, caller):
+    stream = TurnStream(STREAM_FIRST_CHARS, hold=twiml.wants_dtmf)
+    future = turn_executor.submit(complete_turn, call_sid, lang, caller, stream)
+    # DTMF isteyen cümleler bekletilir: <Gather> söylendikleri yanıtta hemen ardından gelmeli
+    first = stream.wait_first(LLM_TURN_BUDGET)
+    if first is None and stream.done:
+        metrics.STREAMED_TURNS.inc(label_value="whole")
+        return render_turn(future.result(), lang)
+
+    add_pending_turn(call_sid, turn, future)
+    metrics.STREAMED_TURNS.inc(label_value="split")
+    if first is None:
+        return continuation_body(lang, turn, 0, 1, lead=twiml.speak(DEFERRED_FILLER[twiml.normalize_lang(lang)], lang))
+    metrics.FIRST_SENTENCE_SECONDS.observe(time.monotonic() - stream.started)
+    logging.info(f"🌊 First sentences streamed after {(time.monotonic() - stream.started) * 1000:.0f} ms: {first}")
+    return continuation_body(lang, turn, len(first), 1, lead=twiml.speak(first.strip(), lang))
+
+def continuation_body(lang, turn, spoken, attempt, lead):
+    lang = twiml.normalize_lang(lang)
+    target = twiml.url("/webhook-continue", lang=lang, turn=turn, spoken=spoken, attempt=attempt)
+    return twiml.redirect_response(lead, target)
+
+def speculate(call_sid, lang, partial_text):
+    history = sessions.get(call_sid)
+    if history:
+        context = get_call_context(call_sid, history)
+    else:
+        # İlk tur: oturum henüz yok, system prompt ile geçici bağlam kur
+        system_prompt = SYSTEM_PROMPT_FR if lang == "fr" else SYSTEM_PROMPT_EN
+        history = [{"role": "system", "content": system_prompt}]
+        context = CallContext().sync(history)
+
+    user_msg = {"role": "user", "content": partial_text}
+    analyzer = context.analyzer.fork()
+    analyzer.observe(partial_text)
+    if call_flow.local_reply(history + [user_msg], analyzer, lang) is not None:
+        # Bu tur zaten yerel olarak cevaplanacak; GPT'ye gerek yok
+        return None
+    return request_completion(context.prompt_messages(user_msg), context, admission.SPECULATIVE)
+
+def partial_speech_request(form, args):
+    # Spekülatif tamamlamalar thread havuzunda çalışır; bu çağrı beklemez
+    if speculator is None:
+        return
+    call_sid = form.get("CallSid")
+    lang = args.get("lang", "en")
+    partial_text = form.get("UnstableSpeechResult") or form.get("StableSpeechResult", "")
+    if call_sid and partial_text:
+        speculator.observe_partial(call_sid, partial_text, lambda text: speculate(call_sid, lang, text))
+
+@app.route("/partial-speech", methods=["POST"])
+def partial_speech():
+    partial_speech_request(request.form, request.args)
+    return Response(status=204)
+
+def poll_request(values, args):
+    # /webhook-result ve /webhook-continue: (call_sid, lang, turn, attempt)
+    return values.get("CallSid"), args.get("lang", "en"), int_arg(args, "turn"), int_arg(args, "attempt", 1)
+
+@app.route("/webhook-result", methods=["GET", "POST"])
+def webhook_result():
+    return xml_response(poll_deferred_turn(*poll_request(request.values, request.args)))
+
+def poll_deferred_turn(call_sid, lang, turn, attempt):
+    answer, local = collect_deferred_turn(call_sid, turn, attempt)
+    if answer is not None:
+        return render_turn(answer, lang)
+    return settle_deferred_turn(call_sid, lang, turn, attempt, local)
+
+def collect_deferred_turn(call_sid, turn, attempt):
+    # Yalnızca bu worker'daki future'a dokunur; asyncio görevleri thread-safe olmadığından
+    # async_app bunu event loop'ta çağırır. (cevap, tur bu worker'da mı) döner
+    entry = pending_turns.get((call_sid, turn))
+    if entry is None:
+        return None, False
+    future, _ = entry
+    if future.done():
+        pending_turns.pop((call_sid, turn), None)
+        return future.result(), True
+    if attempt >= DEFERRED_MAX_POLLS:
+        pending_turns.pop((call_sid, turn), None)
+        future.cancel()
+    return None, True
+
+def settle_deferred_turn(call_sid, lang, turn, attempt, local):
+    # Oturum deposuna gider (SQLite kilidi, Redis); async_app bunu thread'de çalıştırır
+    if not local:
+        # Tur başka bir worker'da başlatılmış olabilir; cevap paylaşılan oturumda mı?
+        history = sessions.get(call_sid) or []
+        if turn is not None and len(history) > turn + 1 and history[turn + 1]["role"] == "assistant":
+            return render_turn(history[turn + 1]["content"], lang)
+
+    if attempt >= DEFERRED_MAX_POLLS:
+        logging.warning(f"⚠️ Deferred turn {turn} for {call_sid} still running after {attempt} polls")
+        return render_turn(abandon_deferred_turn(call_sid, turn), lang)
+
+    return redirect_body(lang, turn, attempt + 1, lead=False)
+
+def abandon_deferred_turn(call_sid, turn):
+    # Özür cevabın yerine oturuma yazılır; tur hangi worker'da sürüyorsa geç gelen cevabı atar
+    apology = "I'm sorry, there was a problem connecting to the assistant."
+    if turn is None or sessions.append_at(call_sid, turn + 1, {"role": "assistant", "content": apology}):
+        return apology
+    # Cevap tam bu arada yazıldı; arayan onu duysun
+    history = sessions.get(call_sid) or []
+    return history[turn + 1]["content"] if len(history) > turn + 1 else apology
+
+@app.route("/webhook-continue", methods=["GET", "POST"])
+def webhook_continue():
+    return xml_response(continue_request(request.values, request.args))
+
+def continue_request(values, args):
+    call_sid, lang, turn, attempt = poll_request(values, args)
+    return continue_streamed_turn(call_sid, lang, turn, int_arg(args, "spoken", 0), attempt)
+
+def continue_streamed_turn(call_sid, lang, turn, spoken, attempt):
+    # Söylenen ilk cümlelerden sonrası; cevabın tamamı bitene kadar beklenir (tur bütçesiyle sınırlı)
+    entry = pending_turns.pop((call_sid, turn), None)
+    if entry is not None:
+        try:
+            return render_turn(entry[0].result(), lang, spoken)
+        except Exception as e:
+            logging.error(f"❌ Streamed turn {turn} for {call_sid} failed: {e}")
+            return render_turn("I'm sorry, there was a problem connecting to the assistant.", lang)
+
+    # Tur başka bir worker'da sürüyor olabilir; cevap paylaşılan oturuma yazılınca okunur
+    history = sessions.get(call_sid) or []
+    if turn is not None and len(history) > turn + 1 and history[turn + 1]["role"] == "assistant":
+        return render_turn(history[turn + 1]["content"], lang, spoken)
+    if attempt >= DEFERRED_MAX_POLLS:
+        logging.warning(f"⚠️ Streamed turn {turn} for {call_sid} not found after {attempt} polls")
+        return render_turn("I'm sorry, there was a problem connecting to the assistant.", lang)
+    return continuation_body(lang, turn, spoken, attempt + 1, lead=twiml.pause(DEFERRED_POLL_PAUSE))
+
+@app.before_request
+def start_request_trace():
+    metrics.begin_trace(request.values.get("CallSid"), request.path)
+
+@app.after_request
+def finish_request_trace(response):
+    elapsed = metrics.end_trace()
+    if elapsed is not None:
+        # Etiket kardinalitesi sınırlı kalsın diye path yerine route kuralı kullanılır
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.REQUEST_SECONDS.observe(elapsed, route)
+    return response
+
+metrics.Gauge("voicebot_mail_queue_pending", "Call summaries waiting to be sent.",
+              lambda: gmail_mailer.dispatcher.pending())
+metrics.Gauge("voicebot_active_calls", "Calls with in-process state.", lambda: len(call_contexts))
+metrics.Gauge("voicebot_llm_queued", "Completions waiting for OpenAI capacity.", scheduler.queued)
+metrics.Gauge("voicebot_llm_in_flight", "Completions admitted and running.", lambda: scheduler.in_flight)
+metrics.Gauge("voicebot_llm_rate_limited_total", "429 responses from OpenAI.",
+              lambda: scheduler.stats["rate_limited"], kind="counter")
+metrics.Gauge("voicebot_llm_admission_timeouts_total", "Completions that found no capacity before the deadline.",
+              lambda: scheduler.stats["timeouts"], kind="counter")
+if speculator is not None:
+    metrics.Gauge("voicebot_speculative_hits_total", "Speculative completions reused.",
+                  lambda: speculator.stats["hits"], kind="counter")
+    metrics.Gauge("voicebot_speculative_misses_total", "Speculative completions discarded at the final result.",
+                  lambda: speculator.stats["misses"], kind="counter")
+    metrics.Gauge("voicebot_speculative_skipped_total", "Stable partials not speculated on because of the in-flight cap.",
+                  lambda: speculator.stats["skipped"], kind="counter")
+    metrics.Gauge("voicebot_speculative_saved_seconds_total", "Completion time overlapped with caller speech.",
+                  lambda: round(speculator.stats["saved_seconds"], 3), kind="counter")
+
+if journal is not None:
+    metrics.Gauge("voicebot_journal_records_total", "Records written to the call journal.",
+                  lambda: journal.records, kind="counter")
+    metrics.Gauge("voicebot_journal_fsyncs_total", "Batched journal writes, one fsync each.",
+                  lambda: journal.fsyncs, kind="counter")
+    recover_calls()
+
+def call_status_request(form):
+    # Twilio'nun çağrı durumu bildirimi; kapanış cümlesinden önce kapanan çağrıların özeti burada gönderilir
+    call_sid = form.get("CallSid")
+    status = form.get("CallStatus", "")
+    if call_sid and status in CALL_ENDED_STATUSES:
+        end_call(call_sid, status, caller_info(form))
+
+@app.route("/call-status", methods=["POST"])
+def call_status():
+    call_status_request(request.form)
+    return Response(status=204)
+
+def audio_request(name, if_none_match, byte_range):
+    # Ses dosyası yoksa None; varsa (status, headers, body, content_type)
+    asset = twiml.AUDIO.get(name) if twiml.AUDIO is not None else None
+    if asset is None:
+        return None
+    status, headers, body = audio_cache.respond(asset, if_none_match, byte_range)
+    return status, headers, body, asset.content_type
+
+@app.route("/audio/<name>", methods=["GET"])
+def audio_asset(name):
+    audio = audio_request(name, request.headers.get("If-None-Match"), request.headers.get("Range"))
+    if audio is None:
+        return Response(status=404)
+    status, headers, body, content_type = audio
+    return Response(body, status=status, headers=headers, content_type=content_type)
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    return Response(*ready_request(), mimetype="application/json")
+
+def ready_request():
+    # Warm-up bitene kadar 503; yük dengeleyici ve deploy kontrolü için
+    status = startup.status()
+    return json.dumps(status), 200 if status["ready"] else 503
+
+startup = warmup.Warmup()
+if warmup.WARMUP:
+    startup.start([
+        ("tokenizer", warm_tokenizer, True),
+        ("twiml", twiml.prerender_turns, True),
+        ("openai_connections", lambda: warmup.open_connections(client), False),
+    ])
+metrics.Gauge("voicebot_ready", "1 once the startup warm-up has finished.", lambda: int(startup.ready()))
 
 if __name__ == "__main__":
+    if twiml.MEDIA_STREAMS:
+        # /voice-stream'in WebSocket'ini yalnızca ASGI giriş noktası sunar
+        sys.exit("MEDIA_STREAMS=1 needs the ASGI entry point: uvicorn async_app:app")
+    # SIGTERM'de atexit çalışsın ki kuyruktaki e-postalar gönderilsin
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
     app.run(host="0.0.0.0", port=10000)
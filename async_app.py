@@ -0,0 +1,391 @@
+"""ASGI entry point serving the same routes as app.py.
+
+    uvicorn async_app:app --host 0.0.0.0 --port 10000
+
+Requests are handled by the same *_request functions as the Flask routes.
+Turns await one shared AsyncOpenAI client instead of holding a worker
+thread during the completion; streamed turns use app.py's thread pool.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from urllib.parse import parse_qsl
+
+import httpx
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+import admission
+import app as voicebot
+import media_stream
+import metrics
+from metrics import stage
+import stt
+import tts
+import twiml
+import warmup
+
+# Tek bir bağlantı havuzu; keep-alive bağlantıları çağrılar arasında yeniden kullanılır
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "200"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+
+client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    timeout=OPENAI_TIMEOUT,
+    max_retries=voicebot.OPENAI_MAX_RETRIES,
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        timeout=OPENAI_TIMEOUT,
+    ),
+)
+
+# Media Streams: Twilio'nun WebSocket'i buraya bağlanır; MEDIA_STREAM_URL yoksa isteğin Host'undan türetilir
+MEDIA_STREAM_PATH = "/media-stream"
+MEDIA_STREAM_URL = os.getenv("MEDIA_STREAM_URL", "")
+speech_to_text = stt.create_stt_backend() if twiml.MEDIA_STREAMS else None
+text_to_speech = tts.create_tts_backend() if twiml.MEDIA_STREAMS else None
+if text_to_speech is not None and text_to_speech.name == "local":
+    raise RuntimeError("MEDIA_STREAMS=1 needs a real TTS_BACKEND such as polly; local only renders placeholder tones")
+
+ROUTES = {}
+
+
+def route(path, methods=("POST",)):
+    def register(handler):
+        ROUTES[path] = (handler, methods)
+        return handler
+    return register
+
+
+class Request:
+    __slots__ = ("method", "path", "args", "form", "values", "headers")
+
+    def __init__(self, method, path, args, form, headers):
+        self.method = method
+        self.path = path
+        self.args = args
+        self.form = form
+        # Flask'taki request.values gibi: önce query string, sonra form
+        self.values = {**form, **args}
+        self.headers = headers
+
+
+class Response:
+    __slots__ = ("body", "status", "content_type", "headers")
+
+    def __init__(self, body=b"", status=200, content_type="text/xml; charset=utf-8", headers=()):
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+        self.status = status
+        self.content_type = content_type
+        self.headers = list(headers)
+
+
+def static_response(request, static):
+    etag = f'"{static.etag}"'
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status=304, headers=[("etag", etag)])
+    return Response(static.body, headers=[("etag", etag)])
+
+
+async def request_completion(messages, context=None, priority=admission.NEW_CALL):
+    tokens = voicebot.estimate_tokens(messages, context)
+
+    async def create(model, timeout):
+        # Kota, öncelik ve eşzamanlılık sınırı app.py'deki zamanlayıcıyla paylaşılır
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                async with voicebot.scheduler.slot_async(tokens, priority, deadline):
+                    return await client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        max_tokens=voicebot.MAX_COMPLETION_TOKENS,
+                        timeout=max(deadline - time.monotonic(), 0.1)
+                    )
+            except openai.APIError as e:
+                await asyncio.sleep(voicebot.retry_pause(e, deadline))
+
+    with stage("llm"):
+        completion = await voicebot.completion_deadline.run_async(create)
+    if completion is None:
+        return None
+    return voicebot.completion_text(completion, context)
+
+
+async def generate_reply(call_sid, context, lang, history):
+    user_text = history[-1]["content"]
+    context.llm_calls += 1
+    response_text = None
+
+    speculator = voicebot.speculator
+    speculation = speculator.claim(call_sid, user_text) if speculator is not None else None
+    if speculation is not None:
+        try:
+            response_text = await asyncio.wrap_future(speculation.future)
+            if response_text is not None:
+                metrics.TURNS.inc(label_value="speculative")
+                logging.info("🔮 Reusing speculative completion started from partial speech")
+        except Exception as e:
+            logging.warning(f"Speculative completion failed, recomputing: {e}")
+
+    if response_text is None:
+        with stage("trim"):
+            messages = context.prompt_messages()
+        response_text = await request_completion(messages, context, voicebot.turn_priority(history))
+        if response_text is None:
+            return voicebot.budget_reprompt(history, context.analyzer, lang)
+        metrics.TURNS.inc(label_value="llm")
+
+    with stage("postprocess"):
+        return voicebot.postprocess_reply(response_text, context.analyzer, lang)
+
+
+async def complete_turn(call_sid, lang, caller, turn=None):
+    started = time.perf_counter()
+    own_trace = metrics.active_trace() is None
+    if own_trace:
+        metrics.begin_trace(call_sid, "deferred-turn")
+    context = None
+    closing = False
+    try:
+        # Oturum deposu (SQLite kilidi, Redis), günlük ve e-posta kuyruğu event loop'u bloklamasın
+        context, history, response_text = await asyncio.to_thread(voicebot.plan_turn, call_sid, lang)
+        if response_text is None:
+            response_text = await generate_reply(call_sid, context, lang, history)
+        closing = await asyncio.to_thread(voicebot.record_reply, call_sid, context, response_text, caller, turn)
+
+    except Exception as e:
+        logging.error(f"OpenAI error: {e}")
+        response_text = "I'm sorry, there was a problem connecting to the assistant."
+
+    voicebot.end_turn(context, started, closing, own_trace)
+    return response_text
+
+
+def start_deferred_turn(call_sid, turn, lang, caller):
+    # Boş bir context ile başlatılır ki görev isteğin trace'ini devralmasın
+    task = asyncio.get_running_loop().create_task(
+        complete_turn(call_sid, lang, caller, turn), context=contextvars.Context()
+    )
+    voicebot.add_pending_turn(call_sid, turn, task)
+
+
+def deferred_starter(loop):
+    # webhook_request thread'de çalışır; görev event loop'ta kurulur. call_soon_threadsafe sırayı korur,
+    # görev /webhook yanıtı gönderilmeden önce pending_turns'e girer
+    return lambda *turn: loop.call_soon_threadsafe(start_deferred_turn, *turn)
+
+
+@route("/", methods=("GET", "POST"))
+async def welcome(request):
+    return static_response(request, await asyncio.to_thread(voicebot.welcome_request, request.form))
+
+
+@route("/handle-selection")
+async def handle_selection(request):
+    return static_response(request, voicebot.selection_request(request.form))
+
+
+@route("/voice", methods=("GET", "POST"))
+async def voice_flow(request):
+    return static_response(request, voicebot.localized_request(request.args, twiml.VOICE_FLOW))
+
+
+@route("/voice-stream", methods=("GET", "POST"))
+async def voice_stream(request):
+    lang = twiml.normalize_lang(request.args.get("lang", "en"))
+    stream_url = MEDIA_STREAM_URL or f"wss://{request.headers.get('host', 'localhost')}{MEDIA_STREAM_PATH}"
+    return Response(twiml.voice_stream(lang, stream_url, {"lang": lang, **voicebot.caller_info(request.form)}))
+
+
+async def stream_speech_turn(call_sid, text, lang, caller):
+    # /webhook ile aynı tur mantığı; cevap TwiML yerine ses olarak aynı soket üzerinden gider
+    metrics.begin_trace(call_sid, MEDIA_STREAM_PATH)
+    try:
+        await asyncio.to_thread(voicebot.begin_turn, call_sid, text, lang)
+        return await complete_turn(call_sid, lang, caller)
+    finally:
+        metrics.end_trace()
+
+
+async def stream_digits_turn(call_sid, digits, lang):
+    return await asyncio.to_thread(voicebot.order_number_reply, call_sid, digits, lang)
+
+
+async def media_stream_socket(receive, send):
+    if (await receive())["type"] != "websocket.connect":
+        return
+    if speech_to_text is None:
+        await send({"type": "websocket.close", "code": 1008})
+        return
+    await send({"type": "websocket.accept"})
+
+    async def send_json(payload):
+        await send({"type": "websocket.send", "text": json.dumps(payload)})
+
+    stream = media_stream.MediaStream(send_json, stream_speech_turn, stream_digits_turn,
+                                      speech_to_text, text_to_speech)
+    try:
+        while True:
+            message = await receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("text") and not await stream.handle(message["text"]):
+                await send({"type": "websocket.close", "code": 1000})
+                return
+    finally:
+        await stream.close()
+        logging.info(f"🎙️ Media stream closed for {stream.call_sid}: {stream.stats['utterances']} utterances, "
+                     f"{stream.stats['frames']} frames")
+
+
+@route("/order-number")
+async def handle_order_number(request):
+    return Response(await asyncio.to_thread(voicebot.order_number_request, request.form, request.args))
+
+
+@route("/repeat-order-number", methods=("GET", "POST"))
+async def repeat_order_number(request):
+    return static_response(request, voicebot.localized_request(request.args, twiml.REPEAT_ORDER_NUMBER))
+
+
+@route("/webhook")
+async def webhook(request):
+    body, turn = await asyncio.to_thread(voicebot.webhook_request, request.form, request.args,
+                                         deferred_starter(asyncio.get_running_loop()))
+    if body is None:
+        call_sid, lang, caller = turn
+        body = voicebot.render_turn(await complete_turn(call_sid, lang, caller), lang)
+    return Response(body)
+
+
+@route("/partial-speech")
+async def partial_speech(request):
+    voicebot.partial_speech_request(request.form, request.args)
+    return Response(status=204, content_type="text/plain")
+
+
+@route("/webhook-result", methods=("GET", "POST"))
+async def webhook_result(request):
+    call_sid, lang, turn, attempt = voicebot.poll_request(request.values, request.args)
+    # Görev durumu ve iptali event loop'ta; yalnızca oturum deposu thread'e gider
+    answer, local = voicebot.collect_deferred_turn(call_sid, turn, attempt)
+    if answer is not None:
+        return Response(voicebot.render_turn(answer, lang))
+    return Response(await asyncio.to_thread(voicebot.settle_deferred_turn, call_sid, lang, turn, attempt, local))
+
+
+@route("/webhook-continue", methods=("GET", "POST"))
+async def webhook_continue(request):
+    # Akışlı tur app.py'nin thread havuzundaki senkron istemciyle tamamlanır; burada yalnızca beklenir
+    return Response(await asyncio.to_thread(voicebot.continue_request, request.values, request.args))
+
+
+@route("/call-status")
+async def call_status(request):
+    await asyncio.to_thread(voicebot.call_status_request, request.form)
+    return Response(status=204, content_type="text/plain")
+
+
+AUDIO_PREFIX = "/audio/"
+
+
+@route(AUDIO_PREFIX, methods=("GET", "HEAD"))
+async def audio_asset(request):
+    audio = voicebot.audio_request(request.path[len(AUDIO_PREFIX):], request.headers.get("if-none-match"),
+                                   request.headers.get("range"))
+    if audio is None:
+        return Response("Not Found", status=404, content_type="text/plain")
+    status, headers, body, content_type = audio
+    return Response(body, status=status, content_type=content_type, headers=headers)
+
+
+@route("/metrics", methods=("GET",))
+async def metrics_endpoint(request):
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4")
+
+
+@route("/ready", methods=("GET",))
+async def ready(request):
+    body, status = voicebot.ready_request()
+    return Response(body, status=status, content_type="application/json")
+
+
+async def read_request(scope, receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+    form = {}
+    if headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+        form = dict(parse_qsl(b"".join(chunks).decode("utf-8"), keep_blank_values=True))
+    args = dict(parse_qsl(scope.get("query_string", b"").decode("utf-8"), keep_blank_values=True))
+    return Request(scope["method"], scope["path"], args, form, headers)
+
+
+async def lifespan(receive, send):
+    tasks = []
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if warmup.WARMUP:
+                # Async havuzun bağlantıları da /ready'den önce açılır; sunucu beklemeden başlar
+                voicebot.startup.expect("async_openai_connections", required=False)
+                tasks.append(asyncio.create_task(voicebot.startup.run_async(
+                    "async_openai_connections", lambda: warmup.open_connections_async(client))))
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await client.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] == "websocket":
+        if scope["path"] == MEDIA_STREAM_PATH:
+            await media_stream_socket(receive, send)
+        elif (await receive())["type"] == "websocket.connect":
+            await send({"type": "websocket.close", "code": 1008})
+        return
+    if scope["type"] != "http":
+        return
+
+    request = await read_request(scope, receive)
+    metrics.begin_trace(request.values.get("CallSid"), request.path)
+    entry = ROUTES.get(request.path)
+    label = request.path
+    if entry is None and request.path.startswith(AUDIO_PREFIX):
+        entry, label = ROUTES[AUDIO_PREFIX], "/audio/<name>"
+    if entry is None:
+        response = Response("Not Found", status=404, content_type="text/plain")
+    elif request.method not in entry[1]:
+        response = Response("Method Not Allowed", status=405, content_type="text/plain")
+    else:
+        try:
+            response = await entry[0](request)
+        except Exception:
+            logging.exception(f"Unhandled error on {request.path}")
+            response = Response("Internal Server Error", status=500, content_type="text/plain")
+    elapsed = metrics.end_trace()
+    metrics.REQUEST_SECONDS.observe(elapsed, label if entry is not None else "unmatched")
+
+    headers = [(b"content-type", response.content_type.encode("latin-1")),
+               (b"content-length", str(len(response.body)).encode("latin-1"))]
+    headers += [(name.encode("latin-1"), value.encode("latin-1")) for name, value in response.headers]
+    await send({"type": "http.response.start", "status": response.status, "headers": headers})
+    # HEAD: başlıklar GET ile aynı, gövde yok
+    await send({"type": "http.response.body", "body": response.body if request.method != "HEAD" else b""})
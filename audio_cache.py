@@ -0,0 +1,162 @@
+"""Pre-rendered audio for the fixed prompts, played with <Play> instead of <Say>.
+
+    TTS_BACKEND=polly AUDIO_CACHE_DIR=audio python audio_cache.py
+
+renders every fixed prompt that is not in the cache yet. Files are named
+after a hash of text, voice and language, so changing a prompt simply
+renders a new file.
+"""
+import argparse
+import hashlib
+import logging
+import mmap
+import os
+import re
+
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "")
+AUDIO_BASE_URL = os.getenv("AUDIO_BASE_URL", "/audio")
+
+CONTENT_TYPES = {
+    "wav": "audio/wav",
+    "mp3": "audio/mpeg",
+}
+# İçerik adresli dosyalar hiç değişmez; Twilio ve CDN süresiz önbelleğe alabilir
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def asset_key(text, voice, language):
+    return hashlib.sha256(f"{voice}\n{language}\n{text}".encode("utf-8")).hexdigest()[:32]
+
+
+class AudioAsset:
+    __slots__ = ("name", "size", "etag", "content_type", "_data")
+
+    def __init__(self, path):
+        self.name = os.path.basename(path)
+        self.content_type = CONTENT_TYPES.get(self.name.rsplit(".", 1)[-1], "application/octet-stream")
+        with open(path, "rb") as f:
+            self.size = os.fstat(f.fileno()).st_size
+            # Sayfa önbelleğinden okunur; istek başına open/read çağrısı yok
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self.etag = hashlib.sha1(self._data).hexdigest()
+
+    def read(self, start=0, end=None):
+        return self._data[start:end]
+
+
+class AudioCache:
+    """Content-addressed audio files for fixed prompts, loaded once and memory-mapped."""
+
+    def __init__(self, directory, base_url=AUDIO_BASE_URL):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+        self.assets = {}
+        self._names = {}
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def load(self):
+        for name in sorted(os.listdir(self.directory)):
+            key, _, extension = name.partition(".")
+            if extension not in CONTENT_TYPES:
+                continue
+            self.assets[name] = AudioAsset(os.path.join(self.directory, name))
+            self._names[key] = name
+
+    def url(self, text, voice, language):
+        name = self._names.get(asset_key(text, voice, language))
+        return f"{self.base_url}/{name}" if name is not None else None
+
+    def get(self, name):
+        return self.assets.get(name)
+
+    def build(self, prompts, backend, force=False):
+        # prompts: (text, voice, language); eksik olanlar render edilir
+        rendered = 0
+        for text, voice, language in prompts:
+            key = asset_key(text, voice, language)
+            if key in self._names and not force:
+                continue
+            name = f"{key}.{backend.extension}"
+            path = os.path.join(self.directory, name)
+            audio = backend.synthesize(text, voice, language)
+            # Yarım yazılmış dosya servis edilmesin
+            with open(path + ".tmp", "wb") as f:
+                f.write(audio)
+            os.replace(path + ".tmp", path)
+            previous = self._names.get(key)
+            if previous is not None and previous != name:
+                # Başka backend'le üretilmiş eski dosya
+                self.assets.pop(previous, None)
+                os.remove(os.path.join(self.directory, previous))
+            self.assets[name] = AudioAsset(path)
+            self._names[key] = name
+            rendered += 1
+            logging.info(f"🔊 Rendered {name} ({len(audio)} bytes): {text[:60]}")
+        return rendered
+
+
+def load_audio_cache(directory=None):
+    directory = directory if directory is not None else AUDIO_CACHE_DIR
+    if not directory:
+        return None
+    return AudioCache(directory)
+
+
+def byte_range(header, size):
+    # Tek aralık desteklenir; çoklu aralıkta tüm dosya döner (RFC 9110 buna izin verir)
+    match = _RANGE_RE.match(header.replace(" ", ""))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        raise ValueError(header)
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def respond(asset, if_none_match=None, range_header=None):
+    """Returns (status, headers, body) for a GET of asset, shared by both entry points."""
+    etag = f'"{asset.etag}"'
+    headers = [("etag", etag), ("cache-control", CACHE_CONTROL), ("accept-ranges", "bytes")]
+    if if_none_match and (etag in if_none_match or if_none_match.strip() == "*"):
+        return 304, headers, b""
+    if range_header:
+        try:
+            span = byte_range(range_header, asset.size)
+        except ValueError:
+            return 416, headers + [("content-range", f"bytes */{asset.size}")], b""
+        if span is not None:
+            start, end = span
+            headers.append(("content-range", f"bytes {start}-{end}/{asset.size}"))
+            return 206, headers, asset.read(start, end + 1)
+    return 200, headers, asset.read()
+
+
+def main():
+    import tts
+    import twiml
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", default=AUDIO_CACHE_DIR or "audio")
+    parser.add_argument("--backend", default=os.getenv("TTS_BACKEND", "polly"))
+    parser.add_argument("--force", action="store_true", help="render again even if cached")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    cache = AudioCache(args.dir)
+    prompts = twiml.fixed_prompts()
+    rendered = cache.build(prompts, tts.create_tts_backend(args.backend), force=args.force)
+    print(f"{len(prompts)} fixed prompts, {rendered} rendered, {len(cache.assets)} files in {args.dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Admission control against a rate-limited OpenAI stub.
+
+The stub answers 429 once its --rpm-limit bucket is empty. Two waves of
+--calls callers arrive --wave-gap seconds apart and each speaks --turns
+times, following the "one moment" redirects like Twilio does. The
+"reactive" scheduler only backs off after a 429; the "quota" scheduler
+also models the RPM quota at --quota-ratio of the limit, with the stub's
+10 second burst. Each scheduler runs --rounds times and the turns are
+pooled, since reactive backoff varies a lot from run to run. Reports
+429s, reprompted turns, busy welcomes and latency for first turns vs
+turns of calls already in progress. Exits non-zero if the quota
+scheduler hits a 429, or reprompts more turns or has a slower p95 for
+first turns or for turns in progress than reactive backoff.
+
+    python benchmarks/bench_admission.py --calls 40 --rpm-limit 600
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_openai import StubOpenAI
+
+UTTERANCES = [
+    "Do you sell the large liners in Quebec stores?",
+    "What sizes do the kitchen liners come in?",
+    "Are the bags compatible with a thirteen gallon bin?",
+]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_call(app, name, index, turns, poll_pause, results, lock):
+    test_client = app.app.test_client()
+    call_sid = f"CA-{name}-{index}"
+    welcome = test_client.post("/", data={"CallSid": call_sid}).get_data(as_text=True)
+    if "lines are busy" in welcome:
+        with lock:
+            results["busy"] += 1
+        return
+    for turn in range(turns):
+        start = time.perf_counter()
+        form = {"CallSid": call_sid, "SpeechResult": UTTERANCES[turn % len(UTTERANCES)]}
+        body = test_client.post("/webhook?lang=en", data=form).get_data(as_text=True)
+        while "/webhook-result" in body:
+            time.sleep(poll_pause)
+            target = re.search(r"<Redirect[^>]*>([^<]+)</Redirect>", body).group(1).replace("&amp;", "&")
+            body = test_client.post(target, data={"CallSid": call_sid}).get_data(as_text=True)
+        elapsed = time.perf_counter() - start
+        with lock:
+            results["first" if turn == 0 else "in_progress"].append(elapsed)
+            if "took me a moment" in body:
+                results["reprompts"] += 1
+            if "problem connecting" in body:
+                results["errors"] += 1
+
+
+def run_scenario(app, stub, name, rpm, burst_seconds, args):
+    from admission import CompletionScheduler
+
+    results = {"first": [], "in_progress": [], "reprompts": 0, "errors": 0, "busy": 0, "rate_limited": 0}
+    lock = threading.Lock()
+    for round_ in range(args.rounds):
+        stub.reset_rate_limit()
+        app.scheduler = CompletionScheduler(rpm=rpm, max_concurrency=app.OPENAI_MAX_CONCURRENCY,
+                                            busy_queue=args.busy_queue, burst_seconds=burst_seconds)
+        threads = []
+        for wave in range(2):
+            for i in range(args.calls):
+                t = threading.Thread(target=run_call, args=(app, f"{name}{round_}", wave * args.calls + i,
+                                                            args.turns, args.poll_pause, results, lock))
+                t.start()
+                threads.append(t)
+            time.sleep(args.wave_gap)
+        for t in threads:
+            t.join()
+        results["rate_limited"] += stub.rate_limited
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=40, help="callers per wave")
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--rpm-limit", type=int, default=600)
+    parser.add_argument("--quota-ratio", type=float, default=0.9)
+    parser.add_argument("--wave-gap", type=float, default=1.0)
+    parser.add_argument("--busy-queue", type=int, default=50)
+    parser.add_argument("--poll-pause", type=float, default=0.1)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    stub = StubOpenAI(latency=args.llm_latency, rpm_limit=args.rpm_limit).start()
+    os.environ.update(OPENAI_API_KEY="stub", OPENAI_BASE_URL=stub.base_url, SESSION_STORE="memory",
+                      DEFERRED_RESPONSES="0", SPECULATIVE_COMPLETIONS="0")
+    import app
+    logging.disable(logging.WARNING)
+    # Twilio her yoklamada 1 saniye bekler; burada daha sık yoklandığı için sınırı ölçekle
+    app.DEFERRED_MAX_POLLS = int(app.DEFERRED_MAX_POLLS * app.DEFERRED_POLL_PAUSE / args.poll_pause)
+
+    # Kota hızı sınırın altında tutulur ama stub'ın 10 saniyelik patlamasını aşmaz
+    scenarios = [("reactive", 0, 10.0),
+                 ("quota", int(args.rpm_limit * args.quota_ratio), 10.0 / args.quota_ratio)]
+    print(f"2 waves x {args.calls} calls x {args.turns} turns x {args.rounds} rounds, "
+          f"OpenAI limit {args.rpm_limit} RPM, LLM {args.llm_latency}s\n")
+    print(f"{'scheduler':<10} {'429s':>5} {'reprompt':>9} {'busy':>5} {'first_p50':>10} {'first_p95':>10} "
+          f"{'cont_p50':>9} {'cont_p95':>9}")
+    failures = []
+    reactive = None
+    for name, rpm, burst_seconds in scenarios:
+        r = run_scenario(app, stub, name, rpm, burst_seconds, args)
+        r["first_p95"] = first_p95 = percentile(r["first"], 0.95)
+        r["cont_p95"] = cont_p95 = percentile(r["in_progress"], 0.95)
+        print(f"{name:<10} {r['rate_limited']:>5} {r['reprompts']:>9} {r['busy']:>5} "
+              f"{percentile(r['first'], 0.5):>10.2f} {first_p95:>10.2f} "
+              f"{percentile(r['in_progress'], 0.5):>9.2f} {cont_p95:>9.2f}")
+        if r["errors"]:
+            failures.append(f"{name}: {r['errors']} turns ended in the connection error message")
+        if name == "reactive":
+            reactive = r
+        else:
+            if r["reprompts"] > reactive["reprompts"]:
+                failures.append(f"quota: {r['reprompts']} reprompted turns, reactive backoff "
+                                f"{reactive['reprompts']}")
+            if first_p95 > reactive["first_p95"]:
+                failures.append(f"quota: first turns took {first_p95:.2f}s p95, reactive backoff "
+                                f"{reactive['first_p95']:.2f}s")
+            if cont_p95 > reactive["cont_p95"]:
+                failures.append(f"quota: turns in progress took {cont_p95:.2f}s p95, reactive backoff "
+                                f"{reactive['cont_p95']:.2f}s")
+            if r["rate_limited"]:
+                failures.append(f"quota: {r['rate_limited']} requests were rate limited below the quota")
+
+    stub.stop()
+    print("\n(latency in seconds, including the 'one moment' redirect polls)")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Concurrent-call throughput of the Flask and ASGI entry points.
+
+Starts the stub OpenAI server, then serves the app in a subprocess either
+with Flask behind a fixed pool of --sync-workers threads (what a
+gunicorn deployment gets) or with uvicorn and async_app. --calls callers
+each speak --turns times at once; every turn goes to the LLM.
+
+    python benchmarks/bench_async_serving.py --calls 200 --turns 3 --llm-latency 1.0
+
+Serving in async mode needs uvicorn (listed in requirements.txt).
+"""
+import argparse
+import http.client
+import logging
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_openai import StubOpenAI
+
+UTTERANCES = [
+    "Do you sell the large liners in Quebec stores?",
+    "What sizes do the kitchen liners come in?",
+    "Are the bags compatible with a thirteen gallon bin?",
+]
+
+
+def serve_sync(port, workers):
+    from werkzeug.serving import BaseWSGIServer
+    import app
+
+    class PooledWSGIServer(BaseWSGIServer):
+        # gunicorn --threads gibi: aynı anda en fazla `workers` istek işlenir
+        multithread = True
+        request_queue_size = 2048
+
+        def __init__(self, *args):
+            super().__init__(*args)
+            self.pool = ThreadPoolExecutor(max_workers=workers)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    logging.disable(logging.INFO)
+    PooledWSGIServer("127.0.0.1", port, app.app).serve_forever()
+
+
+def serve_async(port):
+    import uvicorn
+    import async_app
+
+    logging.disable(logging.INFO)
+    uvicorn.run(async_app.app, host="127.0.0.1", port=port, log_level="warning", backlog=2048)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def post(port, path, form):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    try:
+        conn.request("POST", path, body=urlencode(form),
+                     headers={"Content-Type": "application/x-www-form-urlencoded"})
+        response = conn.getresponse()
+        body = response.read()
+        return response.status, body
+    finally:
+        conn.close()
+
+
+def run_load(port, calls, turns, mode):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    barrier = threading.Barrier(calls)
+
+    def caller(i):
+        nonlocal errors
+        barrier.wait()
+        for turn in range(turns):
+            form = {"CallSid": f"CA-{mode}-{i}", "SpeechResult": UTTERANCES[turn % len(UTTERANCES)]}
+            start = time.perf_counter()
+            status, body = post(port, "/webhook?lang=en", form)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if status != 200 or b"problem connecting" in body:
+                    errors += 1
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(calls)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, latencies, errors
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200, help="concurrent callers")
+    parser.add_argument("--turns", type=int, default=3, help="turns per caller")
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--sync-workers", type=int, default=8,
+                        help="request threads for the Flask server")
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--serve", choices=["sync", "async"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve == "sync":
+        serve_sync(args.port, args.sync_workers)
+        return
+    if args.serve == "async":
+        serve_async(args.port)
+        return
+
+    stub = StubOpenAI(latency=args.llm_latency).start()
+    env = dict(os.environ, OPENAI_BASE_URL=stub.base_url, OPENAI_API_KEY="stub",
+               DEFERRED_RESPONSES="0", SPECULATIVE_COMPLETIONS="0", SESSION_STORE="memory")
+
+    print(f"{args.calls} callers x {args.turns} turns, LLM latency {args.llm_latency}s, "
+          f"sync workers {args.sync_workers}\n")
+    print(f"{'mode':<6} {'wall_s':>7} {'turns/s':>8} {'p50_ms':>8} {'p95_ms':>8} {'errors':>7} "
+          f"{'llm_reqs':>9} {'llm_conns':>10} {'llm_peak':>9}")
+    for mode in args.modes.split(","):
+        port = free_port()
+        requests_before, connections_before = stub.requests, stub.connections
+        stub.max_in_flight = 0
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", mode, "--port", str(port),
+             "--sync-workers", str(args.sync_workers)],
+            cwd=ROOT, env=env,
+        )
+        try:
+            wait_for_port(port)
+            wall, latencies, errors = run_load(port, args.calls, args.turns, mode)
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{mode:<6} {wall:>7.1f} {len(latencies) / wall:>8.1f} "
+              f"{statistics.median(latencies) * 1000:>8.0f} {percentile(latencies, 0.95) * 1000:>8.0f} "
+              f"{errors:>7} {stub.requests - requests_before:>9} "
+              f"{stub.connections - connections_before:>10} {stub.max_in_flight:>9}")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Serving cost of the pre-rendered prompt audio.
+
+Renders the fixed prompts with the local TTS stand-in into a temporary
+cache, then fetches every file --rounds times through /audio (memory
+mapped, with ETag and Range) and through a plain open()/read() per
+request, and replays Twilio's usual pattern of a full GET followed by
+conditional and ranged GETs. Also checks that the static TwiML and the
+scripted turns use <Play>, and exits non-zero if a check fails.
+
+    python benchmarks/bench_audio_cache.py --rounds 200
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def timed(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="voicebot-audio-")
+    os.environ.update(OPENAI_API_KEY="stub", SESSION_STORE="memory", AUDIO_CACHE_DIR=directory)
+    import audio_cache
+    import tts
+    import twiml
+
+    logging.disable(logging.INFO)
+    # twiml import edildiğinde önbellek boştu; render edip sabit TwiML'i yeniden kur
+    rendered = twiml.AUDIO.build(twiml.fixed_prompts(), tts.LocalTTS())
+    twiml.WELCOME = twiml._welcome()
+    twiml.VOICE_FLOW = {lang: twiml._voice_flow(lang) for lang in twiml.VOICES}
+    import app
+    client = app.app.test_client()
+
+    names = list(twiml.AUDIO.assets)
+    total_bytes = sum(asset.size for asset in twiml.AUDIO.assets.values())
+    print(f"{rendered} prompts rendered, {total_bytes / 1024:.0f} KiB in {directory}\n")
+
+    def read_files():
+        for name in names:
+            with open(os.path.join(directory, name), "rb") as f:
+                f.read()
+
+    def serve_full():
+        for name in names:
+            client.get(f"/audio/{name}")
+
+    etags = {name: client.get(f"/audio/{name}").headers["ETag"] for name in names}
+
+    def serve_conditional():
+        for name in names:
+            client.get(f"/audio/{name}", headers={"If-None-Match": etags[name]})
+
+    def serve_range():
+        for name in names:
+            client.get(f"/audio/{name}", headers={"Range": "bytes=0-8191"})
+
+    def mmap_full():
+        for name in names:
+            audio_cache.respond(twiml.AUDIO.get(name))
+
+    rows = [
+        ("open()+read() per file", timed(read_files, args.rounds)),
+        ("respond() from mmap", timed(mmap_full, args.rounds)),
+        ("GET /audio full", timed(serve_full, args.rounds)),
+        ("GET /audio If-None-Match", timed(serve_conditional, args.rounds)),
+        ("GET /audio Range 8 KiB", timed(serve_range, args.rounds)),
+    ]
+    print(f"{'path':<28} {'us_per_file':>12}")
+    for label, seconds in rows:
+        print(f"{label:<28} {seconds / len(names) * 1e6:>12.1f}")
+
+    failures = []
+    response = client.get(f"/audio/{names[0]}", headers={"Range": "bytes=100-199"})
+    if response.status_code != 206 or response.data != twiml.AUDIO.get(names[0]).read(100, 200):
+        failures.append(f"range request returned {response.status_code} with {len(response.data)} bytes")
+    if client.get(f"/audio/{names[0]}", headers={"If-None-Match": etags[names[0]]}).status_code != 304:
+        failures.append("conditional request did not return 304")
+    if "<Say" in twiml.WELCOME.body.decode("utf-8"):
+        failures.append("welcome TwiML still uses <Say>")
+    for lang in twiml.VOICES:
+        text = app.call_flow.SCRIPT[lang][app.call_flow.ASK_PLATFORM]
+        if b"<Play>" not in twiml.build_turn_response(text, lang).body:
+            failures.append(f"scripted {lang} turn is not played from the cache")
+        confirm = app.order_number_reply(None, "70212345679876543", lang)
+        if twiml.build_turn_response(confirm, lang).body.count(b"<Play>") != 2:
+            failures.append(f"{lang} order confirmation does not play its fixed parts")
+
+    print()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Scripted turn decisions at the yes/no steps, and their cost.
+
+Replays short caller answers at the email read-back and at "anything
+else?" through call_flow.local_reply and checks which step each one
+leads to: a plain yes closes the call, a plain no (including "that's
+incorrect", "c'est faux", "that isn't it") asks for the email again,
+and answers mixing a negation with "right", "correct" or "exactly" are
+left to the LLM. At "anything else?" only a plain "no, that's all"
+goes on to the email; an answer that raises something new ("I don't
+know", "Nothing works right now") is left to the LLM. Also checks that every scripted goodbye, including the
+off-topic one, is recognised as the closing line. Then times local_reply
+per turn. Exits non-zero if a check fails.
+
+    python benchmarks/bench_call_flow.py --rounds 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import call_flow
+from conversation_analyzer import ConversationAnalyzer
+
+LLM = None
+CONFIRM_EMAIL_ANSWERS = [
+    ("en", "yes", call_flow.CLOSING),
+    ("en", "Yes, that's right", call_flow.CLOSING),
+    ("en", "exactly", call_flow.CLOSING),
+    ("fr", "oui c'est correct", call_flow.CLOSING),
+    ("fr", "exactement", call_flow.CLOSING),
+    ("en", "no", call_flow.ASK_EMAIL),
+    ("en", "that's wrong", call_flow.ASK_EMAIL),
+    ("en", "that's incorrect", call_flow.ASK_EMAIL),
+    ("en", "that isn't it", call_flow.ASK_EMAIL),
+    ("en", "not really", call_flow.ASK_EMAIL),
+    ("fr", "non", call_flow.ASK_EMAIL),
+    ("fr", "c'est faux", call_flow.ASK_EMAIL),
+    ("fr", "pas vraiment", call_flow.ASK_EMAIL),
+    ("en", "that's not right", LLM),
+    ("en", "not correct", LLM),
+    ("en", "not exactly", LLM),
+    ("en", "that isn’t right", LLM),
+    ("fr", "ce n'est pas correct", LLM),
+    ("fr", "c'est pas exact", LLM),
+]
+ANYTHING_ELSE_ANSWERS = [
+    ("en", "no thanks", call_flow.ASK_EMAIL),
+    ("en", "nope, that's all", call_flow.ASK_EMAIL),
+    ("en", "not today", call_flow.ASK_EMAIL),
+    ("fr", "non merci", call_flow.ASK_EMAIL),
+    ("fr", "c'est tout", call_flow.ASK_EMAIL),
+    ("fr", "non, c’est tout merci", call_flow.ASK_EMAIL),
+    ("en", "yes I have another question about the liners", LLM),
+    ("en", "Yes, the bag doesn't fit", LLM),
+    ("en", "Actually it is not closing properly", LLM),
+    ("en", "I don't know", LLM),
+    ("en", "Nothing works right now", LLM),
+    ("fr", "ça ne ferme pas bien", LLM),
+]
+
+# Özet e-postası bu cümlelerden biri söylenince gider
+CLOSING_LINES = [
+    call_flow.SCRIPT["en"][call_flow.CLOSING],
+    call_flow.SCRIPT["fr"][call_flow.CLOSING],
+    "This service is only available for issues related to the Neatliner brand. Unfortunately, I cannot assist "
+    "with other topics. Thank you for calling Neatliner Customer Service.",
+    "Ce service est réservé aux demandes concernant la marque Neatliner. Malheureusement, je ne peux pas vous "
+    "aider pour d'autres sujets. Merci d'avoir contacté le service client Neatliner.",
+]
+
+
+def transcript_at(step_text, answer):
+    return [
+        {"role": "system", "content": "prompt"},
+        {"role": "user", "content": "I have a problem with my trash bags"},
+        {"role": "assistant", "content": step_text},
+        {"role": "user", "content": answer},
+    ]
+
+
+def cases():
+    for lang, answer, expected in CONFIRM_EMAIL_ANSWERS:
+        yield "confirm_email", transcript_at(call_flow.email_confirmation("john@gmail.com", lang), answer), lang, expected
+    for lang, answer, expected in ANYTHING_ELSE_ANSWERS:
+        yield "anything_else", transcript_at(call_flow.ANYTHING_ELSE_QUESTION[lang], answer), lang, expected
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    failures = []
+    prepared = []
+    for step, transcript, lang, expected in cases():
+        analyzer = ConversationAnalyzer().sync(transcript)
+        reply = call_flow.local_reply(transcript, analyzer, lang)
+        state = reply[0] if reply else LLM
+        answer = transcript[-1]["content"]
+        print(f"{step:<14} {answer!r:<48} -> {state or 'llm'}")
+        if state != expected:
+            failures.append(f"{step}: {answer!r} led to {state or 'the LLM'} instead of {expected or 'the LLM'}")
+        prepared.append((transcript, analyzer, lang))
+    for line in CLOSING_LINES:
+        if call_flow.state_of(line) != call_flow.CLOSING:
+            failures.append(f"closing line not recognised: {line!r}")
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for transcript, analyzer, lang in prepared:
+            call_flow.local_reply(transcript, analyzer, lang)
+    elapsed = time.perf_counter() - start
+    print(f"\nlocal_reply: {elapsed / (args.rounds * len(prepared)) * 1e6:.1f} µs per turn")
+
+    print()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
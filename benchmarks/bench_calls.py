@@ -0,0 +1,263 @@
+"""Simulated-call load benchmark for the whole voice flow.
+
+Runs --calls scripted calls, --concurrency at a time, through the Flask
+routes with Twilio-shaped form posts. Each call goes: welcome, language
+selection, a complaint that the call flow handles, the DTMF order number
+(with one repeat prompt), two turns answered by the LLM, the email and
+its confirmation, and the closing line, which queues the summary email.
+OpenAI is the local stub server and SMTP is the local sink, each with
+configurable latency.
+
+Per-route p50/p95/p99 latency, requests/sec, per-call token usage and
+RSS growth are written to --out as JSON. Pass --baseline with an earlier
+result to print the per-route change.
+
+    python benchmarks/bench_calls.py --calls 200 --concurrency 20 --llm-latency 0.5
+    python benchmarks/bench_calls.py --baseline benchmarks/results/calls-<commit>.json
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from smtp_sink import SMTPSink
+from stub_openai import StubOpenAI
+
+# Stub'ın cevabı akışı "başka bir şey var mı?" adımına taşır
+LLM_REPLY = "I’ve noted your request. Is there anything else I can help you with?"
+ORDER_DIGITS = "70212345679876543"
+
+CALLER = {"From": "+15145550100", "CallerCity": "Montreal", "CallerState": "QC"}
+
+
+def call_script(lang):
+    """(method, path, form) steps of one call after the language selection."""
+    if lang == "fr":
+        speech = ["J'ai un problème avec mes sacs poubelle", "Sur Amazon", "Ils se déchirent quand je les tire",
+                  "Est-ce que je peux avoir un remboursement", "Non", "j o h n arobase gmail point com", "Oui"]
+    else:
+        speech = ["I have a problem with my trash bags", "On Amazon", "They tear when I pull them",
+                  "Can I get a refund", "No thanks", "j o h n at gmail dot com", "Yes"]
+    q = f"?lang={lang}"
+    return [
+        ("POST", f"/voice{q}", {}),
+        ("POST", f"/webhook{q}", {"SpeechResult": speech[0]}),
+        ("POST", f"/webhook{q}", {"SpeechResult": speech[1]}),
+        ("POST", f"/repeat-order-number{q}", {}),
+        ("POST", f"/order-number{q}", {"Digits": ORDER_DIGITS}),
+        ("POST", f"/webhook{q}", {"SpeechResult": speech[2]}),
+        ("POST", f"/webhook{q}", {"SpeechResult": speech[3]}),
+        ("POST", f"/webhook{q}", {"SpeechResult": speech[4]}),
+        ("POST", f"/webhook{q}", {"SpeechResult": speech[5]}),
+        ("POST", f"/webhook{q}", {"SpeechResult": speech[6]}),
+    ]
+
+
+def rss_mb():
+    # Güncel RSS; /proc yoksa tepe değer
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def add(self, route, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+def run_call(app_module, recorder, index, poll_pause):
+    test_client = app_module.app.test_client()
+    call_sid = f"CA-bench-{index}"
+    lang = "fr" if index % 4 == 3 else "en"
+
+    def request(method, path, form):
+        form = dict(form, CallSid=call_sid, **CALLER)
+        route = path.split("?")[0]
+        start = time.perf_counter()
+        if method == "GET":
+            response = test_client.get(path, query_string=form)
+        else:
+            response = test_client.post(path, data=form)
+        body = response.get_data(as_text=True)
+        ok = response.status_code == 200 and "problem connecting" not in body
+        recorder.add(route, time.perf_counter() - start, ok)
+        return body
+
+    request("GET", "/", {})
+    request("POST", "/handle-selection", {"Digits": "9" if lang == "fr" else "1"})
+    for method, path, form in call_script(lang):
+        body = request(method, path, form)
+        # Deferred modda Twilio'nun <Redirect> takibini taklit et
+        while "/webhook-result" in body:
+            time.sleep(poll_pause)
+            target = re.search(r"<Redirect[^>]*>([^<]+)</Redirect>", body).group(1).replace("&amp;", "&")
+            body = request("POST", target, {})
+
+    context = app_module.call_contexts.get(call_sid)
+    if context is None:
+        return None
+    return context.llm_calls, context.local_responses, context.prompt_tokens, context.completion_tokens
+
+
+def summarize(recorder, per_call, wall, config, rss_start, rss_end, sink):
+    routes = {}
+    for route, values in sorted(recorder.latencies.items()):
+        routes[route] = {
+            "count": len(values),
+            "errors": recorder.errors.get(route, 0),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        }
+    total_requests = sum(route["count"] for route in routes.values())
+    completed = [c for c in per_call if c is not None]
+
+    def mean(i):
+        return round(statistics.mean(c[i] for c in completed), 2) if completed else 0
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": config,
+        "wall_seconds": round(wall, 3),
+        "requests": total_requests,
+        "requests_per_second": round(total_requests / wall, 2),
+        "calls_per_second": round(len(per_call) / wall, 2),
+        "routes": routes,
+        "per_call": {
+            "llm_calls": mean(0),
+            "local_responses": mean(1),
+            "prompt_tokens": mean(2),
+            "completion_tokens": mean(3),
+        },
+        "emails_delivered": len(sink.messages),
+        "memory": {
+            "rss_start_mb": round(rss_start, 1),
+            "rss_end_mb": round(rss_end, 1),
+            "rss_growth_mb": round(rss_end - rss_start, 1),
+        },
+    }
+
+
+def print_report(result, baseline=None):
+    print(f"commit {result['commit']}: {result['requests']} requests in {result['wall_seconds']}s "
+          f"({result['requests_per_second']} req/s, {result['calls_per_second']} calls/s)\n")
+    header = f"{'route':<22} {'count':>6} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} {'errors':>7}"
+    if baseline:
+        header += f" {'p95_delta':>10}"
+    print(header)
+    for route, stats in result["routes"].items():
+        line = (f"{route:<22} {stats['count']:>6} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} "
+                f"{stats['p99_ms']:>8.1f} {stats['errors']:>7}")
+        if baseline:
+            before = baseline["routes"].get(route)
+            if before and before["p95_ms"]:
+                line += f" {(stats['p95_ms'] - before['p95_ms']) / before['p95_ms']:>+10.1%}"
+            else:
+                line += f" {'new':>10}"
+        print(line)
+    per_call = result["per_call"]
+    memory = result["memory"]
+    print(f"\nper call: {per_call['llm_calls']} LLM calls, {per_call['local_responses']} local responses, "
+          f"{per_call['prompt_tokens']} prompt / {per_call['completion_tokens']} completion tokens")
+    print(f"emails delivered: {result['emails_delivered']}")
+    print(f"RSS: {memory['rss_start_mb']} -> {memory['rss_end_mb']} MB ({memory['rss_growth_mb']:+} MB)")
+    if baseline:
+        print(f"baseline {baseline['commit']}: {baseline['requests_per_second']} req/s, "
+              f"RSS growth {baseline['memory']['rss_growth_mb']:+} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--smtp-latency", type=float, default=0.01)
+    parser.add_argument("--deferred", action="store_true", help="run with DEFERRED_RESPONSES=1")
+    parser.add_argument("--poll-pause", type=float, default=0.05,
+                        help="seconds between /webhook-result polls in deferred mode")
+    parser.add_argument("--out", help="JSON result path (default benchmarks/results/calls-<commit>.json)")
+    parser.add_argument("--baseline", help="earlier JSON result to compare against")
+    args = parser.parse_args()
+
+    stub = StubOpenAI(latency=args.llm_latency, reply=LLM_REPLY).start()
+    sink = SMTPSink(latency=args.smtp_latency).start()
+    os.environ.update(OPENAI_API_KEY="stub", OPENAI_BASE_URL=stub.base_url,
+                      SMTP_HOST="127.0.0.1", SMTP_PORT=str(sink.port), SMTP_USE_SSL="0",
+                      DEFERRED_RESPONSES="1" if args.deferred else "0")
+    os.environ.setdefault("SESSION_STORE", "memory")
+
+    import app
+    logging.disable(logging.INFO)
+
+    recorder = Recorder()
+    rss_start = rss_mb()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        per_call = list(pool.map(lambda i: run_call(app, recorder, i, args.poll_pause), range(args.calls)))
+    wall = time.perf_counter() - start
+    app.gmail_mailer.dispatcher.flush(timeout=30)
+    rss_end = rss_mb()
+
+    config = {
+        "calls": args.calls,
+        "concurrency": args.concurrency,
+        "llm_latency": args.llm_latency,
+        "smtp_latency": args.smtp_latency,
+        "deferred": args.deferred,
+        "session_store": os.environ["SESSION_STORE"],
+    }
+    result = summarize(recorder, per_call, wall, config, rss_start, rss_end, sink)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    out = args.out or os.path.join(ROOT, "benchmarks", "results", f"calls-{result['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nwrote {out}")
+
+    stub.stop()
+    sink.stop()
+
+
+if __name__ == "__main__":
+    main()
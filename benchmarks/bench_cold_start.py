@@ -0,0 +1,124 @@
+"""Import time, time to ready and first-turn latency of a fresh process.
+
+Starts the stub OpenAI server with --connect-latency per new connection
+(standing in for DNS and the TLS handshake), then for each mode runs
+--runs fresh app processes: one with the startup warm-up and one with
+WARMUP=0. Each process times `import app`, waits for /ready, and sends
+the first GPT turns of two calls through /webhook. Checks that /ready
+reports every step, that the warm-up opened the pooled connections and
+that the first turn after warm-up does not pay for a new connection.
+Exits non-zero if a check fails.
+
+    python benchmarks/bench_cold_start.py --runs 5 --connect-latency 0.15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_openai import StubOpenAI
+
+UTTERANCE = "Do you sell the large liners in Quebec stores?"
+
+# Çocuk süreç: import, hazır olma ve ilk turların süreleri JSON olarak yazılır
+CHILD = """
+import json, logging, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app
+imported = time.perf_counter() - start
+logging.disable(logging.WARNING)
+client = app.app.test_client()
+while client.get("/ready").status_code != 200:
+    time.sleep(0.002)
+ready = time.perf_counter() - start
+status = client.get("/ready").get_json()
+turns = []
+for i in range(2):
+    turn_start = time.perf_counter()
+    body = client.post("/webhook?lang=en", data={{"CallSid": f"CA-cold-{{i}}", "SpeechResult": {utterance!r}}})
+    turns.append(time.perf_counter() - turn_start)
+print(json.dumps({{"import": imported, "ready": ready, "turns": turns, "status": status,
+                  "answered": "problem connecting" not in body.get_data(as_text=True)}}))
+"""
+
+
+def run_child(stub, warm, connections):
+    env = dict(os.environ, OPENAI_BASE_URL=stub.base_url, OPENAI_API_KEY="stub", SESSION_STORE="memory",
+               WARMUP="1" if warm else "0", WARMUP_CONNECTIONS=str(connections), DEFERRED_RESPONSES="0",
+               SPECULATIVE_COMPLETIONS="0", CONTEXT_COMPACTION="0", JOURNAL_DIR="")
+    before = stub.connections
+    output = subprocess.check_output([sys.executable, "-c", CHILD.format(root=ROOT, utterance=UTTERANCE)],
+                                     env=env, stderr=subprocess.DEVNULL, text=True)
+    result = json.loads(output.strip().splitlines()[-1])
+    result["connections"] = stub.connections - before
+    return result
+
+
+def median(results, key, index=None):
+    return statistics.median(r[key] if index is None else r[key][index] for r in results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--connect-latency", type=float, default=0.15)
+    parser.add_argument("--connections", type=int, default=4)
+    args = parser.parse_args()
+
+    from warmup import TIKTOKEN_CACHE_DIR
+
+    files = len(os.listdir(TIKTOKEN_CACHE_DIR)) if os.path.isdir(TIKTOKEN_CACHE_DIR) else 0
+    print(f"tokenizer cache {TIKTOKEN_CACHE_DIR}: {files} files\n")
+
+    stub = StubOpenAI(latency=args.llm_latency, connect_latency=args.connect_latency).start()
+    failures = []
+    modes = {}
+    try:
+        for label, warm in (("warm-up", True), ("WARMUP=0", False)):
+            modes[label] = [run_child(stub, warm, args.connections) for _ in range(args.runs)]
+    finally:
+        stub.stop()
+
+    print(f"{'mode':<10} {'import_ms':>10} {'ready_ms':>10} {'turn1_ms':>10} {'turn2_ms':>10} {'connections':>12}")
+    for label, results in modes.items():
+        print(f"{label:<10} {median(results, 'import') * 1000:>10.0f} {median(results, 'ready') * 1000:>10.0f} "
+              f"{median(results, 'turns', 0) * 1000:>10.0f} {median(results, 'turns', 1) * 1000:>10.0f} "
+              f"{median(results, 'connections'):>12.0f}")
+
+    steps = modes["warm-up"][0]["status"]["steps"]
+    print("\nwarm-up steps: " + ", ".join(f"{name} {step['seconds'] * 1000:.1f} ms" for name, step in steps.items()))
+
+    for label, results in modes.items():
+        if not all(r["answered"] for r in results):
+            failures.append(f"{label}: a first turn was not answered by the stub")
+    if set(steps) != {"tokenizer", "twiml", "openai_connections"} or any(s["error"] for s in steps.values()):
+        failures.append(f"unexpected warm-up steps: {steps}")
+    elif set(steps["tokenizer"]["result"]) != {"en", "fr"}:
+        failures.append("system prompt token counts were not precomputed")
+    if modes["WARMUP=0"][0]["status"]["steps"]:
+        failures.append("WARMUP=0 still ran warm-up steps")
+    if any(r["connections"] < args.connections for r in modes["warm-up"]):
+        failures.append("warm-up did not open the pooled connections")
+    warm_first, cold_first = median(modes["warm-up"], "turns", 0), median(modes["WARMUP=0"], "turns", 0)
+    if warm_first > cold_first - args.connect_latency / 2:
+        failures.append(f"first turn after warm-up ({warm_first * 1000:.0f} ms) still pays for a connection "
+                        f"(cold {cold_first * 1000:.0f} ms)")
+
+    print()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
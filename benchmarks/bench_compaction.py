@@ -0,0 +1,128 @@
+"""Prompt size over a long call, with and without rolling summarization.
+
+Drives one scripted call of --turns caller turns through /webhook against
+the stub OpenAI server. The order number and platform are given in the
+first turns and never repeated. For every completion it records the
+prompt tokens sent to the chat model and whether the order number is
+still in the prompt, then prints both columns by turn index. Between
+turns it waits for the background compaction like the caller's speaking
+time would. Exits non-zero if compaction loses the order number or the
+prompt outgrows the window.
+
+    python benchmarks/bench_compaction.py --turns 60
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_openai import StubOpenAI
+
+# Ham turda sözlü biçimde, özette 702-1234567-9876543 olarak geçer
+ORDER_DIGITS = "9876543"
+REPLY = ("I understand, and I am sorry about the trouble with the liners. I have noted the details you "
+         "gave me. Could you tell me a little more about what happened when you first used them?")
+OPENING = [
+    "Hi, I have a problem with the trash can liners I bought.",
+    "I bought them on Amazon last month.",
+    "The order number is 702 dash 1234567 dash 9876543.",
+]
+FILLER = [
+    "The liners tore along the side seam as soon as I put anything heavy in them, mostly kitchen waste.",
+    "I tried the large size in my thirteen gallon bin and it did not fit around the rim properly.",
+    "My neighbour bought the same box and she had no problem, so maybe I got a bad batch from the warehouse.",
+    "I still have about half of the box left, and I would like to know if I can exchange them for another size.",
+    "The smell control also did not seem to work, the kitchen smelled after one day with the lid closed.",
+]
+
+
+def utterance(turn):
+    if turn < len(OPENING):
+        return OPENING[turn]
+    return FILLER[(turn - len(OPENING)) % len(FILLER)]
+
+
+def run_call(app, name, turns, settle):
+    from conversation_window import count_tokens
+
+    app.CONTEXT_COMPACTION = name == "compaction"
+    call_sid = f"CA-compaction-{name}"
+    prompts = []
+    original = app.request_completion
+
+    def recording(messages, context=None, *args):
+        prompts.append((sum(count_tokens(m["content"]) for m in messages),
+                        any(ORDER_DIGITS in m["content"] for m in messages)))
+        return original(messages, context, *args)
+
+    app.request_completion = recording
+    test_client = app.app.test_client()
+    test_client.post("/", data={"CallSid": call_sid})
+    latencies = []
+    try:
+        for turn in range(turns):
+            start = time.perf_counter()
+            test_client.post("/webhook?lang=en", data={"CallSid": call_sid, "SpeechResult": utterance(turn)})
+            latencies.append(time.perf_counter() - start)
+            context = app.call_contexts.get(call_sid)
+            waited = time.perf_counter()
+            while context is not None and context.compacting and time.perf_counter() - waited < settle:
+                time.sleep(0.01)
+    finally:
+        app.request_completion = original
+    context = app.call_contexts.get(call_sid)
+    return prompts, latencies, context.compactions if context is not None else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--summary-latency", type=float, default=0.3)
+    parser.add_argument("--settle", type=float, default=5.0, help="longest wait for compaction between turns")
+    args = parser.parse_args()
+
+    stub = StubOpenAI(latency=args.latency, reply=REPLY, model_latency={"gpt-4o-mini": args.summary_latency}).start()
+    os.environ.update(OPENAI_API_KEY="stub", OPENAI_BASE_URL=stub.base_url, SESSION_STORE="memory",
+                      DEFERRED_RESPONSES="0", SPECULATIVE_COMPLETIONS="0", SUMMARY_MODEL="gpt-4o-mini")
+    import app
+    logging.disable(logging.WARNING)
+
+    results = {name: run_call(app, name, args.turns, args.settle) for name in ("eviction", "compaction")}
+    stub.stop()
+
+    evicted, _, _ = results["eviction"]
+    compacted, _, compactions = results["compaction"]
+    print(f"{args.turns} turns, window {app.MAX_CONTEXT_TOKENS} tokens, compaction at {app.COMPACT_AT}\n")
+    print(f"{'turn':>4} {'evict_tokens':>13} {'order#':>7} {'compact_tokens':>15} {'order#':>7}")
+    for index, ((e_tokens, e_order), (c_tokens, c_order)) in enumerate(zip(evicted, compacted), 1):
+        print(f"{index:>4} {e_tokens:>13} {'yes' if e_order else 'LOST':>7} "
+              f"{c_tokens:>15} {'yes' if c_order else 'LOST':>7}")
+
+    print()
+    for name, (prompts, latencies, count) in results.items():
+        tokens = [t for t, _ in prompts]
+        print(f"{name:<11} prompt tokens mean {sum(tokens) / len(tokens):.0f} max {max(tokens)}, "
+              f"turn p50 {sorted(latencies)[len(latencies) // 2] * 1000:.0f} ms, compactions {count}")
+
+    failures = []
+    lost = [i for i, (_, has_order) in enumerate(compacted, 1) if not has_order and i > len(OPENING)]
+    if lost:
+        failures.append(f"compaction: order number missing from the prompt at turns {lost[:5]}")
+    if max(t for t, _ in compacted) > max(t for t, _ in evicted) + 200:
+        failures.append("compaction: prompts grew past the eviction baseline")
+    if args.turns > 30 and not compactions:
+        failures.append("compaction: the window was never compacted")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
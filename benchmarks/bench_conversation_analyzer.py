@@ -0,0 +1,155 @@
+"""Incremental ConversationAnalyzer vs. the original full-transcript scans.
+
+Checks that the analyzer agrees with the original functions on every prefix
+of randomly generated transcripts, then times per-turn cost as calls grow.
+
+    python benchmarks/bench_conversation_analyzer.py --turns 200 --calls 50
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation_analyzer import ConversationAnalyzer
+
+FRAGMENTS = [
+    "I have a problem with the bags", "j'ai un problème", "there is an issue", "I want to make a request",
+    "une demande d'échange", "can I exchange it", "just a suggestion", "mon avis", "a proposition",
+    "I bought it on Amazon", "at Walmart", "on your website", "from neatliner.com", "in store", "at the store",
+    "somewhere online", "my email is j o h n at gmail dot com", "n e a t arobase yahoo point fr",
+    "a.b.c@example.com", "order 702 dash 1234567 dash 9876543", "My order number is 123-4567890-1234567",
+    "70212345679876543", "yes", "no", "that's all", "the roll keeps tearing", "bonjour", "okay thanks",
+]
+
+
+# --- Original implementations from app.py, kept verbatim for comparison ---
+
+def extract_last_email(memory):
+    email_pattern = r"\b[\w\.-]+@[\w\.-]+\.\w+\b"
+
+    for msg in reversed(memory):
+        if msg["role"] == "user":
+            content = msg["content"].lower()
+
+            # Dönüşümler
+            content = content.replace(" at ", "@")
+            content = content.replace("arobase", "@")
+            content = content.replace(" dot ", ".").replace(" point ", ".")
+            content = re.sub(r"\s+", "", content)     # boşlukları kaldır
+            content = re.sub(r"\.(?=[^@]*@)", "", content)  # @ işaretinden önceki . karakterlerini kaldır
+            content = content.strip(" .")             # baştaki/sondaki nokta ve boşlukları kaldır
+
+            # E-mail yakala
+            matches = re.findall(email_pattern, content)
+            if matches:
+                return matches[-1].lower()  # her ihtimale karşı küçük harfe çevir
+
+    return "Not Provided"
+
+def extract_last_order_number(messages):
+    for msg in reversed(messages):
+        if msg["role"] == "user":
+            spoken = msg["content"].lower()
+
+            # Konuşma biçimlerini normalize et
+            spoken = spoken.replace(" dash ", "-").replace(" tiré ", "-").replace(" hyphen ", "-")
+
+            # Fazla boşlukları sil, çizgi formatına yaklaştır
+            spoken = re.sub(r'\s+', '', spoken)
+
+            # Order number formatını yakala: 702-1234567-9876543
+            match = re.search(r'(\d{3})[-]?(\d{7})[-]?(\d{7})', spoken)
+            if match:
+                return f"{match.group(1)}-{match.group(2)}-{match.group(3)}"
+    return "Not Provided"
+
+def detect_call_type(messages):
+    full_text = " ".join(msg["content"].lower() for msg in messages if msg["role"] == "user")
+    if any(word in full_text for word in ["problem", "problème", "issue"]):
+        return "Complaint"
+    elif any(word in full_text for word in ["request", "demande", "exchange"]):
+        return "Request"
+    elif any(word in full_text for word in ["suggestion", "avis", "proposition"]):
+        return "Suggestion"
+    return "Not Identified"
+
+def extract_platform(messages):
+    full_text = " ".join(msg["content"].lower() for msg in messages if msg["role"] == "user")
+
+    if "amazon" in full_text:
+        return "Amazon"
+    elif "walmart" in full_text:
+        return "Walmart"
+    elif "website" in full_text or "neatliner.com" in full_text:
+        return "Neatliner Website"
+    elif "store" in full_text or "in store" in full_text:
+        return "Physical Store"
+    elif "online" in full_text:
+        return "Online (unspecified)"
+    return "Not Provided"
+
+
+def random_transcript(rng, turns):
+    messages = [{"role": "system", "content": "prompt"}]
+    for _ in range(turns):
+        words = rng.sample(FRAGMENTS, rng.randint(1, 3))
+        messages.append({"role": "user", "content": " ".join(words)})
+        messages.append({"role": "assistant", "content": rng.choice(FRAGMENTS)})
+    return messages
+
+
+def check_equivalence(rng, calls, turns):
+    for _ in range(calls):
+        transcript = random_transcript(rng, turns)
+        analyzer = ConversationAnalyzer()
+        for end in range(1, len(transcript) + 1):
+            prefix = transcript[:end]
+            analyzer.sync(prefix)
+            expected = (detect_call_type(prefix), extract_platform(prefix),
+                        extract_last_email(prefix), extract_last_order_number(prefix))
+            actual = (analyzer.call_type, analyzer.platform, analyzer.email, analyzer.order_number)
+            assert actual == expected, (prefix, actual, expected)
+
+
+def time_per_turn(transcript):
+    legacy, incremental = [], []
+    analyzer = ConversationAnalyzer()
+    for end in range(3, len(transcript) + 1, 2):
+        prefix = transcript[:end]
+        start = time.perf_counter()
+        # webhook() eskiden her turda detect_call_type, kapanışta dört taramayı çalıştırıyordu
+        detect_call_type(prefix)
+        detect_call_type(prefix), extract_platform(prefix), extract_last_email(prefix), extract_last_order_number(prefix)
+        legacy.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        analyzer.sync(prefix)
+        analyzer.metadata()
+        incremental.append(time.perf_counter() - start)
+    return legacy, incremental
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    check_equivalence(rng, args.calls, 30)
+    print(f"equivalence: {args.calls} random calls, every prefix matches")
+
+    legacy, incremental = time_per_turn(random_transcript(rng, args.turns))
+    print(f"{'turn':>6} {'legacy_us':>12} {'analyzer_us':>12}")
+    step = max(1, len(legacy) // 10)
+    for i in list(range(0, len(legacy), step)) + [len(legacy) - 1]:
+        print(f"{i + 1:>6} {legacy[i] * 1e6:>12.1f} {incremental[i] * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Per-turn cost of context trimming as a call transcript grows.
+
+Compares the old behaviour of webhook() (look up the encoding, re-encode the
+whole history, trim twice per turn) with the incremental ConversationWindow.
+
+    python benchmarks/bench_conversation_window.py --turns 80
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tiktoken
+
+from conversation_window import ConversationWindow
+
+SYSTEM_PROMPT = "You are a customer support voice assistant for Neatliner. " * 40
+USER_LINE = "I bought the trash bags on Amazon last week and the roll keeps tearing when I pull one out."
+ASSISTANT_LINE = "I'm sorry to hear that. Could you tell me a bit more about when the bags started tearing?"
+
+
+def legacy_trim(memory, max_tokens=1500):
+    encoding = tiktoken.encoding_for_model("gpt-4o")
+    total_tokens = 0
+    trimmed = []
+    for msg in reversed(memory):
+        tokens = len(encoding.encode(msg["content"]))
+        if total_tokens + tokens > max_tokens:
+            break
+        trimmed.insert(0, msg)
+        total_tokens += tokens
+    return trimmed
+
+
+def run_legacy(turns):
+    memory = [{"role": "system", "content": SYSTEM_PROMPT}]
+    timings = []
+    for i in range(turns):
+        memory.append({"role": "user", "content": f"{USER_LINE} ({i})"})
+        start = time.perf_counter()
+        legacy_trim(memory)
+        legacy_trim(memory)
+        timings.append(time.perf_counter() - start)
+        memory.append({"role": "assistant", "content": f"{ASSISTANT_LINE} ({i})"})
+    return timings
+
+
+def run_window(turns):
+    memory = [{"role": "system", "content": SYSTEM_PROMPT}]
+    window = ConversationWindow(max_tokens=1500)
+    timings = []
+    for i in range(turns):
+        memory.append({"role": "user", "content": f"{USER_LINE} ({i})"})
+        start = time.perf_counter()
+        window.sync(memory).messages()
+        timings.append(time.perf_counter() - start)
+        memory.append({"role": "assistant", "content": f"{ASSISTANT_LINE} ({i})"})
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # Encoding yüklemesini ölçümlerin dışında tut
+    tiktoken.encoding_for_model("gpt-4o")
+
+    def best_of(fn):
+        runs = [fn(args.turns) for _ in range(args.repeat)]
+        return [min(run[i] for run in runs) for i in range(args.turns)]
+
+    legacy = best_of(run_legacy)
+    window = best_of(run_window)
+
+    print(f"{'turn':>6} {'legacy_us':>12} {'window_us':>12}")
+    step = max(1, args.turns // 12)
+    for i in range(0, args.turns, step):
+        print(f"{i + 1:>6} {legacy[i] * 1e6:>12.1f} {window[i] * 1e6:>12.1f}")
+    print(f"{'last':>6} {legacy[-1] * 1e6:>12.1f} {window[-1] * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
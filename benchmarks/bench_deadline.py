@@ -0,0 +1,130 @@
+"""Turn latency under OpenAI tail latency, with and without the deadline layer.
+
+The stub OpenAI server answers in --latency seconds, except for
+--tail-fraction of requests that take --tail-latency; the fallback model
+always answers in --fallback-latency. Each scenario sends --turns first
+turns through /webhook and checks that no turn outlives the budget and
+that hedges, fallbacks and reprompts are counted. Exits non-zero if a
+check fails.
+
+    python benchmarks/bench_deadline.py --tail-latency 8 --tail-fraction 0.1
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_openai import StubOpenAI
+
+FALLBACK_MODEL = "gpt-4o-mini"
+UTTERANCE = "Do you sell the large liners in Quebec stores?"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_scenario(app, name, policy, turns, concurrency):
+    from deadline import CompletionDeadline
+    import metrics
+
+    app.completion_deadline = CompletionDeadline(app.CHAT_MODEL, **policy)
+    hedges = metrics.LLM_HEDGES.value()
+    fallbacks = metrics.LLM_ANSWERS.value("fallback")
+    reprompts = metrics.LLM_FALLBACKS.value("reprompt")
+
+    def turn(i):
+        test_client = app.app.test_client()
+        start = time.perf_counter()
+        body = test_client.post("/webhook?lang=en", data={"CallSid": f"CA-{name}-{i}", "SpeechResult": UTTERANCE})
+        elapsed = time.perf_counter() - start
+        return elapsed, body.get_data(as_text=True)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(turn, range(turns)))
+    latencies = [elapsed for elapsed, _ in results]
+    return {
+        "latencies": latencies,
+        "reprompt_bodies": sum(1 for _, body in results if "took me a moment" in body),
+        "errors": sum(1 for _, body in results if "problem connecting" in body),
+        "hedges": metrics.LLM_HEDGES.value() - hedges,
+        "fallbacks": metrics.LLM_ANSWERS.value("fallback") - fallbacks,
+        "reprompts": metrics.LLM_FALLBACKS.value("reprompt") - reprompts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--tail-latency", type=float, default=8.0)
+    parser.add_argument("--tail-fraction", type=float, default=0.1)
+    parser.add_argument("--fallback-latency", type=float, default=0.3)
+    parser.add_argument("--budget", type=float, default=3.0)
+    parser.add_argument("--hedge-after", type=float, default=1.0)
+    parser.add_argument("--fallback-after", type=float, default=2.0)
+    args = parser.parse_args()
+
+    stub = StubOpenAI(latency=args.latency, tail_latency=args.tail_latency, tail_fraction=args.tail_fraction,
+                      model_latency={FALLBACK_MODEL: args.fallback_latency}).start()
+    os.environ.update(OPENAI_API_KEY="stub", OPENAI_BASE_URL=stub.base_url, SESSION_STORE="memory",
+                      DEFERRED_RESPONSES="0", SPECULATIVE_COMPLETIONS="0")
+    import app
+    logging.disable(logging.WARNING)
+
+    # Bütçesiz senaryo, kuyruk gecikmesini olduğu gibi gösterir
+    scenarios = [
+        ("no deadline", {"budget": args.tail_latency * 2}),
+        ("budget", {"budget": args.budget}),
+        ("budget+hedge", {"budget": args.budget, "hedge_after": args.hedge_after}),
+        ("budget+fallback", {"budget": args.budget,
+                             "fallback_model": FALLBACK_MODEL, "fallback_after": args.fallback_after}),
+        ("budget+hedge+fallback", {"budget": args.budget, "hedge_after": args.hedge_after,
+                                   "fallback_model": FALLBACK_MODEL, "fallback_after": args.fallback_after}),
+    ]
+
+    print(f"{args.turns} turns, LLM {args.latency}s with {args.tail_fraction:.0%} at {args.tail_latency}s, "
+          f"budget {args.budget}s\n")
+    print(f"{'scenario':<24} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} {'max_ms':>8} "
+          f"{'hedges':>7} {'fallback':>9} {'reprompt':>9}")
+    failures = []
+    for name, policy in scenarios:
+        result = run_scenario(app, name, policy, args.turns, args.concurrency)
+        latencies = result["latencies"]
+        print(f"{name:<24} {percentile(latencies, 0.5) * 1000:>8.0f} {percentile(latencies, 0.95) * 1000:>8.0f} "
+              f"{percentile(latencies, 0.99) * 1000:>8.0f} {max(latencies) * 1000:>8.0f} "
+              f"{result['hedges']:>7} {result['fallbacks']:>9} {result['reprompts']:>9}")
+
+        if result["errors"]:
+            failures.append(f"{name}: {result['errors']} turns ended in the connection error message")
+        if result["reprompts"] != result["reprompt_bodies"]:
+            failures.append(f"{name}: {result['reprompts']} reprompts counted, {result['reprompt_bodies']} returned")
+        if "hedge_after" not in policy and result["hedges"]:
+            failures.append(f"{name}: hedges fired without hedging enabled")
+        if policy["budget"] == args.budget:
+            # Bütçe + thread devri ve TwiML için küçük bir pay
+            if max(latencies) > args.budget + 0.5:
+                failures.append(f"{name}: slowest turn {max(latencies):.2f}s exceeds the {args.budget}s budget")
+        if "hedge_after" in policy and args.tail_fraction and not result["hedges"]:
+            failures.append(f"{name}: no hedges fired despite tail latency")
+        if "fallback_model" in policy and "hedge_after" not in policy and args.tail_fraction and not result["fallbacks"]:
+            failures.append(f"{name}: the fallback model never answered")
+
+    stub.stop()
+    print()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
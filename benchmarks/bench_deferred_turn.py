@@ -0,0 +1,127 @@
+"""Time until Twilio gets TwiML back for a turn, with and without deferral.
+
+Uses a stubbed OpenAI client that sleeps for --llm-latency seconds, then
+polls /webhook-result the way Twilio would follow the <Redirect>.
+
+Checks that the deferred filler comes back within --filler-budget, that
+polling ends with the LLM's answer, and that a turn given up after
+DEFERRED_MAX_POLLS does not write its late answer to the session, also when
+the polls land on a worker other than the one running the turn. Exits
+non-zero if a check fails.
+
+    python benchmarks/bench_deferred_turn.py --llm-latency 2.0
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ANSWER = "I'm sorry to hear that. Could you tell me a bit more about what happened?"
+# Betikli adımlara düşmeyen bir cümle; cevap LLM'den gelmeli
+UTTERANCE = "The roll I got last week keeps jamming in the dispenser."
+
+
+class SlowCompletions:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def create(self, **kwargs):
+        time.sleep(self.latency)
+        message = SimpleNamespace(content=ANSWER)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def follow(test_client, call_sid, body, pause, elsewhere=None):
+    polls = 0
+    while "<Redirect" in body and "/webhook-result" in body:
+        time.sleep(pause)
+        if elsewhere is not None:
+            # Yoklama başka bir worker'a düşmüş gibi: tur burada bilinmiyor
+            for key in [key for key in elsewhere if key[0] == call_sid]:
+                elsewhere.pop(key)
+        url = re.search(r"<Redirect[^>]*>([^<]+)</Redirect>", body).group(1).replace("&amp;", "&")
+        body = test_client.post(url, data={"CallSid": call_sid}).get_data(as_text=True)
+        polls += 1
+    return body, polls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    parser.add_argument("--poll-pause", type=float, default=0.25,
+                        help="seconds to wait between polls (Twilio plays <Pause length> here)")
+    parser.add_argument("--filler-budget", type=float, default=0.5,
+                        help="seconds the deferred webhook may take to return its filler")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    import app
+    app.client = SimpleNamespace(chat=SimpleNamespace(completions=SlowCompletions(args.llm_latency)))
+    test_client = app.app.test_client()
+    form = {"CallSid": "CA-sync", "SpeechResult": UTTERANCE}
+    failures = []
+
+    app.DEFERRED_RESPONSES = False
+    start = time.perf_counter()
+    test_client.post("/webhook?lang=en", data=form)
+    sync_ms = (time.perf_counter() - start) * 1000
+
+    app.DEFERRED_RESPONSES = True
+    form["CallSid"] = "CA-deferred"
+    start = time.perf_counter()
+    body = test_client.post("/webhook?lang=en", data=form).get_data(as_text=True)
+    first_ms = (time.perf_counter() - start) * 1000
+    if "/webhook-result" not in body:
+        failures.append("deferred webhook did not redirect to /webhook-result")
+    if first_ms > args.filler_budget * 1000:
+        failures.append(f"deferred filler took {first_ms:.0f} ms, budget {args.filler_budget * 1000:.0f} ms")
+
+    body, polls = follow(test_client, form["CallSid"], body, args.poll_pause)
+    answer_ms = (time.perf_counter() - start) * 1000
+    if ANSWER not in body:
+        failures.append(f"polling ended without the LLM answer after {polls} polls")
+
+    print(f"sync webhook:       {sync_ms:8.1f} ms until first TwiML")
+    print(f"deferred webhook:   {first_ms:8.1f} ms until first TwiML (filler)")
+    print(f"deferred answer:    {answer_ms:8.1f} ms after {polls} polls")
+
+    # Yoklama sınırı LLM'den önce dolarsa geç gelen cevap oturuma yazılmamalı
+    app.DEFERRED_MAX_POLLS = 2
+    form["CallSid"] = "CA-abandoned"
+    body = test_client.post("/webhook?lang=en", data=form).get_data(as_text=True)
+    body, polls = follow(test_client, form["CallSid"], body, args.poll_pause)
+    if ANSWER in body:
+        failures.append("turn finished before DEFERRED_MAX_POLLS ran out; raise --llm-latency")
+    time.sleep(args.llm_latency + 0.5)
+    history = app.sessions.get(form["CallSid"]) or []
+    if any(message["role"] == "assistant" and message["content"] == ANSWER for message in history):
+        failures.append("late answer of an abandoned turn was written to the session")
+    print(f"abandoned turn:     apologised after {polls} polls, session ends with {history[-1]['role'] if history else 'nothing'}")
+
+    # Tur bir worker'da sürerken yoklamalar başka worker'a düşerse de özür kazanmalı
+    form["CallSid"] = "CA-other-worker"
+    body = test_client.post("/webhook?lang=en", data=form).get_data(as_text=True)
+    pending = {key: entry for key, entry in app.pending_turns.items() if key[0] == form["CallSid"]}
+    body, polls = follow(test_client, form["CallSid"], body, args.poll_pause, elsewhere=app.pending_turns)
+    time.sleep(args.llm_latency + 0.5)
+    history = app.sessions.get(form["CallSid"]) or []
+    if any(message["role"] == "assistant" and message["content"] == ANSWER for message in history):
+        failures.append("late answer of a turn abandoned on another worker was written to the session")
+    if not pending or not all(future.done() for future, _ in pending.values()):
+        failures.append("turn abandoned on another worker never finished")
+    print(f"other worker:       apologised after {polls} polls, session ends with {history[-1]['role'] if history else 'nothing'}")
+
+    print()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Call journal: hot-path cost, group commit, crash recovery and export.
+
+1. Appends --messages messages from --threads threads to the in-memory
+   session store with and without the journal and reports microseconds
+   per append and records per fsync.
+2. Runs scripted calls through the app in a child process with
+   JOURNAL_DIR set and kills it with SIGKILL mid-call. A fresh app
+   then restores the sessions from the journal, continues one call and
+   sends the summary of another via /call-status. Several workers
+   started together on a copy of that journal send each abandoned
+   call's summary once between them.
+3. Two journals write to one directory and interleave on the same
+   calls; replay, open calls and export must follow record time, not
+   segment order.
+4. Writes --export-calls synthetic calls and streams them to CSV,
+   reporting time and peak Python memory.
+
+Exits non-zero if a check fails.
+
+    python benchmarks/bench_journal.py --messages 20000 --export-calls 20000
+"""
+import argparse
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CALLS = 5
+UTTERANCES = ["I have a problem with my trash bags", "I bought them on Amazon"]
+
+# Çocuk süreç: çağrıları yürütür, son turdan sonra SIGKILL bekler
+CHILD = """
+import os, sys, time
+sys.path.insert(0, {root!r})
+import app
+from types import SimpleNamespace as NS
+app.client = NS(chat=NS(completions=NS(create=lambda **kw: NS(
+    choices=[NS(message=NS(content="Could you describe the problem?"), finish_reason="stop")], usage=None))))
+client = app.app.test_client()
+for i in range({calls}):
+    sid = f"CA-journal-{{i}}"
+    client.post("/", data={{"CallSid": sid, "From": "+15145550100", "CallerCity": "Montreal"}})
+    for text in {utterances!r}:
+        client.post("/webhook?lang=en", data={{"CallSid": sid, "SpeechResult": text}})
+time.sleep(app.journal.fsync_interval * 4)
+print("ready", flush=True)
+time.sleep(60)
+"""
+
+# Aynı günlükle aynı anda açılan worker'lar; özetleri e-posta yerine stdout'a yazar.
+# Yavaş kuyruk, kurtarmaların üst üste binebileceği aralığı genişletir
+WORKER = """
+import sys, time
+sys.path.insert(0, {root!r})
+import gmail_mailer
+def enqueue_email(transcript, call_sid, metadata):
+    time.sleep(0.5)
+    print("sent", call_sid, flush=True)
+gmail_mailer.enqueue_email = enqueue_email
+import app
+"""
+
+
+def append_cost(journal, messages, threads):
+    from session_store import InMemorySessionStore
+    import call_journal
+
+    store = InMemorySessionStore(max_calls=100000, max_bytes=1 << 30)
+    if journal is not None:
+        store = call_journal.JournaledSessionStore(store, journal)
+    per_thread = messages // threads
+
+    def work(t):
+        for i in range(per_thread):
+            store.append(f"CA-{t}-{i // 20}", {"role": "user" if i % 2 else "assistant",
+                                              "content": "The liners tore along the side seam."})
+
+    workers = [threading.Thread(target=work, args=(t,)) for t in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    if journal is not None:
+        journal.flush(30)
+    return elapsed / (per_thread * threads) * 1e6
+
+
+def crash_and_recover(directory, failures):
+    env = dict(os.environ, JOURNAL_DIR=directory, SESSION_STORE="memory", OPENAI_API_KEY="stub",
+               DEFERRED_RESPONSES="0", SPECULATIVE_COMPLETIONS="0", CONTEXT_COMPACTION="0")
+    child = subprocess.Popen([sys.executable, "-c", CHILD.format(root=ROOT, calls=CALLS, utterances=UTTERANCES)],
+                             env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    if child.stdout.readline().strip() != "ready":
+        failures.append("child app did not finish its calls")
+        child.kill()
+        return
+    child.send_signal(signal.SIGKILL)
+    child.wait()
+    recover_in_workers(directory, env, failures)
+
+    os.environ.update(env)
+    import call_journal
+    # call_journal bu süreçte JOURNAL_DIR ayarlanmadan önce import edildi
+    call_journal.JOURNAL_DIR = directory
+    import app
+    sent = []
+    app.enqueue_email = lambda transcript, call_sid, metadata: sent.append((call_sid, metadata))
+    restored = [f"CA-journal-{i}" for i in range(CALLS) if app.sessions.get(f"CA-journal-{i}")]
+    print(f"crash recovery: {len(restored)}/{CALLS} calls restored after SIGKILL")
+    if len(restored) != CALLS:
+        failures.append(f"only {len(restored)} of {CALLS} calls restored")
+        return
+    history = app.sessions.get("CA-journal-0")
+    if len(history) != 1 + 2 * len(UTTERANCES):
+        failures.append(f"restored transcript has {len(history)} messages")
+    client = app.app.test_client()
+    client.post("/call-status", data={"CallSid": "CA-journal-1", "CallStatus": "completed"})
+    if not sent or sent[0][0] != "CA-journal-1" or sent[0][1].get("from_number") != "+15145550100":
+        failures.append(f"no abandoned-call summary with the caller's number: {sent}")
+    elif sent[0][1].get("platform") != "Amazon":
+        failures.append("abandoned-call summary lost the platform")
+    if "CA-journal-1" in app.sessions:
+        failures.append("ended call kept its session")
+    app.journal.flush()
+    open_calls = app.journal.open_calls()
+    if "CA-journal-1" in open_calls or "CA-journal-0" not in open_calls:
+        failures.append("journal open calls do not match after the hang-up")
+
+
+def recover_in_workers(directory, env, failures, workers=3):
+    copy = directory + "-workers"
+    shutil.copytree(directory, copy)
+    env = dict(env, JOURNAL_DIR=copy, JOURNAL_ABANDON_AFTER="0", WARMUP="0")
+    children = [subprocess.Popen([sys.executable, "-c", WORKER.format(root=ROOT)], env=env,
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+                for _ in range(workers)]
+    sent = [line.split()[1] for child in children for line in child.communicate(timeout=60)[0].splitlines()
+            if line.startswith("sent ")]
+    print(f"worker recovery: {len(sent)} abandoned-call summaries from {workers} workers for {CALLS} calls")
+    if sorted(sent) != sorted(f"CA-journal-{i}" for i in range(CALLS)):
+        failures.append(f"{workers} workers sharing a journal sent {len(sent)} summaries for {CALLS} calls")
+
+
+def interleaved_writers(directory, failures):
+    import call_journal
+
+    # İki worker aynı çağrıya yazar: A'nın segmenti önce açılır ama özet kaydı B'nin mesajlarından sonradır
+    a = call_journal.CallJournal(directory, fsync_interval=0.01)
+    b = call_journal.CallJournal(directory, fsync_interval=0.01)
+    a.call_started("CA-shared", {"From": "+15145550100"})
+    a.call_started("CA-late", {"From": "+15145550101"})
+    a.flush()
+    time.sleep(0.02)
+    b.message("CA-shared", {"role": "system", "content": "prompt"})
+    b.message("CA-shared", {"role": "user", "content": "I have a problem with my trash bags"})
+    b.flush()
+    a.call_summarized("CA-shared", "closing")
+    a.flush()
+    # A'nın eski segmentine aralık başladıktan sonra yazılan kayıt atlanmamalı
+    time.sleep(0.02)
+    since = time.time()
+    time.sleep(0.02)
+    a.message("CA-late", {"role": "user", "content": "Hello?"})
+    a.flush()
+    open_calls = a.open_calls()
+    recent = a.open_calls(since=since)
+    rows = [row for row in call_journal.export_calls(a) if row["call_sid"] == "CA-shared"]
+    a.close()
+    b.close()
+    print(f"interleaved writers: open={sorted(open_calls)} since={sorted(recent)} "
+          f"export={[(row['status'], row['messages']) for row in rows]}")
+    if "CA-shared" in open_calls:
+        failures.append("call summarized by one writer after another logged its messages is still open")
+    if "CA-late" not in recent:
+        failures.append("record written to an older segment after `since` was skipped")
+    if [(row["status"], row["messages"]) for row in rows] != [("closing", 1)]:
+        failures.append(f"export of an interleaved call gave {rows} instead of one closing row with 1 message")
+
+
+def export_cost(directory, calls):
+    import call_journal
+
+    journal = call_journal.CallJournal(directory, fsync_interval=0.2)
+    start_time = time.time() - calls
+    for i in range(calls):
+        sid = f"CA-export-{i}"
+        journal.record(sid, t=start_time + i, x={"From": "+15145550100"})
+        journal.message(sid, {"role": "user", "content": "I have a problem, I bought them on Amazon."})
+        journal.message(sid, {"role": "assistant", "content": "Where did you purchase the product?"})
+        journal.call_summarized(sid, "closing")
+    journal.close(60)
+
+    counted = []
+
+    def rows():
+        for row in call_journal.export_calls(journal):
+            counted.append(None)
+            yield row
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open(os.devnull, "w", newline="") as out:
+        call_journal.write_rows(rows(), call_journal.CALL_COLUMNS, out, "csv")
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(counted), elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--export-calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    import call_journal
+
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="voicebot-journal-") as directory:
+        baseline = append_cost(None, args.messages, args.threads)
+        journal = call_journal.CallJournal(os.path.join(directory, "append"))
+        journaled = append_cost(journal, args.messages, args.threads)
+        journal.close()
+        print(f"append: {baseline:.1f} us without journal, {journaled:.1f} us with journal; "
+              f"{journal.records} records in {journal.fsyncs} fsyncs "
+              f"({journal.records / max(journal.fsyncs, 1):.0f} per fsync)")
+        if journal.records != args.messages // args.threads * args.threads:
+            failures.append(f"journal wrote {journal.records} of {args.messages} records")
+
+        rows, elapsed, peak = export_cost(os.path.join(directory, "export"), args.export_calls)
+        print(f"export: {rows} calls to CSV in {elapsed:.2f}s, peak memory {peak / 1024:.0f} KiB")
+        if rows != args.export_calls:
+            failures.append(f"exported {rows} of {args.export_calls} calls")
+
+        interleaved_writers(os.path.join(directory, "interleaved"), failures)
+        crash_and_recover(os.path.join(directory, "crash"), failures)
+
+    print()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
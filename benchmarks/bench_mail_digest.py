@@ -0,0 +1,264 @@
+"""Call summary throughput: one email per call versus batched digests.
+
+Enqueues --calls summaries (a --urgent fraction of them complaints, the
+rest split between requests and suggestions) into a MailDispatcher
+pointed at the local SMTP sink with --latency per SMTP command, then
+shuts it down and reports how long delivery took, how many SMTP sessions
+and messages it needed and the median time for a complaint to reach
+the sink.
+Digest mode holds up to --digest-size calls per recipient list.
+
+Also checks that every call reaches the sink exactly once (as its own
+email or as a digest attachment), that complaints are never held for a
+digest nor sent later than they are one email per call, that MAIL_ROUTES
+sends each call type to its recipients, that a digest is sent when its
+window closes and that an unknown template field fails when the
+template is loaded. Finally, one child process holding summaries is
+killed while another stays up. A new dispatcher on the same spool
+directory must send the killed child's summaries and leave the live
+child's alone, and a spool rewrite that dies before the new file is in
+place must leave every held summary in the old one. Exits non-zero if a
+check fails.
+
+    python benchmarks/bench_mail_digest.py --calls 500 --latency 0.01 --digest-size 25
+"""
+import argparse
+import email
+import os
+import re
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from smtp_sink import SMTPSink
+
+ROUTES = {"Request": "requests@brightstar-sales.com", "Suggestion": "ideas@brightstar-sales.com,product@brightstar-sales.com"}
+TRANSCRIPT = ("USER: I have a problem with my trash bags\nASSISTANT: Where did you purchase the product?\n"
+              "USER: On Amazon\nASSISTANT: Thank you for contacting Neatliner Customer Service.\n")
+CALL_SID_RE = re.compile(rb"CA-bench-\d+")
+
+# Çocuk süreç: özetleri bekletir ve pencere dolmadan öldürülmeyi bekler
+HOLDER = """
+import sys, time
+sys.path.insert(0, {root!r})
+import gmail_mailer
+dispatcher = gmail_mailer.MailDispatcher(workers=1, digest=True, digest_window=3600, spool={spool!r})
+for i in range({calls}):
+    dispatcher.enqueue("USER: The liners tore.\\n", f"{prefix}-{{i}}",
+                       {{"call_type": "Request", "from_number": "+15145550100"}})
+print("ready", flush=True)
+time.sleep(60)
+"""
+
+
+def metadata(i, urgent_every):
+    call_type = "Complaint" if urgent_every and i % urgent_every == 0 else ("Request", "Suggestion")[i % 2]
+    return {"from_number": f"+1514555{i:04d}", "location": "MONTREAL, QC", "call_type": call_type,
+            "email": "john@gmail.com", "order_number": "702-1234567-9876543", "platform": "Amazon"}
+
+
+class Watcher:
+    """Notes when each urgent call reaches the sink."""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.arrived = {}
+        record = sink.record
+
+        def watch(data):
+            accepted = record(data)
+            if accepted and b"Call Summary (CallSid:" in data:
+                for call_sid in set(CALL_SID_RE.findall(data)):
+                    self.arrived.setdefault(call_sid.decode(), time.perf_counter())
+            return accepted
+
+        sink.record = watch
+
+
+def run(mailer, label, args, digest, failures):
+    sink = SMTPSink(latency=args.latency).start()
+    watcher = Watcher(sink)
+    mailer.SMTP_HOST, mailer.SMTP_PORT, mailer.SMTP_USE_SSL = "127.0.0.1", sink.port, False
+    dispatcher = mailer.MailDispatcher(workers=1, max_queue=args.calls, backoff=0.01, digest=digest,
+                                       digest_size=args.digest_size, digest_window=3600)
+    urgent_every = round(1 / args.urgent) if args.urgent else 0
+    enqueued = {}
+    start = time.perf_counter()
+    for i in range(args.calls):
+        call_sid = f"CA-bench-{i}"
+        enqueued[call_sid] = time.perf_counter()
+        dispatcher.enqueue(TRANSCRIPT, call_sid, metadata(i, urgent_every))
+    if urgent_every:
+        # Özetler bekletilirken acil şikayetler gönderilmiş olmalı
+        complaints = [f"CA-bench-{i}" for i in range(0, args.calls, urgent_every)]
+        deadline = time.monotonic() + 30
+        while not all(c in watcher.arrived for c in complaints) and time.monotonic() < deadline:
+            time.sleep(0.005)
+    dispatcher.shutdown(timeout=120)
+    elapsed = time.perf_counter() - start
+    sink.stop()
+
+    messages = [email.message_from_bytes(data) for data in sink.messages]
+    urgent = [watcher.arrived[c] - enqueued[c] for c in enqueued if c in watcher.arrived and
+              metadata(int(c.rsplit("-", 1)[1]), urgent_every)["call_type"] == "Complaint"]
+    size = sum(len(data) for data in sink.messages) / 1024
+    print(f"{label:<9} {elapsed:>8.2f} {args.calls / elapsed:>8.0f} {sink.sessions:>9} {len(messages):>9} "
+          f"{size:>8.0f} {statistics.median(urgent) * 1000 if urgent else float('nan'):>10.0f}")
+
+    # Her çağrı ya kendi e-postasında ya da bir özetin ekinde, tam bir kez
+    seen = {}
+    for msg in messages:
+        parts = msg.get_payload()
+        if "Digest" in msg["Subject"]:
+            sids = [part.get_filename()[len("call-"):-len(".txt")] for part in parts[1:]]
+            if any(metadata(int(s.rsplit("-", 1)[1]), urgent_every)["call_type"] == "Complaint" for s in sids):
+                failures.append(f"{label}: a complaint was held for a digest")
+        else:
+            sids = [CALL_SID_RE.search(msg["Subject"].encode()).group().decode()]
+        for call_sid in sids:
+            seen[call_sid] = seen.get(call_sid, 0) + 1
+            call_type = metadata(int(call_sid.rsplit("-", 1)[1]), urgent_every)["call_type"]
+            expected = ROUTES.get(call_type, mailer.RECEIVER_EMAIL).replace(",", ", ")
+            if msg["To"] != expected:
+                failures.append(f"{label}: {call_type} call {call_sid} went to {msg['To']} instead of {expected}")
+    if sorted(seen) != sorted(enqueued) or any(count != 1 for count in seen.values()):
+        failures.append(f"{label}: {len(seen)} of {len(enqueued)} calls delivered, "
+                        f"{sum(1 for c in seen.values() if c > 1)} more than once")
+    return elapsed, len(messages), urgent
+
+
+def check_window(mailer, failures):
+    sink = SMTPSink().start()
+    mailer.SMTP_PORT = sink.port
+    dispatcher = mailer.MailDispatcher(workers=1, backoff=0.01, digest=True, digest_size=100, digest_window=0.3)
+    start = time.monotonic()
+    for i in range(3):
+        dispatcher.enqueue(TRANSCRIPT, f"CA-bench-{i}", metadata(i + 1, 0))
+    while len(sink.messages) < 2 and time.monotonic() < start + 5:
+        time.sleep(0.01)
+    waited = time.monotonic() - start
+    # Kapanış bekleyen özetleri de gönderir; sayım ondan önce yapılır
+    arrived = len(sink.messages)
+    dispatcher.shutdown()
+    sink.stop()
+    if arrived != 2 or not 0.3 <= waited < 1.5:
+        failures.append(f"window expiry sent {arrived} digests after {waited:.2f}s instead of one per "
+                        f"recipient list after 0.3s")
+
+
+def check_spool(mailer, failures, calls=3):
+    spool = tempfile.mkdtemp(prefix="voicebot-mail-spool-")
+    children = {}
+    for prefix in ("CA-killed", "CA-alive"):
+        children[prefix] = subprocess.Popen(
+            [sys.executable, "-c", HOLDER.format(root=ROOT, spool=spool, calls=calls, prefix=prefix)],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        if any(child.stdout.readline().strip() != "ready" for child in children.values()):
+            failures.append("spool child did not hold its summaries")
+            return
+        children["CA-killed"].send_signal(signal.SIGKILL)
+        children["CA-killed"].wait()
+
+        sink = SMTPSink().start()
+        mailer.SMTP_PORT = sink.port
+        dispatcher = mailer.MailDispatcher(workers=1, backoff=0.01, digest=True, digest_window=3600, spool=spool)
+        dispatcher.start()
+        dispatcher.shutdown()
+        sink.stop()
+        sids = sorted(set(sid.decode() for data in sink.messages for sid in re.findall(rb"CA-(?:killed|alive)-\d+", data)))
+        print(f"spool: {len(sids)} held summaries recovered from a killed process")
+        if sids != [f"CA-killed-{i}" for i in range(calls)]:
+            failures.append(f"spool recovery sent {sids} instead of the killed process's {calls} summaries")
+        if sorted(os.listdir(spool)) != [f"digest-{children['CA-alive'].pid}.jsonl"]:
+            failures.append(f"spool left {sorted(os.listdir(spool))} behind")
+    finally:
+        for child in children.values():
+            child.kill()
+            child.wait()
+        shutil.rmtree(spool, ignore_errors=True)
+
+
+def check_spool_rewrite(mailer, failures, calls=3):
+    spool = tempfile.mkdtemp(prefix="voicebot-mail-spool-")
+    dispatcher = mailer.MailDispatcher(workers=1, digest=True, digest_window=3600, spool=spool)
+    dispatcher.start()
+    for i in range(calls):
+        dispatcher.enqueue("USER: The liners tore.\n", f"CA-held-{i}", {"call_type": "Request"})
+    replace = os.replace
+
+    def crash(*args):
+        raise OSError("killed while rewriting the spool")
+
+    # Bir özet teslim edildi ama süreç yeni spool dosyası yerine geçmeden öldü
+    os.replace = crash
+    try:
+        dispatcher._unspool(list(dispatcher._spooled)[:1])
+    except OSError:
+        pass
+    finally:
+        os.replace = replace
+    with open(os.path.join(spool, f"digest-{os.getpid()}.jsonl"), encoding="utf-8") as f:
+        kept = [line for line in f if line.strip()]
+    if len(kept) != calls:
+        failures.append(f"interrupted spool rewrite left {len(kept)} of {calls} held summaries")
+    shutil.rmtree(spool, ignore_errors=True)
+
+
+def check_template(mailer, failures):
+    try:
+        mailer.Template("summary", "Call {call_sid} from {caller_name}", mailer.SUMMARY_FIELDS)
+    except ValueError:
+        return
+    failures.append("unknown template field was accepted")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds per SMTP command")
+    parser.add_argument("--digest-size", type=int, default=25)
+    parser.add_argument("--urgent", type=float, default=0.1, help="fraction of calls that are complaints")
+    args = parser.parse_args()
+
+    os.environ["MAIL_ROUTES"] = ";".join(f"{call_type}={to}" for call_type, to in ROUTES.items())
+    os.environ.pop("GMAIL_APP_PASSWORD", None)
+    os.environ.pop("JOURNAL_DIR", None)
+    import gmail_mailer
+
+    failures = []
+    print(f"{'mode':<9} {'total_s':>8} {'calls/s':>8} {'sessions':>9} {'messages':>9} {'kbytes':>8} "
+          f"{'urgent_ms':>10}")
+    per_call, per_call_messages, per_call_urgent = run(gmail_mailer, "per-call", args, False, failures)
+    digest, digest_messages, urgent = run(gmail_mailer, "digest", args, True, failures)
+    print(f"\ndigest mode delivered {per_call / digest:.1f}x faster with "
+          f"{per_call_messages / max(digest_messages, 1):.1f}x fewer emails")
+    if digest_messages >= per_call_messages:
+        failures.append("digest mode did not send fewer emails")
+    # Şikayetler özet modunda da tek tek e-posta kadar hızlı gitmeli; bekleyen özetlerin arkasında kalmamalı
+    if urgent and statistics.median(urgent) > statistics.median(per_call_urgent) * 1.25 + 0.05:
+        failures.append(f"urgent complaints took {statistics.median(urgent):.2f}s to go out in digest mode, "
+                        f"{statistics.median(per_call_urgent):.2f}s one email per call")
+    check_window(gmail_mailer, failures)
+    check_template(gmail_mailer, failures)
+    check_spool(gmail_mailer, failures)
+    check_spool_rewrite(gmail_mailer, failures)
+
+    print()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Shows that the closing /webhook turn no longer waits on SMTP.
+
+Runs a local SMTP sink with increasing per-command latency and compares
+the blocking send_email() with the queued dispatcher, both directly and
+through the final /webhook turn with a stubbed OpenAI client. Checks
+that p95 of the closing turn stays under the sink's per-command delay,
+that it does not grow with that delay and that every queued summary is
+delivered. Exits non-zero if a check fails.
+
+    python benchmarks/bench_mail_dispatch.py --latency 0 0.05 0.2
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smtp_sink import SMTPSink
+
+CLOSING_LINE = "Thank you for contacting Neatliner Customer Service. We’ll follow up with you as soon as possible. Goodbye!"
+METADATA = {"call_type": "Complaint", "from_number": "+15550100", "email": "a@b.com"}
+
+
+class StubCompletions:
+    def create(self, **kwargs):
+        message = SimpleNamespace(content=CLOSING_LINE)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def point_mailer_at(sink):
+    import gmail_mailer
+    gmail_mailer.SMTP_HOST = "127.0.0.1"
+    gmail_mailer.SMTP_PORT = sink.port
+    gmail_mailer.SMTP_USE_SSL = False
+    return gmail_mailer
+
+
+def time_calls(fn, count):
+    timings = []
+    for i in range(count):
+        start = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def p95(timings):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(0.95 * len(timings)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, nargs="+", default=[0.0, 0.05, 0.2])
+    parser.add_argument("--calls", type=int, default=10)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ.update(SESSION_STORE="memory", WARMUP="0", JOURNAL_DIR="", DEFERRED_RESPONSES="0",
+                      SPECULATIVE_COMPLETIONS="0", STREAMING_RESPONSES="0")
+    import app
+    app.client = SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions()))
+    test_client = app.app.test_client()
+    failures = []
+    webhook_p95 = {}
+    print(f"{'smtp_ms':>8} {'send_ms':>9} {'enqueue_ms':>11} {'webhook_ms':>11} {'webhook_p95':>12} {'sessions':>9}")
+    for latency in args.latency:
+        sink = SMTPSink(latency=latency).start()
+        mailer = point_mailer_at(sink)
+
+        send_ms = statistics.median(
+            time_calls(lambda i: mailer.send_email("USER: hi\n", f"CA-send-{i}", METADATA), args.calls))
+        sessions_before, messages_before = sink.sessions, len(sink.messages)
+
+        dispatcher = mailer.MailDispatcher(workers=1, backoff=0.01, digest=False)
+        enqueue_ms = statistics.median(
+            time_calls(lambda i: dispatcher.enqueue("USER: hi\n", f"CA-queue-{i}", METADATA), args.calls))
+
+        mailer.dispatcher = dispatcher
+        tag = f"{latency * 1000:.0f}"
+
+        def final_turn(i):
+            test_client.post("/webhook?lang=en", data={"CallSid": f"CA-hook-{tag}-{i}", "SpeechResult": "No, that's all."})
+
+        webhook = time_calls(final_turn, args.calls)
+        webhook_p95[latency] = p95(webhook)
+
+        dispatcher.shutdown()
+        delivered = len(sink.messages) - messages_before
+        print(f"{latency * 1000:>8.0f} {send_ms:>9.2f} {enqueue_ms:>11.3f} {statistics.median(webhook):>11.2f} "
+              f"{webhook_p95[latency]:>12.2f} {sink.sessions - sessions_before:>9}")
+        sink.stop()
+
+        if latency > 0 and webhook_p95[latency] >= latency * 1000:
+            failures.append(f"closing turn p95 {webhook_p95[latency]:.1f} ms is not under the "
+                            f"{latency * 1000:.0f} ms SMTP delay")
+        if delivered != 2 * args.calls:
+            failures.append(f"{delivered} of {2 * args.calls} queued summaries reached the sink at "
+                            f"{latency * 1000:.0f} ms SMTP delay")
+
+    fastest, slowest = min(webhook_p95), max(webhook_p95)
+    # SMTP gecikmesi kapanış turuna yansımamalı; küçük bir pay tanınır
+    if webhook_p95[slowest] > webhook_p95[fastest] + max(10.0, (slowest - fastest) * 1000 / 4):
+        failures.append(f"closing turn p95 grew from {webhook_p95[fastest]:.1f} ms to {webhook_p95[slowest]:.1f} ms "
+                        f"with the SMTP delay")
+
+    print()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""Media Streams: per-frame cost and end-of-speech latency on recorded calls.
+
+A fixture is an 8 kHz mono 16-bit WAV recording of the caller's side of
+a call plus a JSON file next to it listing what was said and when:
+{"events": [{"speech": "...", "start_ms": .., "end_ms": ..},
+{"dtmf": "...", "at_ms": ..}]}. Without --fixture two fixtures are
+synthesized first (a quiet line and one with background noise above
+VAD_MIN_RMS, both with pauses inside utterances and a click between
+them) and read back like recordings.
+
+Each fixture is played into async_app's WebSocket handler the way Twilio
+would send it: a "start" message, then every 20 ms frame as μ-law
+"media", key presses as "dtmf" messages, and each reply's mark echoed
+back. Frames are sent as fast as the handler takes them; the caller only
+waits for the bot's reply after each turn. Speech-to-text is a stub that
+returns the fixture's transcripts after --stt-latency, and completions
+come from the stub OpenAI server.
+
+Reports the cost of handling one media message and the end-of-speech
+latency (detected end minus the recorded end of the last word) next to
+<Gather>'s five second timeout. Checks that every utterance is detected
+once, pauses and clicks included, that the session holds the caller's
+words and order number, that the closing reply closes the socket and
+sends the summary, and that talking over a reply clears Twilio's audio.
+Exits non-zero if a check fails.
+
+    python benchmarks/bench_media_stream.py --stt-latency 0.15 --llm-latency 0.4
+    python benchmarks/bench_media_stream.py --fixture calls/complaint.wav
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import math
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_openai import StubOpenAI
+
+SAMPLE_RATE = 8000
+FRAME = 160
+GATHER_TIMEOUT_MS = 5000
+REPLY = "I’ve noted your request. Is there anything else I can help you with?"
+SCRIPT = [
+    {"speech": "I have a problem with my trash bags"},
+    {"speech": "I bought them on Amazon"},
+    {"dtmf": "70212345679876543"},
+    {"speech": "They tear when I pull them out of the box, and the smell is too strong"},
+    {"speech": "No thanks"},
+    {"speech": "j o h n at gmail dot com"},
+    {"speech": "Yes"},
+]
+SYNTHESIZED = {"quiet": 30, "noisy": 450}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def synthesize_call(noise_rms, seed):
+    # Konuşmaya benzer ses: hece zarfları, kayan perde ve harmonikler; aralarda gürültü ve bir tık
+    rng = random.Random(seed)
+    samples, events = [], []
+
+    def noise(ms):
+        samples.extend(rng.gauss(0, noise_rms) for _ in range(ms * SAMPLE_RATE // 1000))
+
+    def click():
+        samples.extend(rng.gauss(0, 8000) for _ in range(SAMPLE_RATE * 10 // 1000))
+
+    noise(600)
+    for index, event in enumerate(SCRIPT):
+        if "dtmf" in event:
+            events.append({"dtmf": event["dtmf"], "at_ms": len(samples) * 1000 // SAMPLE_RATE})
+            noise(1500)
+            continue
+        start = len(samples)
+        pitch = rng.uniform(100, 150)
+        for word in event["speech"].split():
+            for _ in range(max(1, round(len(word) / 3))):
+                length = int(SAMPLE_RATE * rng.uniform(0.12, 0.22))
+                for i in range(length):
+                    t = len(samples) / SAMPLE_RATE
+                    envelope = math.sin(math.pi * i / length) * 7000
+                    f0 = pitch * (1 + 0.05 * math.sin(2 * math.pi * 3 * t))
+                    voiced = sum(math.sin(2 * math.pi * f0 * k * t) / k for k in range(1, 6))
+                    samples.append(envelope * voiced / 2 + rng.gauss(0, noise_rms))
+                noise(rng.randint(10, 40))
+            # Virgülde, cümle içinde VAD_END_MS'den kısa bir duraklama
+            noise(380 if word.endswith(",") else rng.randint(50, 120))
+        end = len(samples)
+        while samples and abs(samples[end - 1]) < 4 * max(noise_rms, 1) and end > start:
+            end -= 1
+        events.append({"speech": event["speech"], "start_ms": start * 1000 // SAMPLE_RATE,
+                       "end_ms": end * 1000 // SAMPLE_RATE})
+        noise(700)
+        if index == 0:
+            click()
+        noise(800)
+    pcm = b"".join(struct.pack("<h", max(-32768, min(32767, int(value)))) for value in samples)
+    return pcm, events
+
+
+def write_fixture(directory, name, noise_rms, seed=1):
+    pcm, events = synthesize_call(noise_rms, seed)
+    path = os.path.join(directory, f"{name}.wav")
+    with wave.open(path, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(SAMPLE_RATE)
+        out.writeframes(pcm)
+    with open(os.path.join(directory, f"{name}.json"), "w") as f:
+        json.dump({"events": events}, f, indent=1)
+    return path
+
+
+def load_fixture(path):
+    with wave.open(path, "rb") as recording:
+        if (recording.getnchannels(), recording.getsampwidth(), recording.getframerate()) != (1, 2, SAMPLE_RATE):
+            raise ValueError(f"{path}: expected 8 kHz mono 16-bit PCM")
+        pcm = recording.readframes(recording.getnframes())
+    with open(os.path.splitext(path)[0] + ".json") as f:
+        return pcm, json.load(f)["events"]
+
+
+class StubSTT:
+    name = "stub"
+
+    def __init__(self, texts, latency):
+        self.texts = list(texts)
+        self.latency = latency
+        self.seconds = []
+
+    def transcribe(self, pcm, sample_rate, language):
+        time.sleep(self.latency)
+        self.seconds.append(len(pcm) / 2 / sample_rate)
+        return self.texts.pop(0) if self.texts else ""
+
+
+class Caller:
+    """Twilio's side of one stream: frames, key presses and marks from a fixture."""
+
+    def __init__(self, media_stream, ulaw, events, call_sid):
+        self.media_stream = media_stream
+        self.frames = [ulaw[offset:offset + FRAME] for offset in range(0, len(ulaw) - FRAME + 1, FRAME)]
+        self.speech = [e for e in events if "speech" in e]
+        self.dtmf = [e for e in events if "dtmf" in e]
+        self.call_sid = call_sid
+        self.stream = None
+        self.marks = asyncio.Queue()
+        self.pending = []
+        self.detected_ms = []
+        self.reply_seconds = []
+        self.media_seconds = []
+        self.closed = False
+        self.stopping = False
+        self.utterances = 0
+
+    def message(self, event, **body):
+        return {"type": "websocket.receive", "text": json.dumps(dict(body, event=event, streamSid="MZ-bench"))}
+
+    async def send(self, message):
+        if message["type"] == "websocket.close":
+            # "stop" mesajından önce kapandıysa kapanış cevabının mark'ından sonra kapanmıştır
+            self.closed = not self.stopping
+        elif message["type"] == "websocket.send":
+            payload = json.loads(message["text"])
+            if payload["event"] == "mark":
+                self.marks.put_nowait((payload["mark"]["name"], time.perf_counter()))
+
+    async def wait_reply(self, since):
+        try:
+            name, at = await asyncio.wait_for(self.marks.get(), 10)
+        except asyncio.TimeoutError:
+            return
+        self.reply_seconds.append(at - since)
+        # Twilio cevabı çaldıktan sonra mark'ı geri gönderir
+        self.pending.append(self.message("mark", mark={"name": name}))
+
+    def messages(self):
+        yield {"type": "websocket.connect"}
+        yield self.message("start", start={"callSid": self.call_sid, "streamSid": "MZ-bench", "customParameters": {
+            "lang": "en", "From": "+15145550100", "CallerCity": "MONTREAL", "CallerState": "QC"}})
+        dtmf = list(self.dtmf)
+        for index, frame in enumerate(self.frames):
+            now_ms = index * FRAME * 1000 // SAMPLE_RATE
+            while dtmf and dtmf[0]["at_ms"] <= now_ms:
+                for digit in dtmf.pop(0)["dtmf"] + "#":
+                    yield self.message("dtmf", dtmf={"digit": digit})
+                yield "reply"
+            yield self.message("media", media={"track": "inbound", "payload": base64.b64encode(frame).decode()})
+        self.stopping = True
+        yield self.message("stop")
+        yield {"type": "websocket.disconnect"}
+
+    async def run(self, app):
+        source = self.messages()
+
+        async def receive():
+            if self.stream is not None and self.stream.stats["utterances"] > self.utterances:
+                # Bir önceki kare konuşmanın bittiğini gösterdi
+                self.utterances = self.stream.stats["utterances"]
+                self.detected_ms.append(self.stream.stats["frames"] * FRAME * 1000 // SAMPLE_RATE)
+                await self.wait_reply(time.perf_counter())
+            while not self.pending:
+                message = next(source)
+                if message == "reply":
+                    await self.wait_reply(time.perf_counter())
+                    continue
+                self.pending.append(message)
+            return self.pending.pop(0)
+
+        caller = self
+        original = self.media_stream.MediaStream
+
+        class TimedStream(original):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                caller.stream = self
+
+            async def handle(self, text):
+                started = time.perf_counter()
+                result = await super().handle(text)
+                if '"media"' in text:
+                    caller.media_seconds.append(time.perf_counter() - started)
+                return result
+
+        self.media_stream.MediaStream = TimedStream
+        try:
+            await app.media_stream_socket(receive, self.send)
+        finally:
+            self.media_stream.MediaStream = original
+
+
+async def replay(app, media_stream, name, pcm, events, stt_latency, failures):
+    call_sid = f"CA-stream-{name}"
+    stt = StubSTT([e["speech"] for e in events if "speech" in e], stt_latency)
+    app.speech_to_text = stt
+    sent = []
+    app.voicebot.enqueue_email = lambda transcript, sid, metadata: sent.append((sid, metadata))
+    caller = Caller(media_stream, media_stream.pcm_to_ulaw(pcm), events, call_sid)
+    await caller.run(app)
+
+    speech = caller.speech
+    latencies = [detected - event["end_ms"] for detected, event in zip(caller.detected_ms, speech)]
+    stats = caller.stream.stats
+    costs = [s * 1e6 for s in caller.media_seconds]
+    vad_cost = stats["frame_seconds"] / max(stats["frames"], 1) * 1e6
+    print(f"{name:<8} {len(caller.frames):>7} {sum(costs) / len(costs):>8.1f} {percentile(costs, 0.99):>8.1f} "
+          f"{vad_cost:>8.1f} {len(caller.detected_ms):>3}/{len(speech):<3} "
+          f"{sum(latencies) / max(len(latencies), 1):>8.0f} {max(latencies, default=0):>8.0f} "
+          f"{percentile(caller.reply_seconds, 0.5) * 1000:>9.0f}")
+
+    if len(caller.detected_ms) != len(speech):
+        failures.append(f"{name}: {len(caller.detected_ms)} utterances detected for {len(speech)} spoken")
+    else:
+        for event, detected, seconds in zip(speech, caller.detected_ms, stt.seconds):
+            if not event["end_ms"] < detected < event["end_ms"] + GATHER_TIMEOUT_MS // 5:
+                failures.append(f"{name}: end of {event['speech']!r} at {event['end_ms']} ms detected at {detected} ms")
+            spoken = (event["end_ms"] - event["start_ms"]) / 1000
+            if not spoken <= seconds <= spoken + 0.6:
+                failures.append(f"{name}: {seconds:.2f}s of audio sent to STT for {spoken:.2f}s of speech")
+    if percentile(costs, 0.99) > 2000:
+        failures.append(f"{name}: p99 cost of a 20 ms frame is {percentile(costs, 0.99):.0f} µs")
+
+    history = app.voicebot.sessions.get(call_sid) or []
+    said = [m["content"] for m in history if m["role"] == "user"]
+    texts = [e["speech"] for e in speech]
+    if [text for text in said if text in texts] != texts:
+        failures.append(f"{name}: session holds {said} instead of the caller's words")
+    if not caller.closed:
+        failures.append(f"{name}: closing reply did not close the socket")
+    summary = dict(sent).get(call_sid)
+    if summary is None:
+        failures.append(f"{name}: no call summary was sent")
+    elif "702-1234567-9876543" not in str(summary) or "john@gmail.com" not in str(summary):
+        failures.append(f"{name}: summary is missing the order number or email: {summary}")
+
+
+async def check_barge_in(media_stream, failures):
+    # Cevap çalarken konuşma başlarsa Twilio'ya "clear" gönderilmeli
+    sent = []
+
+    async def send(payload):
+        sent.append(payload["event"])
+
+    stream = media_stream.MediaStream(send, None, None, None, None)
+    stream.playing = "reply-1"
+    quiet, loud = bytes([0xFF]) * FRAME, media_stream.pcm_to_ulaw(struct.pack("<h", 6000) * FRAME)
+    for frame in [quiet] * 20 + [loud] * 10:
+        await stream.audio(frame)
+    if sent != ["clear"] or stream.stats["barge_ins"] != 1:
+        failures.append(f"talking over a reply sent {sent} instead of one clear")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixture", action="append", default=[], help="WAV recording with a JSON file next to it")
+    parser.add_argument("--stt-latency", type=float, default=0.15)
+    parser.add_argument("--llm-latency", type=float, default=0.4)
+    args = parser.parse_args()
+
+    fixtures = args.fixture
+    directory = tempfile.mkdtemp(prefix="media-stream-")
+    if not fixtures:
+        fixtures = [write_fixture(directory, name, noise_rms) for name, noise_rms in SYNTHESIZED.items()]
+
+    stub = StubOpenAI(latency=args.llm_latency, reply=REPLY).start()
+    os.environ.update(OPENAI_API_KEY="stub", OPENAI_BASE_URL=stub.base_url, SESSION_STORE="memory",
+                      SPECULATIVE_COMPLETIONS="0", CONTEXT_COMPACTION="0", WARMUP="0",
+                      STREAMING_RESPONSES="0", JOURNAL_DIR="")
+    import async_app
+    import media_stream
+    import tts
+    logging.disable(logging.WARNING)
+    # async_app MEDIA_STREAMS=1 ile yerel tonlarla açılmaz; backend'ler burada takılır
+    async_app.text_to_speech = tts.LocalTTS()
+
+    async def run_all():
+        # AsyncOpenAI istemcisinin bağlantı havuzu tek bir event loop'a bağlı; tüm kayıtlar aynı loop'ta çalınır
+        for path in fixtures:
+            pcm, events = load_fixture(path)
+            await replay(async_app, media_stream, os.path.splitext(os.path.basename(path))[0], pcm, events,
+                         args.stt_latency, failures)
+        await check_barge_in(media_stream, failures)
+
+    failures = []
+    try:
+        print(f"{'fixture':<8} {'frames':>7} {'mean_us':>8} {'p99_us':>8} {'vad_us':>8} {'utt':>7} "
+              f"{'eos_ms':>8} {'eos_max':>8} {'reply_ms':>9}")
+        asyncio.run(run_all())
+    finally:
+        stub.stop()
+    print(f"\nend of speech with <Gather>: {GATHER_TIMEOUT_MS} ms timeout plus a webhook round trip; "
+          f"a 20 ms frame has a {FRAME * 1000 // SAMPLE_RATE * 1000} µs budget")
+
+    print()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
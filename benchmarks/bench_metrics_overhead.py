@@ -0,0 +1,63 @@
+"""Per-request cost of the metrics instrumentation.
+
+Times a request-shaped sequence (trace, the stages a /webhook turn
+records, request histogram) and fails if it exceeds --budget-ms.
+
+    python benchmarks/bench_metrics_overhead.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+
+STAGES = ["session", "session", "trim", "flow", "trim", "llm", "postprocess", "session", "render"]
+
+
+def one_request(i):
+    metrics.begin_trace(f"CA{i % 50}", "/webhook")
+    for name in STAGES:
+        with metrics.stage(name):
+            pass
+    metrics.TURNS.inc(label_value="llm")
+    metrics.TURN_SECONDS.observe(0.8)
+    elapsed = metrics.end_trace()
+    metrics.REQUEST_SECONDS.observe(elapsed, "/webhook")
+
+
+def measure(requests):
+    start = time.perf_counter()
+    for i in range(requests):
+        one_request(i)
+    return (time.perf_counter() - start) / requests * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--budget-ms", type=float, default=0.1)
+    args = parser.parse_args()
+
+    per_request_ms = measure(args.requests)
+    print(f"metrics only:          {per_request_ms * 1000:8.2f} us/request")
+
+    with tempfile.TemporaryDirectory() as trace_dir:
+        metrics.TRACE_DIR = trace_dir
+        traced_ms = measure(args.requests // 10)
+        metrics.TRACE_DIR = None
+    print(f"with JSON trace files: {traced_ms * 1000:8.2f} us/request")
+
+    start = time.perf_counter()
+    body = metrics.render()
+    print(f"/metrics render:       {(time.perf_counter() - start) * 1000:8.2f} ms ({len(body)} bytes)")
+
+    if per_request_ms > args.budget_ms:
+        sys.exit(f"instrumentation overhead {per_request_ms:.3f} ms exceeds budget {args.budget_ms} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Hit rate and saved latency of speculative completions.
+
+Replays scripted sequences of Twilio partial results against
+/partial-speech, then posts the final SpeechResult to /webhook with a fake
+LLM that takes --llm-latency seconds.
+
+Checks that each scenario is a hit (the webhook reuses the speculation and
+answers well under the LLM latency), a miss (the speculation is discarded
+and recomputed) or never speculated, and that a caller whose partials keep
+changing never has more than SPECULATIVE_MAX_INFLIGHT completions running.
+Exits non-zero if a check fails.
+
+    python benchmarks/bench_speculative.py --llm-latency 1.0
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["SPECULATIVE_COMPLETIONS"] = "1"
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+HIT, MISS, NONE = "hit", "miss", "none"
+# (partials in arrival order, final SpeechResult, expected outcome)
+SCENARIOS = [
+    ("stable, final matches",
+     ["hi I", "hi I have a question", "hi I have a question about sizes", "hi I have a question about sizes",
+      "hi I have a question about sizes"],
+     "Hi, I have a question about sizes.", HIT),
+    ("stable, final adds words",
+     ["do you sell", "do you sell the large liners", "do you sell the large liners"],
+     "Do you sell the large liners in Quebec stores?", MISS),
+    ("never stable",
+     ["what", "what are", "what are your", "what are your opening"],
+     "What are your opening hours?", NONE),
+    ("stable, minor ASR fix",
+     ["can I speak to a person", "can I speak to a person", "can I speak to a person"],
+     "Can I speak to a person?", HIT),
+]
+# Her kısmi sonuç ikişer kez gelir ve kararlı sayılır; hepsine tahmin başlatılmamalı
+CHANGING_PARTIALS = [
+    "is the box recyclable", "is the box recyclable",
+    "is the box recyclable or compostable", "is the box recyclable or compostable",
+    "is the box recyclable or compostable in Montreal", "is the box recyclable or compostable in Montreal",
+    "is the box recyclable or compostable in Montreal and Laval", "is the box recyclable or compostable in Montreal and Laval",
+]
+
+
+class FakeCompletions:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self.lock:
+            self.calls += 1
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self.lock:
+                self.running -= 1
+        message = SimpleNamespace(content="Let me help you with that. Could you tell me more?")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--partial-interval", type=float, default=0.2,
+                        help="seconds between partial callbacks")
+    parser.add_argument("--end-of-speech", type=float, default=0.8,
+                        help="seconds between the last partial and the final result")
+    args = parser.parse_args()
+
+    import app
+    fake = FakeCompletions(args.llm_latency)
+    app.client = SimpleNamespace(chat=SimpleNamespace(completions=fake))
+    test_client = app.app.test_client()
+
+    stats = app.speculator.stats
+    failures = []
+    print(f"{'scenario':<26} {'webhook_ms':>11} {'llm_calls':>10} {'outcome':>8}")
+    for i, (name, partials, final, expected) in enumerate(SCENARIOS):
+        call_sid = f"CA-spec-{i}"
+        calls_before, hits_before, misses_before = fake.calls, stats["hits"], stats["misses"]
+        for partial in partials:
+            test_client.post("/partial-speech?lang=en", data={"CallSid": call_sid, "UnstableSpeechResult": partial})
+            time.sleep(args.partial_interval)
+        time.sleep(args.end_of_speech)
+        start = time.perf_counter()
+        test_client.post("/webhook?lang=en", data={"CallSid": call_sid, "SpeechResult": final})
+        webhook_ms = (time.perf_counter() - start) * 1000
+        llm_calls = fake.calls - calls_before
+        outcome = HIT if stats["hits"] > hits_before else MISS if stats["misses"] > misses_before else NONE
+        print(f"{name:<26} {webhook_ms:>11.1f} {llm_calls:>10} {outcome:>8}")
+
+        if outcome != expected:
+            failures.append(f"{name}: {outcome} instead of {expected}")
+        # İsabette cevap hazır, ıskalamada ve tahminsiz turda GPT baştan çağrılır
+        if expected == HIT and (llm_calls != 1 or webhook_ms > args.llm_latency * 500):
+            failures.append(f"{name}: hit took {webhook_ms:.0f} ms and {llm_calls} LLM calls")
+        if expected == MISS and (llm_calls != 2 or webhook_ms < args.llm_latency * 900):
+            failures.append(f"{name}: miss took {webhook_ms:.0f} ms and {llm_calls} LLM calls instead of recomputing")
+        if expected == NONE and llm_calls != 1:
+            failures.append(f"{name}: {llm_calls} LLM calls without a stable partial")
+
+    # Kısmi sonuç sürekli değişirken bırakılan tahminler OpenAI'da çalışmaya devam eder
+    time.sleep(args.llm_latency)
+    fake.peak = 0
+    skipped_before = stats["skipped"]
+    for partial in CHANGING_PARTIALS:
+        test_client.post("/partial-speech?lang=en", data={"CallSid": "CA-spec-changing", "UnstableSpeechResult": partial})
+        time.sleep(args.partial_interval)
+    time.sleep(args.llm_latency + args.partial_interval)
+    print(f"{'partials keep changing':<26} {'':>11} {fake.peak:>10} {'peak':>8}")
+    if fake.peak > app.SPECULATIVE_MAX_INFLIGHT:
+        failures.append(f"{fake.peak} speculations ran at once for one call, cap {app.SPECULATIVE_MAX_INFLIGHT}")
+    if stats["skipped"] == skipped_before:
+        failures.append("no stable partial was skipped while the cap was reached")
+
+    print(f"\nstarted={stats['started']} hits={stats['hits']} misses={stats['misses']} "
+          f"discarded={stats['discarded']} skipped={stats['skipped']} hit_rate={app.speculator.hit_rate():.0%} "
+          f"saved={stats['saved_seconds']:.2f}s")
+
+    print()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
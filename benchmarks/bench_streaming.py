@@ -0,0 +1,173 @@
+"""Time to first TwiML byte with and without streamed completions.
+
+The stub OpenAI server streams its reply one word at a time: --latency
+until the first token, then --token-interval per word (non-streamed
+requests answer after the same total time). Sends --turns first turns
+through /webhook in each mode and reports time to first byte of the
+webhook response and time until the rest of the reply is available from
+/webhook-continue.
+
+Then checks, with a streamed reply per case, that:
+- a plain reply is split after its first sentences and reassembled
+  in the session;
+- a DTMF request in a later sentence still ends the turn with the DTMF
+  <Gather>, and one in the first sentence is never split from it;
+- the closing line still ends the call and sends the summary;
+- the repeated order-number guard and the email rewrite still replace
+  the reply.
+Exits non-zero if a check fails.
+
+    python benchmarks/bench_streaming.py --turns 20 --latency 0.4 --token-interval 0.03
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_openai import StubOpenAI
+
+UTTERANCE = "Do you sell the large liners in Quebec stores?"
+REPLY = ("Yes, the large liners are sold in several Quebec stores. Availability changes from week to week, "
+         "so it is best to check the store locator on our website before you go. Is there anything else I can help "
+         "you with today?")
+DTMF_LATER = ("I can look into that order for you right away. Please enter your order number followed by the "
+              "pound key.")
+DTMF_FIRST = "Please enter your order number followed by the pound key. I will look it up while we talk."
+CLOSING = ("Thank you for contacting Neatliner Customer Service. We’ll follow up with you as soon as possible. "
+           "Goodbye!")
+
+CONTINUE_RE = re.compile(r"<Redirect method=\"POST\">(/webhook-continue\?[^<]+)</Redirect>")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def post(client, path, call_sid, **data):
+    start = time.perf_counter()
+    response = client.post(path, data=dict(data, CallSid=call_sid))
+    return time.perf_counter() - start, response.get_data(as_text=True)
+
+
+def turn(app, call_sid, text=UTTERANCE):
+    # Twilio gibi: webhook cevabı, sonra (ilk cümleler çalındıktan sonra) devam adresi
+    client = app.app.test_client()
+    first_byte, body = post(client, "/webhook?lang=en", call_sid, SpeechResult=text)
+    match = CONTINUE_RE.search(body)
+    rest_body, rest_time = None, 0.0
+    if match:
+        rest_time, rest_body = post(client, match.group(1).replace("&amp;", "&"), call_sid)
+    return first_byte, first_byte + rest_time, body, rest_body
+
+
+def measure(app, stub, label, streaming, turns, concurrency):
+    app.STREAMING_RESPONSES = streaming
+    stub.reply = REPLY
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda i: turn(app, f"CA-{label}-{i}"), range(turns)))
+    first = [r[0] for r in results]
+    full = [r[1] for r in results]
+    split = sum(1 for r in results if r[3] is not None)
+    print(f"{label:<12} {percentile(first, 0.5) * 1000:>9.0f} {percentile(first, 0.95) * 1000:>9.0f} "
+          f"{percentile(full, 0.5) * 1000:>9.0f} {split:>6}/{turns}")
+    return percentile(first, 0.5), percentile(full, 0.5)
+
+
+def check_cases(app, stub, failures):
+    app.STREAMING_RESPONSES = True
+    sent = []
+    app.enqueue_email = lambda transcript, call_sid, metadata: sent.append(call_sid)
+
+    stub.reply = REPLY
+    _, _, body, rest = turn(app, "CA-check-plain")
+    said = app.sessions.get("CA-check-plain")[-1]["content"]
+    if rest is None or "<Say" not in body or 'input="speech"' not in rest:
+        failures.append("plain reply was not split into a first part and a continuation with the speech <Gather>")
+    elif said != REPLY:
+        failures.append(f"session holds {said!r} instead of the streamed reply")
+
+    stub.reply = DTMF_LATER
+    _, _, body, rest = turn(app, "CA-check-dtmf-later")
+    if rest is None or 'input="dtmf"' not in rest or "enter your order number" not in rest:
+        failures.append("DTMF request in a later sentence did not end the turn with the DTMF <Gather>")
+
+    stub.reply = DTMF_FIRST
+    _, _, body, rest = turn(app, "CA-check-dtmf-first")
+    if rest is not None or 'input="dtmf"' not in body:
+        failures.append("DTMF request in the first sentence was split from its <Gather>")
+
+    stub.reply = CLOSING
+    _, _, body, rest = turn(app, "CA-check-closing")
+    if "<Gather" in body + (rest or "") or "CA-check-closing" not in sent:
+        failures.append("closing line did not end the call without <Gather> and send the summary")
+
+    # Sipariş numarası verilmişken GPT yeniden isterse cevap değiştirilir
+    client = app.app.test_client()
+    sid = "CA-check-guard"
+    post(client, "/webhook?lang=en", sid, SpeechResult="I have a problem with my trash bags")
+    post(client, "/webhook?lang=en", sid, SpeechResult="I bought them on Amazon")
+    post(client, "/order-number?lang=en", sid, Digits="70212345679876543")
+    stub.reply = "Thanks. " + DTMF_FIRST
+    _, _, body, rest = turn(app, sid, "They tear when I pull them out of the box")
+    if "received your order number" not in body or rest is not None:
+        failures.append("repeated order-number guard did not replace the streamed reply")
+
+    replaces_reply = app.replaces_reply
+    app.replaces_reply = lambda analyzer: True
+    try:
+        stub.reply = REPLY
+        streamed = stub.requests
+        _, _, body, rest = turn(app, "CA-check-email")
+    finally:
+        app.replaces_reply = replaces_reply
+    if rest is not None or 'ssml="true"' not in body:
+        failures.append("email confirmation rewrite did not replace the reply")
+    elif stub.requests != streamed + 1:
+        failures.append("email turn did not ask the model")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.4, help="seconds to the first token")
+    parser.add_argument("--token-interval", type=float, default=0.03)
+    args = parser.parse_args()
+
+    stub = StubOpenAI(latency=args.latency, token_interval=args.token_interval).start()
+    os.environ.update(OPENAI_API_KEY="stub", OPENAI_BASE_URL=stub.base_url, SESSION_STORE="memory",
+                      DEFERRED_RESPONSES="0", SPECULATIVE_COMPLETIONS="0", CONTEXT_COMPACTION="0", WARMUP="0")
+    import app
+    logging.disable(logging.WARNING)
+
+    failures = []
+    try:
+        print(f"{'mode':<12} {'ttfb_p50':>9} {'ttfb_p95':>9} {'full_p50':>9} {'split':>8}  (ms)")
+        whole_first, whole_full = measure(app, stub, "whole", False, args.turns, args.concurrency)
+        stream_first, stream_full = measure(app, stub, "streamed", True, args.turns, args.concurrency)
+        print(f"\ntime to first byte {whole_first / stream_first:.1f}x lower when streamed")
+        if stream_first >= whole_first:
+            failures.append("streamed turns did not answer sooner")
+        if stream_full > whole_full + 0.1:
+            failures.append(f"streamed reply took {stream_full - whole_full:.2f}s longer to finish")
+        check_cases(app, stub, failures)
+    finally:
+        stub.stop()
+
+    print()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
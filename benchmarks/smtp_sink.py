@@ -0,0 +1,88 @@
+"""Minimal local SMTP server used as a stand-in for Gmail in benchmarks.
+
+It accepts any AUTH, counts sessions and messages, and can add a fixed
+delay to every command to mimic a slow remote server.
+"""
+import socketserver
+import threading
+import time
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, fail_first=0):
+        super().__init__((host, port), _SMTPHandler)
+        self.latency = latency
+        self.fail_first = fail_first
+        self.sessions = 0
+        self.logins = 0
+        self.messages = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def record(self, data):
+        with self._lock:
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                return False
+            self.messages.append(data)
+            return True
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.wfile.write(line.encode() + b"\r\n")
+        self.wfile.flush()
+
+    def handle(self):
+        with self.server._lock:
+            self.server.sessions += 1
+        self.reply("220 sink ESMTP")
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            command = raw.decode(errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250-sink\r\n250-AUTH PLAIN LOGIN\r\n")
+                self.reply("250 OK")
+            elif verb == "AUTH":
+                with self.server._lock:
+                    self.server.logins += 1
+                self.reply("235 Authentication successful")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(line)
+                if self.server.record(b"".join(lines)):
+                    self.reply("250 Queued")
+                else:
+                    self.reply("451 Temporary failure")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                # MAIL, RCPT, RSET, NOOP
+                self.reply("250 OK")
@@ -0,0 +1,242 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Answers POST /v1/chat/completions after a fixed latency with a canned
+reply, over HTTP/1.1 keep-alive, and counts requests and TCP connections
+so benchmarks can check connection reuse. A fraction of requests can be
+slowed to --tail-latency, and models listed in model_latency answer with
+their own latency. With --rpm-limit it answers 429 with retry-after-ms
+once a refilling request bucket (10 seconds of burst) is empty, like the
+real API. GET /v1/models answers an empty list, and --connect-latency
+delays every new connection like a TLS handshake would. Requests with
+"stream": true get server-sent events, one word per chunk, --latency
+until the first token and --token-interval between tokens (plain
+requests answer after the same total time). Point a client at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+    python benchmarks/stub_openai.py --port 8765 --latency 1.0
+"""
+import argparse
+import json
+import random
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = "Let me help you with that. Could you tell me a bit more about it?"
+
+
+class StubOpenAI(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host="127.0.0.1", port=0, latency=1.0, reply=REPLY,
+                 tail_latency=None, tail_fraction=0.0, model_latency=None, seed=1, rpm_limit=0,
+                 connect_latency=0.0, token_interval=0.0):
+        self.latency = latency
+        self.token_interval = token_interval
+        self.connect_latency = connect_latency
+        self.reply = reply
+        self.tail_latency = tail_latency
+        self.tail_fraction = tail_fraction
+        self.model_latency = model_latency or {}
+        self.requests_by_model = {}
+        self.rpm_limit = rpm_limit
+        self.rate_limited = 0
+        self._bucket = rpm_limit / 6.0
+        self._bucket_updated = time.monotonic()
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        super().__init__((host, port), _Handler)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def admit(self):
+        # None ise istek kabul edildi; değilse kaç saniye sonra tekrar denenmeli
+        if not self.rpm_limit:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            rate = self.rpm_limit / 60.0
+            self._bucket = min(self.rpm_limit / 6.0, self._bucket + (now - self._bucket_updated) * rate)
+            self._bucket_updated = now
+            if self._bucket >= 1:
+                self._bucket -= 1
+                return None
+            self.rate_limited += 1
+            return (1 - self._bucket) / rate
+
+    def reset_rate_limit(self):
+        with self._lock:
+            self._bucket = self.rpm_limit / 6.0
+            self._bucket_updated = time.monotonic()
+            self.rate_limited = 0
+
+    def latency_for(self, model):
+        with self._lock:
+            self.requests_by_model[model] = self.requests_by_model.get(model, 0) + 1
+            if model in self.model_latency:
+                return self.model_latency[model]
+            if self.tail_latency is not None and self._random.random() < self.tail_fraction:
+                return self.tail_latency
+            return self.latency
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        socketserver.ThreadingMixIn.process_request(self, request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        # Yeni bağlantının el sıkışma maliyeti; keep-alive ile yalnızca bir kez ödenir
+        if self.server.connect_latency:
+            time.sleep(self.server.connect_latency)
+        super().setup()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send(200, {"object": "list", "data": []})
+        else:
+            self._send(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with server._lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if not self.path.endswith("/chat/completions"):
+                self._send(404, {"error": {"message": "not found"}})
+                return
+            request = json.loads(body or b"{}")
+            retry_after = server.admit()
+            if retry_after is not None:
+                self._send(429, {"error": {"message": "Rate limit reached for requests", "type": "requests",
+                                           "code": "rate_limit_exceeded"}},
+                           headers={"retry-after-ms": str(int(retry_after * 1000) + 1)})
+                return
+            latency = server.latency_for(request.get("model"))
+            prompt_tokens = sum(len(m.get("content", "").split()) for m in request.get("messages", []))
+            completion_tokens = len(server.reply.split())
+            if request.get("stream"):
+                self._stream(request, latency, prompt_tokens, completion_tokens)
+                return
+            time.sleep(latency + server.token_interval * completion_tokens)
+            self._send(200, {
+                "id": f"chatcmpl-stub-{server.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4o"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": server.reply},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+        finally:
+            with server._lock:
+                server.in_flight -= 1
+
+    def _stream(self, request, latency, prompt_tokens, completion_tokens):
+        server = self.server
+        words = server.reply.split(" ")
+        base = {"id": f"chatcmpl-stub-{server.requests}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": request.get("model", "gpt-4o")}
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            time.sleep(latency)
+            for i, word in enumerate(words):
+                if i:
+                    time.sleep(server.token_interval)
+                delta = {"role": "assistant", "content": word} if not i else {"content": " " + word}
+                self._event(dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}]))
+            self._event(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+            if (request.get("stream_options") or {}).get("include_usage"):
+                self._event(dict(base, choices=[], usage={
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                }))
+            self._chunk(b"data: [DONE]\n\n")
+            self._chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # İstemci akışı yarıda bıraktı (hedge'i kaybeden istek)
+            self.close_connection = True
+
+    def _event(self, payload):
+        self._chunk(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+    def _chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        try:
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # İstemci cevabı beklemeden vazgeçti (hedge'i kaybeden istek)
+            self.close_connection = True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--tail-latency", type=float)
+    parser.add_argument("--tail-fraction", type=float, default=0.0)
+    parser.add_argument("--rpm-limit", type=int, default=0)
+    parser.add_argument("--connect-latency", type=float, default=0.0)
+    parser.add_argument("--token-interval", type=float, default=0.0)
+    args = parser.parse_args()
+    server = StubOpenAI(port=args.port, latency=args.latency, tail_latency=args.tail_latency,
+                        tail_fraction=args.tail_fraction, rpm_limit=args.rpm_limit,
+                        connect_latency=args.connect_latency, token_interval=args.token_interval)
+    print(f"stub OpenAI listening on {server.base_url} (latency {args.latency}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"requests={server.requests} connections={server.connections} max_in_flight={server.max_in_flight} "
+          f"rate_limited={server.rate_limited}")
+
+
+if __name__ == "__main__":
+    main()
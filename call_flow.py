@@ -0,0 +1,214 @@
+import re
+
+from conversation_analyzer import NOT_PROVIDED, parse_email
+
+# Akışın betik adımları; durum, son asistan mesajından çıkarılır
+ASK_PLATFORM = "ask_platform"
+ASK_ORDER_NUMBER = "ask_order_number"
+ORDER_CONFIRMED = "order_confirmed"
+ANYTHING_ELSE = "anything_else"
+ASK_EMAIL = "ask_email"
+CONFIRM_EMAIL = "confirm_email"
+CLOSING = "closing"
+
+SCRIPT = {
+    "en": {
+        ASK_PLATFORM: "Where did you purchase the product?",
+        ASK_ORDER_NUMBER: "Thank you. Please enter your order number using your phone’s keypad, then press the pound key (#).",
+        ASK_EMAIL: "Could you please share your email address? Say each letter of the part before the @ sign one by one, "
+                   "with short pauses between letters. For example: N... E... A... T... "
+                   "Then say the rest, like \"@gmail.com\" or \"@yahoo.com\". I'm ready when you are.",
+        CLOSING: "Thank you for contacting Neatliner Customer Service. We’ll follow up with you as soon as possible. Goodbye!",
+    },
+    "fr": {
+        ASK_PLATFORM: "Où avez-vous acheté le produit ?",
+        ASK_ORDER_NUMBER: "Merci. Veuillez entrer votre numéro de commande au clavier téléphonique, puis appuyez sur la touche dièse (#).",
+        ASK_EMAIL: "Pourriez-vous me donner votre adresse e-mail ? Dites chaque lettre de la partie avant l’arobase une par une, "
+                   "avec de courtes pauses entre les lettres. Par exemple : N... E... A... T... "
+                   "Ensuite, dites le reste, comme « @gmail.com » ou « @yahoo.fr ». Je vous écoute.",
+        CLOSING: "Merci d’avoir contacté le service client Neatliner. Nous vous recontacterons dans les plus brefs délais. Au revoir !",
+    },
+}
+
+EMAIL_CONFIRMATION = {
+    "en": "To confirm, is your email address: {email}? If this is correct, please say yes.",
+    "fr": "Pour confirmer, votre adresse e-mail est-elle : {email} ? Si c’est correct, dites oui.",
+}
+
+ORDER_CONFIRMATION = {
+    "en": "Thank you. I’ve received your order number: {order_number}. Could you now explain your issue in detail?",
+    "fr": "Merci. J'ai bien reçu votre numéro de commande : {order_number}. Pourriez-vous maintenant expliquer votre problème en détail ?",
+}
+
+ANYTHING_ELSE_QUESTION = {
+    "en": "Is there anything else I can help you with?",
+    "fr": "Y a-t-il autre chose avec laquelle je peux vous aider ?",
+}
+
+# GPT zaman bütçesinde cevap veremediğinde okunan kısa özür ve tekrar sorusu
+REPROMPT_PREFIX = {
+    "en": "Sorry, that took me a moment.",
+    "fr": "Désolé, cela m'a pris un moment.",
+}
+REPEAT_REQUEST = {
+    "en": "Could you please say that again?",
+    "fr": "Pourriez-vous répéter, s'il vous plaît ?",
+}
+
+# Son asistan mesajını duruma eşleyen işaretler (LLM'in ürettiği betik cümleleri de yakalanır)
+_STATE_MARKERS = [
+    (CLOSING, ["thank you for contacting neatliner", "thank you for calling neatliner",
+               "merci d’avoir contacté le service client neatliner", "merci d'avoir contacté le service client neatliner"]),
+    (CONFIRM_EMAIL, ["to confirm, is your email address", "pour confirmer, votre adresse e-mail"]),
+    (ASK_EMAIL, ["i'm ready when you are", "je vous écoute"]),
+    (ORDER_CONFIRMED, ["i’ve received your order number", "j'ai bien reçu votre numéro de commande"]),
+    (ASK_ORDER_NUMBER, ["please enter your order number", "veuillez entrer votre numéro de commande"]),
+    (ANYTHING_ELSE, ["anything else i can help you with", "autre chose avec laquelle je peux vous aider"]),
+    (ASK_PLATFORM, ["where did you purchase the product", "où avez-vous acheté le produit"]),
+]
+
+# Şikâyetin gerçekten bir Neatliner ürünüyle ilgili olduğunu gösteren kelimeler
+PRODUCT_TERMS = ["neatliner", "liner", "bag", "trash", "garbage", "bin", "sac", "poubelle", "ordure", "doublure"]
+
+_PRODUCT_RE = re.compile(r"\b(" + "|".join(PRODUCT_TERMS) + r")")
+# "not right", "isn't correct", "pas correct" gibi olumsuzlar da sayılır; olumlu kelimeyle birlikte gelirse cevap karışıktır
+_NEGATIVE_RE = re.compile(
+    r"\b(no|nope|nothing|not|wrong|incorrect|that's all|that is all|non|rien|pas|faux|c'est tout)\b|n['’]t\b"
+)
+# "Başka bir şey var mı?" sorusuna yalnızca tamamı "hayır, bu kadar" olan cevaplar; "I don't know",
+# "Nothing works" gibi yeni bir sorun anlatan cümleler LLM'e kalır
+_DONE_WORDS = frozenset("no nope nah non not today nothing else rien d'autre that's that is it all c'est tout "
+                        "thanks thank you merci i'm good fine ok okay bye goodbye au revoir".split())
+_DONE_RE = re.compile(r"\b(no|nope|nah|non|nothing|rien|that's all|that is all|that's it|c'est tout|not today)\b")
+_WORD_RE = re.compile(r"[\w']+")
+_AFFIRMATIVE_RE = re.compile(r"\b(yes|yeah|yep|correct|right|exactly|oui|exact|exactement|c'est ça|c'est correct)\b")
+_SHORT_ANSWER_WORDS = 6
+
+
+def format_email_for_confirmation(email: str, lang: str = "en") -> str:
+    match = re.match(r"([\w\.-]+)@([\w\.-]+\.\w+)", email)
+    if not match:
+        return email  # Format uygun değilse olduğu gibi döndür
+
+    local_part, domain_part = match.groups()
+
+    if lang == "fr":
+        connector = "arobase"
+        dot_replacement = "point"
+    else:
+        connector = "at"
+        dot_replacement = "dot"
+
+    # Her harf arasına 1 saniyelik durak ekle
+    slow_letters = ""
+    for char in local_part:
+        slow_letters += f"{char.upper()} <break time=\"1s\"/> "
+
+    domain_slow = domain_part.replace(".", f" {dot_replacement} ")
+
+    # Sonuç: A <break/> S <break/> ... at gmail dot com
+    return f"{slow_letters.strip()} {connector} {domain_slow}"
+
+
+def email_confirmation(email, lang):
+    formatted_email = format_email_for_confirmation(email, lang)
+    # SSML formatına sarmala
+    return EMAIL_CONFIRMATION[lang].format(email=f"<speak>{formatted_email}</speak>")
+
+
+def state_of(assistant_text):
+    if assistant_text is None:
+        return None
+    lowered = assistant_text.lower()
+    for state, markers in _STATE_MARKERS:
+        if any(marker in lowered for marker in markers):
+            return state
+    return None
+
+
+def last_assistant_text(transcript, end=None):
+    end = len(transcript) if end is None else end
+    for i in range(end - 1, -1, -1):
+        if transcript[i]["role"] == "assistant":
+            return transcript[i]["content"]
+    return None
+
+
+def _is_short(text, pattern):
+    lowered = text.lower()
+    return len(lowered.split()) <= _SHORT_ANSWER_WORDS and pattern.search(lowered) is not None
+
+
+def _is_done(text):
+    words = _WORD_RE.findall(text.lower().replace("’", "'"))
+    return (0 < len(words) <= _SHORT_ANSWER_WORDS and all(word in _DONE_WORDS for word in words)
+            and _DONE_RE.search(" ".join(words)) is not None)
+
+
+def local_reply(transcript, analyzer, lang):
+    """Return (state, text) when the turn is scripted, or None to ask the LLM.
+
+    transcript ends with the caller's latest message and analyzer has
+    already seen it.
+    """
+    lang = "fr" if lang == "fr" else "en"
+    script = SCRIPT[lang]
+    user_text = transcript[-1]["content"]
+    state = state_of(last_assistant_text(transcript, end=len(transcript) - 1))
+
+    if state is None and len(transcript) <= 2:
+        # İlk tur: ürünle ilgili bir şikâyet ise satın alma yerini sor
+        if analyzer.call_type == "Complaint" and _PRODUCT_RE.search(user_text.lower()):
+            if analyzer.platform == NOT_PROVIDED:
+                return ASK_PLATFORM, script[ASK_PLATFORM]
+            if analyzer.order_number == NOT_PROVIDED:
+                return ASK_ORDER_NUMBER, script[ASK_ORDER_NUMBER]
+        return None
+
+    if state == ASK_PLATFORM:
+        if analyzer.order_number == NOT_PROVIDED:
+            return ASK_ORDER_NUMBER, script[ASK_ORDER_NUMBER]
+        return None
+
+    if state == ANYTHING_ELSE and _is_done(user_text):
+        return ASK_EMAIL, script[ASK_EMAIL]
+
+    if state == ASK_EMAIL:
+        email = parse_email(user_text)
+        if email:
+            return CONFIRM_EMAIL, email_confirmation(email, lang)
+        return None
+
+    if state == CONFIRM_EMAIL:
+        email = parse_email(user_text)
+        if email:
+            # Arayan düzeltilmiş adresi söyledi; yeniden onaylat
+            return CONFIRM_EMAIL, email_confirmation(email, lang)
+        affirmative = _is_short(user_text, _AFFIRMATIVE_RE)
+        negative = _is_short(user_text, _NEGATIVE_RE)
+        # "Yes, no problem" gibi karışık cevaplar LLM'e bırakılır
+        if affirmative and not negative:
+            return CLOSING, script[CLOSING]
+        if negative and not affirmative:
+            return ASK_EMAIL, script[ASK_EMAIL]
+
+    return None
+
+
+def reprompt(transcript, analyzer, lang):
+    """Canned reply for a turn the LLM could not answer in time.
+
+    Repeats the question of the current step, so the flow state inferred
+    from this message stays where it was.
+    """
+    lang = "fr" if lang == "fr" else "en"
+    state = state_of(last_assistant_text(transcript, end=len(transcript) - 1))
+    if state == CONFIRM_EMAIL and analyzer.email != NOT_PROVIDED:
+        question = email_confirmation(analyzer.email, lang)
+    elif state == ANYTHING_ELSE:
+        question = ANYTHING_ELSE_QUESTION[lang]
+    elif state in (ASK_PLATFORM, ASK_ORDER_NUMBER, ASK_EMAIL):
+        question = SCRIPT[lang][state]
+    else:
+        question = REPEAT_REQUEST[lang]
+    return f"{REPROMPT_PREFIX[lang]} {question}"
@@ -0,0 +1,408 @@
+"""Append-only journal of every call, for crash recovery and analytics.
+
+Each message, call start, summary and hang-up is one JSON line in
+segment files under JOURNAL_DIR. A background thread writes batches and
+fsyncs them together, so a turn only pays for a queue put. Export a date
+range of calls without loading the journal into memory with
+
+    python call_journal.py export --since 2026-10-01 --until 2026-10-18 > calls.csv
+    python call_journal.py export --messages --format jsonl > messages.jsonl
+"""
+import argparse
+import atexit
+import csv
+import heapq
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from conversation_analyzer import ConversationAnalyzer
+from session_store import SessionStore, decode_message, encode_message
+
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "")
+JOURNAL_FSYNC_INTERVAL = float(os.getenv("JOURNAL_FSYNC_INTERVAL", "0.05"))
+JOURNAL_SEGMENT_BYTES = int(os.getenv("JOURNAL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+JOURNAL_MAX_BATCH = 512
+
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+
+CALL_COLUMNS = ["call_sid", "started", "ended", "status", "from_number", "location", "messages",
+                "call_type", "platform", "order_number", "email"]
+MESSAGE_COLUMNS = ["call_sid", "time", "role", "content"]
+
+
+class CallJournal:
+    """Segmented JSONL journal with one writer thread and group-commit fsync.
+
+    Records queued within JOURNAL_FSYNC_INTERVAL of each other are written
+    and fsynced together; that interval is also how much a crash can lose.
+    A torn line at the end of a segment is skipped on replay.
+
+    Several processes may write to one directory, each to its own
+    segments; replay merges all segments by record time.
+    """
+
+    def __init__(self, directory, fsync_interval=JOURNAL_FSYNC_INTERVAL, segment_bytes=JOURNAL_SEGMENT_BYTES):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        self.records = 0
+        self.fsyncs = 0
+        self._fd = None
+        self._segment_size = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    # Yazma tarafı
+
+    def record(self, call_sid, **fields):
+        self._start()
+        # Mikrosaniye: farklı worker'ların kayıtları birleştirilirken sıraları korunsun
+        self._queue.put({"t": round(time.time(), 6), "c": call_sid, **fields})
+
+    def message(self, call_sid, message):
+        self.record(call_sid, m=encode_message(message))
+
+    def call_started(self, call_sid, caller):
+        self.record(call_sid, x={key: value for key, value in caller.items() if value})
+
+    def call_summarized(self, call_sid, reason):
+        self.record(call_sid, s=reason)
+
+    def call_ended(self, call_sid, status):
+        self.record(call_sid, e=status)
+
+    def flush(self, timeout=5.0):
+        # Kuyruktaki her şey diske yazılıp fsync edilene kadar bekle
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    @contextmanager
+    def exclusive(self):
+        """Holds a lock on the journal directory that other processes wait for."""
+        import fcntl  # yalnızca Unix; kurtarma gunicorn worker'ları arasında bir kez yapılsın diye
+        with open(os.path.join(self.directory, "recovery.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def close(self, timeout=5.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="call-journal", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Grup commit: fsync aralığı boyunca gelenleri aynı yazıma topla
+            deadline = time.monotonic() + self.fsync_interval
+            while len(batch) < JOURNAL_MAX_BATCH and batch[-1] is not None \
+                    and not isinstance(batch[-1], threading.Event):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            records = [item for item in batch if isinstance(item, dict)]
+            if records:
+                try:
+                    self._write(records)
+                except OSError as e:
+                    logging.error(f"❌ Call journal write failed, {len(records)} records lost: {e}")
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if batch[-1] is None:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                return
+
+    def _write(self, records):
+        data = "".join(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+                       for record in records).encode("utf-8")
+        if self._fd is None or self._segment_size >= self.segment_bytes:
+            self._rotate()
+        os.write(self._fd, data)
+        _fdatasync(self._fd)
+        self._segment_size += len(data)
+        self.records += len(records)
+        self.fsyncs += 1
+
+    def _rotate(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        # Segment adı açılış zamanı ve yazan süreç; aynı dizini paylaşan worker'lar çakışmasın
+        name = f"journal-{int(time.time() * 1000):015d}-{os.getpid()}.jsonl"
+        path = os.path.join(self.directory, name)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._segment_size = os.fstat(self._fd).st_size
+
+    # Okuma tarafı
+
+    def segments(self, since=None, until=None):
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.startswith("journal-") and name.endswith(".jsonl"))
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if until is not None and int(name[len("journal-"):-len(".jsonl")].split("-")[0]) / 1000 > until:
+                break
+            # Son yazımı aralık başlamadan önceyse segment tamamen eskidir (başka worker'ların segmentlerinden bağımsız)
+            if since is not None and os.path.getmtime(path) < since - 1:
+                continue
+            yield path
+
+    def replay(self, since=None, until=None):
+        # Her segment kendi içinde zaman sırasında; worker'ların segmentleri kayıt zamanına göre birleştirilir.
+        # Aynı andaki kayıtlarda özet ve kapanış, çağrının son kaydı olarak en sona konur
+        return heapq.merge(*(self._read(path, since, until) for path in self.segments(since, until)),
+                           key=lambda record: (record["t"], "s" in record or "e" in record))
+
+    @staticmethod
+    def _read(path, since, until):
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Çökme anında yarım kalmış son satır
+                    logging.warning(f"⚠️ Skipping a torn journal line in {os.path.basename(path)}")
+                    continue
+                if since is not None and record["t"] < since:
+                    continue
+                if until is not None and record["t"] >= until:
+                    continue
+                yield record
+
+    def open_calls(self, since=None):
+        """Calls with messages but no summary and no hang-up yet, as {call_sid: JournalCall}."""
+        calls = {}
+        for record in self.replay(since):
+            call_sid = record["c"]
+            if "s" in record or "e" in record:
+                calls.pop(call_sid, None)
+                continue
+            call = calls.get(call_sid)
+            if call is None:
+                call = calls[call_sid] = JournalCall(call_sid, record["t"])
+            call.observe(record)
+        return calls
+
+
+class JournalCall:
+    __slots__ = ("call_sid", "started", "updated", "caller", "messages")
+
+    def __init__(self, call_sid, started):
+        self.call_sid = call_sid
+        self.started = started
+        self.updated = started
+        self.caller = {}
+        self.messages = []
+
+    def observe(self, record):
+        self.updated = record["t"]
+        if "x" in record:
+            self.caller.update(record["x"])
+        elif "m" in record:
+            self.messages.append(record["m"])
+
+    def complete(self):
+        # Pencere başından sonra başlamış çağrının transcript'i system prompt ile başlar
+        return bool(self.messages) and self.messages[0][0] in "Ss"
+
+    def transcript(self):
+        return [decode_message(data) for data in self.messages]
+
+
+class JournaledSessionStore(SessionStore):
+    """Session store that also appends every message to the call journal."""
+
+    def __init__(self, store, journal):
+        self.store = store
+        self.journal = journal
+
+    def append(self, call_sid, message):
+        index = self.store.append(call_sid, message)
+        self.journal.message(call_sid, message)
+        return index
+
+    def append_at(self, call_sid, index, message):
+        if not self.store.append_at(call_sid, index, message):
+            return False
+        self.journal.message(call_sid, message)
+        return True
+
+    def get(self, call_sid):
+        return self.store.get(call_sid)
+
+    def __contains__(self, call_sid):
+        return call_sid in self.store
+
+    def delete(self, call_sid):
+        self.store.delete(call_sid)
+
+
+def create_journal(directory=None):
+    directory = directory if directory is not None else JOURNAL_DIR
+    if not directory:
+        return None
+    journal = CallJournal(directory)
+    atexit.register(journal.close)
+    return journal
+
+
+# Dışa aktarma
+
+def export_calls(journal, since=None, until=None):
+    """Yields one row per call; only calls still open at that point of the journal are held in memory."""
+    calls = {}
+
+    def row(call, ended=None, status=None):
+        analyzer = ConversationAnalyzer()
+        for data in call.messages:
+            if data[0] == "u":
+                analyzer.observe(data[1:])
+        caller = call.caller
+        return {
+            "call_sid": call.call_sid,
+            "started": _iso(call.started),
+            "ended": _iso(ended) if ended else "",
+            "status": status or "open",
+            "from_number": caller.get("From", ""),
+            "location": f"{caller.get('CallerCity') or ''}, {caller.get('CallerState') or ''}".strip(", "),
+            "messages": sum(1 for data in call.messages if data[0] in "ua"),
+            **analyzer.metadata(),
+        }
+
+    for record in journal.replay(since, until):
+        call_sid = record["c"]
+        call = calls.get(call_sid)
+        if call is None:
+            if "e" in record:
+                # Özeti zaten yazılmış çağrının Twilio kapanış bildirimi
+                continue
+            call = calls[call_sid] = JournalCall(call_sid, record["t"])
+        if "s" in record or "e" in record:
+            # Özet (ya da konuşmadan kapanma) çağrının son kaydıdır; satırı hemen yaz
+            yield row(calls.pop(call_sid), record["t"], record.get("s") or record["e"])
+            continue
+        call.observe(record)
+    for call in calls.values():
+        yield row(call)
+
+
+def export_messages(journal, since=None, until=None):
+    for record in journal.replay(since, until):
+        data = record.get("m")
+        # System prompt'lar kısa anahtarla saklanır ve dışa aktarılmaz
+        if data is None or data[0] not in "ua":
+            continue
+        message = decode_message(data)
+        yield {"call_sid": record["c"], "time": _iso(record["t"]), "role": message["role"],
+               "content": message["content"]}
+
+
+def write_rows(rows, columns, out, fmt):
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+    elif fmt == "jsonl":
+        for row in rows:
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+    elif fmt == "parquet":
+        _write_parquet(rows, columns, out)
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+
+def _write_parquet(rows, columns, out, batch_rows=10000):
+    import pyarrow as pa  # opsiyonel bağımlılık
+    import pyarrow.parquet as pq
+
+    # Satırlar row group'lar halinde yazılır; bellekte en fazla bir grup tutulur
+    writer = None
+    batch = []
+
+    def flush():
+        nonlocal writer
+        table = pa.Table.from_pylist(batch)
+        if writer is None:
+            writer = pq.ParquetWriter(out, table.schema)
+        writer.write_table(table)
+        batch.clear()
+
+    for row in rows:
+        batch.append({column: row[column] for column in columns})
+        if len(batch) >= batch_rows:
+            flush()
+    if batch or writer is None:
+        flush()
+    writer.close()
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="seconds")
+
+
+def _timestamp(day):
+    return datetime.fromisoformat(day).replace(tzinfo=timezone.utc).timestamp() if day else None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--dir", default=JOURNAL_DIR or "journal")
+    parser.add_argument("--since", help="ISO date or time (UTC), inclusive")
+    parser.add_argument("--until", help="ISO date or time (UTC), exclusive")
+    parser.add_argument("--messages", action="store_true", help="one row per message instead of per call")
+    parser.add_argument("--format", default="csv", choices=["csv", "jsonl", "parquet"])
+    parser.add_argument("--output", help="file to write; stdout by default (not for parquet)")
+    args = parser.parse_args()
+
+    journal = CallJournal(args.dir)
+    since, until = _timestamp(args.since), _timestamp(args.until)
+    if args.messages:
+        rows, columns = export_messages(journal, since, until), MESSAGE_COLUMNS
+    else:
+        rows, columns = export_calls(journal, since, until), CALL_COLUMNS
+    if args.format == "parquet":
+        if not args.output:
+            parser.error("--output is required for parquet")
+        write_rows(rows, columns, args.output, args.format)
+    elif args.output:
+        with open(args.output, "w", newline="", encoding="utf-8") as out:
+            write_rows(rows, columns, out, args.format)
+    else:
+        write_rows(rows, columns, sys.stdout, args.format)
+
+
+if __name__ == "__main__":
+    main()
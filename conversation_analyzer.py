@@ -0,0 +1,134 @@
+import re
+
+NOT_PROVIDED = "Not Provided"
+NOT_IDENTIFIED = "Not Identified"
+
+# Öncelik sırasına göre: ilk eşleşen etiket kazanır
+CALL_TYPE_KEYWORDS = [
+    ("Complaint", ["problem", "problème", "issue"]),
+    ("Request", ["request", "demande", "exchange"]),
+    ("Suggestion", ["suggestion", "avis", "proposition"]),
+]
+
+PLATFORM_KEYWORDS = [
+    ("Amazon", ["amazon"]),
+    ("Walmart", ["walmart"]),
+    ("Neatliner Website", ["website", "neatliner.com"]),
+    ("Physical Store", ["store", "in store"]),
+    ("Online (unspecified)", ["online"]),
+]
+
+_KEYWORD_LABELS = {}
+for _label, _words in CALL_TYPE_KEYWORDS + PLATFORM_KEYWORDS:
+    for _word in _words:
+        _KEYWORD_LABELS[_word] = _label
+
+# Tüm anahtar kelimeler tek bir regex'te; lookahead çakışan eşleşmeleri de yakalar
+_KEYWORD_RE = re.compile(
+    "(?=(" + "|".join(re.escape(word) for word in sorted(_KEYWORD_LABELS, key=len, reverse=True)) + "))"
+)
+
+_EMAIL_RE = re.compile(r"\b[\w\.-]+@[\w\.-]+\.\w+\b")
+_WHITESPACE_RE = re.compile(r"\s+")
+_DOT_BEFORE_AT_RE = re.compile(r"\.(?=[^@]*@)")
+_ORDER_NUMBER_RE = re.compile(r"(\d{3})[-]?(\d{7})[-]?(\d{7})")
+
+
+def parse_email(text):
+    content = text.lower()
+
+    # Dönüşümler
+    content = content.replace(" at ", "@")
+    content = content.replace("arobase", "@")
+    content = content.replace(" dot ", ".").replace(" point ", ".")
+    content = _WHITESPACE_RE.sub("", content)     # boşlukları kaldır
+    content = _DOT_BEFORE_AT_RE.sub("", content)  # @ işaretinden önceki . karakterlerini kaldır
+    content = content.strip(" .")                 # baştaki/sondaki nokta ve boşlukları kaldır
+
+    # E-mail yakala
+    matches = _EMAIL_RE.findall(content)
+    if matches:
+        return matches[-1].lower()  # her ihtimale karşı küçük harfe çevir
+    return None
+
+
+def parse_order_number(text):
+    spoken = text.lower()
+
+    # Konuşma biçimlerini normalize et
+    spoken = spoken.replace(" dash ", "-").replace(" tiré ", "-").replace(" hyphen ", "-")
+
+    # Fazla boşlukları sil, çizgi formatına yaklaştır
+    spoken = _WHITESPACE_RE.sub("", spoken)
+
+    # Order number formatını yakala: 702-1234567-9876543
+    match = _ORDER_NUMBER_RE.search(spoken)
+    if match:
+        return f"{match.group(1)}-{match.group(2)}-{match.group(3)}"
+    return None
+
+
+def match_keywords(text):
+    return {_KEYWORD_LABELS[match.group(1)] for match in _KEYWORD_RE.finditer(text.lower())}
+
+
+class ConversationAnalyzer:
+    """Call metadata maintained incrementally from the user's messages.
+
+    Each user message is scanned once when it arrives; call type, platform,
+    email and order number are then read from the accumulated state.
+    """
+
+    def __init__(self):
+        self.labels = set()
+        self.email = NOT_PROVIDED
+        self.order_number = NOT_PROVIDED
+        self.seen = 0
+
+    def observe(self, text):
+        self.labels |= match_keywords(text)
+        email = parse_email(text)
+        if email:
+            self.email = email
+        order_number = parse_order_number(text)
+        if order_number:
+            self.order_number = order_number
+
+    def fork(self):
+        copy = ConversationAnalyzer()
+        copy.labels = set(self.labels)
+        copy.email = self.email
+        copy.order_number = self.order_number
+        copy.seen = self.seen
+        return copy
+
+    def sync(self, transcript):
+        if len(transcript) < self.seen:
+            self.__init__()
+        for msg in transcript[self.seen:]:
+            if msg["role"] == "user":
+                self.observe(msg["content"])
+        self.seen = len(transcript)
+        return self
+
+    def _first_label(self, keywords, default):
+        for label, _ in keywords:
+            if label in self.labels:
+                return label
+        return default
+
+    @property
+    def call_type(self):
+        return self._first_label(CALL_TYPE_KEYWORDS, NOT_IDENTIFIED)
+
+    @property
+    def platform(self):
+        return self._first_label(PLATFORM_KEYWORDS, NOT_PROVIDED)
+
+    def metadata(self):
+        return {
+            "call_type": self.call_type,
+            "email": self.email,
+            "order_number": self.order_number,
+            "platform": self.platform
+        }
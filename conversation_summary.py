@@ -0,0 +1,62 @@
+import re
+
+SUMMARY_HEADER = ("Summary of the earlier part of this call. The caller already gave these details; "
+                  "do not ask for them again:")
+
+SUMMARIZER_PROMPT = (
+    "You compress customer service call transcripts. In at most three short sentences, state the "
+    "caller's issue or request, what the assistant already asked or told them, and what is still "
+    "open. Keep product names, order numbers and email addresses exactly as written. "
+    "Do not include greetings."
+)
+
+GIST_MAX_CHARS = 400
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def render_summary(metadata, gist):
+    # Yapısal bilgiler analizörden gelir; GPT özeti yalnızca sorunun özeti için
+    lines = [
+        SUMMARY_HEADER,
+        f"- Call type: {metadata['call_type']}",
+        f"- Purchase platform: {metadata['platform']}",
+        f"- Order number: {metadata['order_number']}",
+        f"- Email: {metadata['email']}",
+    ]
+    if gist:
+        lines.append(f"- Conversation so far: {gist}")
+    return "\n".join(lines)
+
+
+def transcript_text(messages):
+    return "\n".join(f"{msg['role'].upper()}: {msg['content'].strip()}"
+                     for msg in messages if msg["role"] in ("user", "assistant"))
+
+
+def summary_request(previous_gist, messages):
+    text = transcript_text(messages)
+    if previous_gist:
+        text = f"Earlier summary: {previous_gist}\n\n{text}"
+    return [
+        {"role": "system", "content": SUMMARIZER_PROMPT},
+        {"role": "user", "content": text},
+    ]
+
+
+def extractive_gist(previous_gist, messages, max_chars=GIST_MAX_CHARS):
+    # GPT'ye ulaşılamazsa arayanın kendi cümleleri; en yenileri sığdığı kadar
+    sentences = []
+    for msg in messages:
+        if msg["role"] == "user":
+            sentences.extend(s for s in _SENTENCE_RE.split(msg["content"].strip()) if s)
+    gist = previous_gist or ""
+    kept = []
+    for sentence in reversed(sentences):
+        if len(gist) + sum(len(s) + 1 for s in kept) + len(sentence) > max_chars:
+            break
+        kept.insert(0, sentence)
+    caller = " ".join(kept)
+    if caller:
+        gist = f"{gist} Caller said: {caller}".strip()
+    return gist[-max_chars:]
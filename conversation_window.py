@@ -0,0 +1,147 @@
+import functools
+from collections import deque
+
+import tiktoken
+
+DEFAULT_MODEL = "gpt-4o"
+# Özetlenmeden ham bırakılan son mesaj sayısı
+KEEP_RECENT = 4
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model=DEFAULT_MODEL):
+    # encoding_for_model dosyaları yükler; model başına yalnızca bir kez çözülür
+    return tiktoken.encoding_for_model(model)
+
+
+def count_tokens(text, model=DEFAULT_MODEL):
+    return len(get_encoding(model).encode(text))
+
+
+@functools.lru_cache(maxsize=64)
+def count_pinned_tokens(text, model=DEFAULT_MODEL):
+    # System prompt'lar her çağrıda aynı; sayımlarını bir kez hesapla
+    return count_tokens(text, model)
+
+
+class Fold:
+    __slots__ = ("messages", "dropped", "entries")
+
+    def __init__(self, messages, dropped, entries):
+        self.messages = messages
+        self.dropped = dropped
+        self.entries = entries
+
+
+class ConversationWindow:
+    """Per-call sliding window over the chat history.
+
+    Each message is encoded once when it enters the window and a running
+    token total is kept, so a turn only pays for the new message. System
+    messages are pinned in front of the window and never evicted, which
+    also keeps the prompt prefix stable between turns.
+
+    With compact_at set, evicted messages are kept aside and, once the
+    window reaches compact_at tokens, the oldest turns can be folded into
+    a summary message pinned right after the system prompt.
+    """
+
+    def __init__(self, max_tokens=1500, model=DEFAULT_MODEL, compact_at=None):
+        self.max_tokens = max_tokens
+        self.model = model
+        self.compact_at = compact_at
+        self.pinned = []
+        self.pinned_tokens = 0
+        self.summary = None
+        self.summary_tokens = 0
+        self.dropped = []
+        self.total_tokens = 0
+        self.seen = 0
+        self._entries = deque()
+
+    def pin(self, message):
+        self.pinned.append(message)
+        self.pinned_tokens += count_pinned_tokens(message["content"], self.model)
+
+    def append(self, message):
+        tokens = count_tokens(message["content"], self.model)
+        self._entries.append((message, tokens))
+        self.total_tokens += tokens
+        # En eski mesajları baştan at (O(1) popleft)
+        while self.total_tokens > self.max_tokens and self._entries:
+            evicted, evicted_tokens = self._entries.popleft()
+            self.total_tokens -= evicted_tokens
+            if self.compact_at is not None:
+                # Özet henüz yetişmediyse atılan mesaj bir sonraki özete girer
+                self.dropped.append(evicted)
+
+    def reset(self):
+        self.pinned = []
+        self.pinned_tokens = 0
+        self.summary = None
+        self.summary_tokens = 0
+        self.dropped = []
+        self.total_tokens = 0
+        self.seen = 0
+        self._entries.clear()
+
+    def sync(self, transcript):
+        if len(transcript) < self.seen:
+            # Oturum süresi dolup yeniden başlatılmış
+            self.reset()
+        # Transcript'e pencereden sonra eklenen mesajları işle
+        for msg in transcript[self.seen:]:
+            if msg["role"] == "system":
+                self.pin(msg)
+            elif msg["role"] in ("user", "assistant"):
+                self.append(msg)
+        self.seen = len(transcript)
+        return self
+
+    def needs_compaction(self, margin=0):
+        if self.compact_at is None or len(self._entries) <= KEEP_RECENT:
+            return bool(self.dropped)
+        return bool(self.dropped) or self.total_tokens + margin >= self.compact_at
+
+    def fold_candidates(self, keep_tokens):
+        # Kalan ham mesajlar keep_tokens'a sığana kadar en eskilerden seç
+        messages = list(self.dropped)
+        remaining = self.total_tokens
+        count = 0
+        for message, tokens in self._entries:
+            if remaining <= keep_tokens or len(self._entries) - count <= KEEP_RECENT:
+                break
+            messages.append(message)
+            remaining -= tokens
+            count += 1
+        return Fold(messages, len(self.dropped), count)
+
+    def fold(self, fold, summary_text):
+        # Özet hazırlanırken pencere sıfırlandıysa ya da değiştiyse uygulama
+        if self.dropped[:fold.dropped] != fold.messages[:fold.dropped]:
+            return False
+        if len(self._entries) < fold.entries:
+            return False
+        for i in range(fold.entries):
+            if self._entries[i][0] is not fold.messages[fold.dropped + i]:
+                return False
+        for _ in range(fold.entries):
+            _, tokens = self._entries.popleft()
+            self.total_tokens -= tokens
+        del self.dropped[:fold.dropped]
+        self.set_summary(summary_text)
+        return True
+
+    def set_summary(self, text):
+        self.summary = {"role": "system", "content": text}
+        self.summary_tokens = count_tokens(text, self.model)
+
+    def messages(self):
+        summary = [self.summary] if self.summary is not None else []
+        return self.pinned + summary + [msg for msg, _ in self._entries]
+
+    def prompt_tokens(self):
+        return self.pinned_tokens + self.summary_tokens + self.total_tokens
+
+    def __len__(self):
+        return len(self.pinned) + (self.summary is not None) + len(self._entries)
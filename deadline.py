@@ -0,0 +1,124 @@
+import asyncio
+import concurrent.futures
+import logging
+import time
+
+import metrics
+
+PRIMARY = "primary"
+HEDGE = "hedge"
+FALLBACK = "fallback"
+
+
+class CompletionDeadline:
+    """Runs a turn's completion inside a latency budget.
+
+    The primary request starts at once. If it has not answered after
+    hedge_after seconds an identical request is sent, and after
+    fallback_after seconds a request to fallback_model; the first
+    successful answer wins and the others are abandoned. A failed request
+    moves the schedule forward instead of waiting. run() returns None when
+    the budget runs out or every request failed, and the caller reprompts.
+    """
+
+    def __init__(self, model, budget, hedge_after=None, fallback_model=None, fallback_after=None):
+        self.model = model
+        self.budget = budget
+        self.hedge_after = hedge_after
+        self.fallback_model = fallback_model
+        self.fallback_after = fallback_after
+
+    def schedule(self):
+        steps = []
+        if self.hedge_after is not None and self.hedge_after < self.budget:
+            steps.append((self.hedge_after, HEDGE, self.model))
+        if self.fallback_model and self.fallback_after is not None and self.fallback_after < self.budget:
+            steps.append((self.fallback_after, FALLBACK, self.fallback_model))
+        return sorted(steps)
+
+    def run(self, request, executor):
+        """request(model, timeout) runs on executor threads and returns the completion."""
+        started = time.monotonic()
+        deadline = started + self.budget
+        steps = self.schedule()
+        pending = {}
+
+        def launch(kind, model):
+            pending[executor.submit(request, model, deadline - time.monotonic())] = kind
+            _launched(kind)
+
+        launch(PRIMARY, self.model)
+        while True:
+            now = time.monotonic()
+            if steps and (not pending or now - started >= steps[0][0]):
+                _, kind, model = steps.pop(0)
+                launch(kind, model)
+                continue
+            if not pending or now >= deadline:
+                break
+            wake = min(deadline, started + steps[0][0]) if steps else deadline
+            done, _ = concurrent.futures.wait(list(pending), timeout=wake - now,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                kind = pending.pop(future)
+                if future.exception() is None:
+                    _abandon(pending)
+                    return _answered(kind, future.result())
+                logging.warning(f"⚠️ {kind} completion failed: {future.exception()}")
+
+        _abandon(pending)
+        return None
+
+    async def run_async(self, request):
+        """Same schedule as run(), with request(model, timeout) a coroutine function."""
+        started = time.monotonic()
+        deadline = started + self.budget
+        steps = self.schedule()
+        pending = {}
+
+        def launch(kind, model):
+            pending[asyncio.ensure_future(request(model, deadline - time.monotonic()))] = kind
+            _launched(kind)
+
+        launch(PRIMARY, self.model)
+        while True:
+            now = time.monotonic()
+            if steps and (not pending or now - started >= steps[0][0]):
+                _, kind, model = steps.pop(0)
+                launch(kind, model)
+                continue
+            if not pending or now >= deadline:
+                break
+            wake = min(deadline, started + steps[0][0]) if steps else deadline
+            done, _ = await asyncio.wait(list(pending), timeout=wake - now,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                kind = pending.pop(task)
+                if task.exception() is None:
+                    _abandon(pending)
+                    return _answered(kind, task.result())
+                logging.warning(f"⚠️ {kind} completion failed: {task.exception()}")
+
+        _abandon(pending)
+        return None
+
+
+def _launched(kind):
+    if kind == HEDGE:
+        metrics.LLM_HEDGES.inc()
+        logging.info("⏱️ Completion is slow, sending a hedged request")
+    elif kind == FALLBACK:
+        logging.info("⏱️ Turn budget nearly used, asking the fallback model")
+
+
+def _answered(kind, completion):
+    metrics.LLM_ANSWERS.inc(label_value=kind)
+    if kind == FALLBACK:
+        metrics.LLM_FALLBACKS.inc(label_value="model")
+    return completion
+
+
+def _abandon(pending):
+    # Çalışmakta olan thread'ler durdurulamaz; timeout'ları bütçe sonunda biter
+    for future in pending:
+        future.cancel()
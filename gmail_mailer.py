@@ -1,39 +1,550 @@
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.utils import getaddresses
+import atexit
+import contextlib
+import itertools
+import json
 import os
+import queue
+import string
+import threading
+import time
 
-def send_email(transcript, call_sid, metadata):
-    sender_email = "neatliner@gmail.com"
-    receiver_email = "seda.soyletir@brightstar-sales.com"
-    password = os.getenv("GMAIL_APP_PASSWORD")
+SENDER_EMAIL = os.getenv("MAIL_FROM", "neatliner@gmail.com")
+RECEIVER_EMAIL = os.getenv("MAIL_TO", "seda.soyletir@brightstar-sales.com")
+# Çağrı türüne göre alıcılar: "Complaint=a@x.com,b@x.com;Request=c@x.com"; eşleşmeyen türler MAIL_TO'ya gider
+MAIL_ROUTES = os.getenv("MAIL_ROUTES", "")
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "1") != "0"
+
+MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", "1"))
+MAIL_QUEUE_SIZE = int(os.getenv("MAIL_QUEUE_SIZE", "100"))
+MAIL_MAX_RETRIES = int(os.getenv("MAIL_MAX_RETRIES", "3"))
+MAIL_RETRY_BACKOFF = float(os.getenv("MAIL_RETRY_BACKOFF", "2.0"))
+# Gmail boşta kalan bağlantıları kapatır; bu süreden sonra bağlantıyı biz kapatalım
+MAIL_IDLE_TIMEOUT = float(os.getenv("MAIL_IDLE_TIMEOUT", "60"))
 
-    subject = f"Neatliner Customer Call Summary (CallSid: {call_sid})"
+# Özet modu: çağrılar alıcı başına biriktirilir, MAIL_DIGEST_SIZE çağrıda veya MAIL_DIGEST_WINDOW saniyede bir tek e-posta
+MAIL_DIGEST = os.getenv("MAIL_DIGEST", "0") == "1"
+MAIL_DIGEST_SIZE = int(os.getenv("MAIL_DIGEST_SIZE", "25"))
+MAIL_DIGEST_WINDOW = float(os.getenv("MAIL_DIGEST_WINDOW", "900"))
+# Bekleyen özetler bu dizine de yazılır; süreç öldürülürse bir sonraki açılışta gönderilir
+MAIL_DIGEST_SPOOL = os.getenv("MAIL_DIGEST_SPOOL") or (
+    os.path.join(os.getenv("JOURNAL_DIR"), "mail") if os.getenv("JOURNAL_DIR") else "")
+# Bu türlerdeki çağrılar özet modunda da beklemeden tek tek gönderilir
+MAIL_URGENT_TYPES = os.getenv("MAIL_URGENT_TYPES", "Complaint")
+# summary_subject.txt, summary.txt, digest_subject.txt, digest.txt, digest_entry.txt varsayılanların yerine geçer
+MAIL_TEMPLATE_DIR = os.getenv("MAIL_TEMPLATE_DIR", "")
 
-    body = f"""Neatliner Customer Service – Call Summary
+SUMMARY_FIELDS = {"call_sid", "call_type", "from_number", "location", "email", "order_number", "platform",
+                  "call_status", "status", "transcript", "received"}
+DIGEST_FIELDS = {"count", "types", "first", "last", "entries"}
 
-📌 Call Type: {metadata.get("call_type", "Not Identified")}
-📞 Caller Number: {metadata.get("from_number", "Unknown")}
-🌍 Location: {metadata.get("location", "Unknown")}
-📧 Email Address: {metadata.get("email", "Not Provided")}
-🛒 Order Number: {metadata.get("order_number", "Not Provided")}
-📦 Platform: {metadata.get("platform", "Not Provided")}
+DEFAULT_TEMPLATES = {
+    "summary_subject": ("Neatliner Customer Call Summary (CallSid: {call_sid})", SUMMARY_FIELDS),
+    "summary": ("""Neatliner Customer Service – Call Summary
 
+📌 Call Type: {call_type}
+📞 Caller Number: {from_number}
+🌍 Location: {location}
+📧 Email Address: {email}
+🛒 Order Number: {order_number}
+📦 Platform: {platform}
+{status}
 🎙 Conversation Transcript:
 {transcript}
-"""
+""", SUMMARY_FIELDS),
+    "digest_subject": ("Neatliner Customer Call Digest: {count} calls ({types})", DIGEST_FIELDS),
+    "digest": ("""Neatliner Customer Service – Call Digest
+
+{count} calls between {first} and {last}: {types}.
+Each call's full summary and transcript is attached.
+
+{entries}""", DIGEST_FIELDS),
+    "digest_entry": ("• {received}  {call_type} – {from_number} ({location}), order {order_number}, {platform}\n",
+                     SUMMARY_FIELDS),
+}
+
+
+class Template:
+    """A str.format template parsed once, with its field names checked when it is loaded."""
+
+    _formatter = string.Formatter()
+
+    def __init__(self, name, text, fields):
+        self.parts = []
+        for literal, field, spec, conversion in self._formatter.parse(text):
+            if field is not None and field not in fields:
+                raise ValueError(f"Mail template {name}: unknown field {{{field}}}, expected one of {sorted(fields)}")
+            self.parts.append((literal, field, spec, conversion))
+
+    def render(self, values):
+        out = []
+        for literal, field, spec, conversion in self.parts:
+            out.append(literal)
+            if field is not None:
+                value = values[field]
+                if conversion:
+                    value = self._formatter.convert_field(value, conversion)
+                out.append(format(value, spec) if spec else str(value))
+        return "".join(out)
+
+
+def load_templates(directory=MAIL_TEMPLATE_DIR):
+    templates = {}
+    for name, (text, fields) in DEFAULT_TEMPLATES.items():
+        path = os.path.join(directory, f"{name}.txt") if directory else None
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            if name.endswith("_subject"):
+                text = text.strip()
+        templates[name] = Template(name, text, fields)
+    return templates
+
+
+def parse_addresses(value):
+    return tuple(address.strip() for address in value.split(",") if address.strip())
+
 
+def parse_routes(spec):
+    routes = {}
+    for entry in filter(None, (part.strip() for part in spec.split(";"))):
+        call_type, separator, recipients = entry.partition("=")
+        addresses = parse_addresses(recipients)
+        if not separator or not call_type.strip() or not addresses:
+            raise ValueError(f"Invalid MAIL_ROUTES entry: {entry!r}")
+        routes[call_type.strip()] = addresses
+    return routes
+
+
+# Yönlendirme ve şablonlar import sırasında bir kez derlenir; hatalı yapılandırma ilk çağrıda değil açılışta patlar
+TEMPLATES = load_templates()
+ROUTES = parse_routes(MAIL_ROUTES)
+DEFAULT_RECIPIENTS = parse_addresses(RECEIVER_EMAIL)
+URGENT_TYPES = frozenset(parse_addresses(MAIL_URGENT_TYPES))
+
+
+def recipients_for(metadata):
+    return ROUTES.get(metadata.get("call_type"), DEFAULT_RECIPIENTS)
+
+
+def summary_values(transcript, call_sid, metadata, received=None):
+    call_status = metadata.get("call_status")
+    return {
+        "call_sid": call_sid,
+        "call_type": metadata.get("call_type", "Not Identified"),
+        "from_number": metadata.get("from_number", "Unknown"),
+        "location": metadata.get("location", "Unknown"),
+        "email": metadata.get("email", "Not Provided"),
+        "order_number": metadata.get("order_number", "Not Provided"),
+        "platform": metadata.get("platform", "Not Provided"),
+        "call_status": call_status or "",
+        # Kapanıştan önce kapanan çağrılarda durum satırı eklenir
+        "status": f"📴 Call Status: {call_status}\n" if call_status else "",
+        "transcript": transcript,
+        "received": time.strftime("%H:%M", time.localtime(received or time.time())),
+    }
+
+
+def build_message(transcript, call_sid, metadata):
+    values = summary_values(transcript, call_sid, metadata)
     msg = MIMEMultipart()
-    msg["From"] = sender_email
-    msg["To"] = receiver_email
-    msg["Subject"] = subject
+    msg["From"] = SENDER_EMAIL
+    msg["To"] = ", ".join(recipients_for(metadata))
+    msg["Subject"] = TEMPLATES["summary_subject"].render(values)
+
+    msg.attach(MIMEText(TEMPLATES["summary"].render(values), "plain"))
+    return msg
+
+
+def build_digest(entries, recipients):
+    """One email for a batch of call summaries, each call's full summary attached."""
+    counts = {}
+    for values in entries:
+        counts[values["call_type"]] = counts.get(values["call_type"], 0) + 1
+    digest = {
+        "count": len(entries),
+        "types": ", ".join(f"{count} {call_type}" for call_type, count in counts.items()),
+        "first": entries[0]["received"],
+        "last": entries[-1]["received"],
+        "entries": "".join(TEMPLATES["digest_entry"].render(values) for values in entries),
+    }
+    msg = MIMEMultipart()
+    msg["From"] = SENDER_EMAIL
+    msg["To"] = ", ".join(recipients)
+    msg["Subject"] = TEMPLATES["digest_subject"].render(digest)
+
+    msg.attach(MIMEText(TEMPLATES["digest"].render(digest), "plain"))
+    for values in entries:
+        attachment = MIMEText(TEMPLATES["summary"].render(values), "plain")
+        attachment.add_header("Content-Disposition", "attachment", filename=f"call-{values['call_sid']}.txt")
+        msg.attach(attachment)
+    return msg
+
+
+def recipients_of(msg):
+    return [address for _, address in getaddresses(msg.get_all("To", []))]
+
 
-    msg.attach(MIMEText(body, "plain"))
+def open_smtp_connection():
+    password = os.getenv("GMAIL_APP_PASSWORD")
+    if SMTP_USE_SSL:
+        server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=30)
+    else:
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+    if password:
+        server.login(SENDER_EMAIL, password)
+    return server
+
+
+def send_email(transcript, call_sid, metadata):
+    msg = build_message(transcript, call_sid, metadata)
 
     try:
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(sender_email, password)
-            server.sendmail(sender_email, receiver_email, msg.as_string())
+        with open_smtp_connection() as server:
+            server.sendmail(msg["From"], recipients_of(msg), msg.as_string())
         print("Email sent successfully.")
     except Exception as e:
         print(f"Error sending email: {e}")
+
+
+class MailDispatcher:
+    """Sends call summaries from a bounded queue on background threads.
+
+    Each worker keeps one authenticated SMTP connection open and reuses it
+    for consecutive messages, reconnecting when the server drops it. In
+    digest mode summaries are held per recipient list and sent as one
+    email once digest_size calls are held or digest_window seconds after
+    the first; calls of an urgent type are still sent on their own.
+
+    With a spool directory every held summary is also written to this
+    process's file there until its digest is delivered. Files left by a
+    process that died (their lock is free) are taken over at start().
+    """
+
+    def __init__(self, workers=MAIL_WORKERS, max_queue=MAIL_QUEUE_SIZE,
+                 max_retries=MAIL_MAX_RETRIES, backoff=MAIL_RETRY_BACKOFF,
+                 idle_timeout=MAIL_IDLE_TIMEOUT, connect=open_smtp_connection,
+                 digest=MAIL_DIGEST, digest_size=MAIL_DIGEST_SIZE, digest_window=MAIL_DIGEST_WINDOW,
+                 urgent_types=URGENT_TYPES, spool=MAIL_DIGEST_SPOOL):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.connect = connect
+        self.digest = digest
+        self.digest_size = digest_size
+        self.digest_window = digest_window
+        self.urgent_types = urgent_types
+        self.spool = spool if digest else ""
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.digests = 0
+        # Acil türler kuyrukta bekleyen özetlerin ve diğer çağrıların önüne geçer
+        self._queue = queue.PriorityQueue(maxsize=max_queue)
+        self._order = itertools.count()
+        self._threads = []
+        self._lock = threading.Lock()
+        # Alıcı listesi -> (ilk çağrının zamanı, bekleyen özetler, spool kimlikleri)
+        self._batches = {}
+        self._held = 0
+        self._batch_cond = threading.Condition()
+        self._stopping = False
+        # Spool kimliği -> (alıcılar, özet); teslim edilene kadar dosyada tutulur
+        self._spooled = {}
+        self._spool_ids = itertools.count()
+        self._spool_file = None
+        self._spool_path = None
+        self._spool_lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping = False
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"mail-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            if self.digest:
+                thread = threading.Thread(target=self._run_digests, name="mail-digest", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            if self.spool and self._spool_file is None:
+                self._open_spool()
+
+    def enqueue(self, transcript, call_sid, metadata):
+        self.start()
+        urgent = metadata.get("call_type") in self.urgent_types
+        if self.digest and not urgent:
+            self._hold(recipients_for(metadata), summary_values(transcript, call_sid, metadata))
+            return True
+        return self._put(build_message(transcript, call_sid, metadata), 1, f"summary for {call_sid}", urgent)
+
+    def pending(self):
+        return self._queue.unfinished_tasks + self._held
+
+    def flush_digests(self):
+        # Bekleyen tüm özetleri pencerenin dolmasını beklemeden kuyruğa koy
+        with self._batch_cond:
+            batches, self._batches = self._batches, {}
+        for recipients, (_, entries, ids) in batches.items():
+            self._send_digest(recipients, entries, ids)
+
+    def _put(self, msg, calls, label, urgent=False, delivered=None):
+        try:
+            self._queue.put_nowait((0 if urgent else 1, next(self._order), msg, delivered))
+            return True
+        except queue.Full:
+            self.dropped += calls
+            print(f"Mail queue full, {label} dropped.")
+            return False
+
+    def _hold(self, recipients, values, spool_id=None):
+        if spool_id is None and self._spool_file is not None:
+            spool_id = self._spool(recipients, values)
+        full = None
+        with self._batch_cond:
+            _, entries, ids = self._batches.setdefault(recipients, (time.monotonic(), [], []))
+            entries.append(values)
+            ids.append(spool_id)
+            self._held += 1
+            if len(entries) >= self.digest_size:
+                full = self._batches.pop(recipients)
+            elif len(entries) == 1:
+                self._batch_cond.notify()
+        if full is not None:
+            self._send_digest(recipients, full[1], full[2])
+
+    def _send_digest(self, recipients, entries, ids):
+        msg = build_digest(entries, recipients)
+        with self._batch_cond:
+            self._held -= len(entries)
+        # Spool'dan yalnızca SMTP sunucusu kabul edince silinir
+        delivered = (lambda: self._unspool(ids)) if self._spool_file is not None else None
+        if self._put(msg, len(entries), f"digest of {len(entries)} calls", delivered=delivered):
+            self.digests += 1
+
+    def _open_spool(self):
+        import fcntl  # yalnızca Unix
+        os.makedirs(self.spool, exist_ok=True)
+        path = os.path.join(self.spool, f"digest-{os.getpid()}.jsonl")
+        own = open(path, "a+", encoding="utf-8")
+        fcntl.flock(own, fcntl.LOCK_EX)
+        own.seek(0)
+        # Aynı pid'li ölmüş bir süreçten kalanlar da devralınır
+        adopted = [line for line in own if line.strip()]
+        self._spool_file, self._spool_path = own, path
+        orphans = []
+        for name in sorted(os.listdir(self.spool)):
+            other = os.path.join(self.spool, name)
+            if other == path or not (name.startswith("digest-") and name.endswith(".jsonl")):
+                continue
+            try:
+                f = open(other, encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            try:
+                # Kilit alınabiliyorsa dosyanın sahibi ölmüş demektir
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue
+            # Başka bir süreç bu dosyayı devralıp silmiş ya da yeniden yazıp yerine koymuş olabilir
+            if os.fstat(f.fileno()).st_nlink == 0:
+                f.close()
+                continue
+            adopted.extend(line for line in f if line.strip())
+            orphans.append(f)
+        held = []
+        with self._spool_lock:
+            for line in adopted:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Çökme anında yarım kalmış son satır
+                    continue
+                spool_id = next(self._spool_ids)
+                self._spooled[spool_id] = (tuple(entry["r"]), entry["v"])
+                held.append((spool_id, tuple(entry["r"]), entry["v"]))
+            self._rewrite_spool()
+        for f in orphans:
+            # Girdiler artık kendi dosyamızda; silinip kilit bırakılır
+            os.unlink(f.name)
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(f.name + ".tmp")
+            f.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path + ".tmp")
+        for spool_id, recipients, values in held:
+            self._hold(recipients, values, spool_id)
+        if held:
+            print(f"Mail spool: {len(held)} held summaries taken over from a previous process.")
+
+    def _spool(self, recipients, values):
+        with self._spool_lock:
+            spool_id = next(self._spool_ids)
+            self._spooled[spool_id] = (recipients, values)
+            self._spool_file.write(json.dumps({"r": list(recipients), "v": values}, ensure_ascii=False) + "\n")
+            self._sync_spool()
+        return spool_id
+
+    def _unspool(self, ids):
+        with self._spool_lock:
+            for spool_id in ids:
+                self._spooled.pop(spool_id, None)
+            self._rewrite_spool()
+
+    def _rewrite_spool(self):
+        # Yerinde kesip yeniden yazmak arada çökünce tutulan tüm özetleri kaybettirir; yeni içerik
+        # yanına yazılıp kilitlenir ve eski dosyanın yerine geçer
+        import fcntl
+        fresh = open(self._spool_path + ".tmp", "w", encoding="utf-8")
+        fcntl.flock(fresh, fcntl.LOCK_EX)
+        for recipients, values in self._spooled.values():
+            fresh.write(json.dumps({"r": list(recipients), "v": values}, ensure_ascii=False) + "\n")
+        fresh.flush()
+        os.fsync(fresh.fileno())
+        os.replace(fresh.name, self._spool_path)
+        directory = os.open(self.spool, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        # Eski dosyanın kilidi ancak yenisi yerine geçtikten sonra bırakılır
+        self._spool_file.close()
+        self._spool_file = fresh
+
+    def _sync_spool(self):
+        self._spool_file.flush()
+        os.fsync(self._spool_file.fileno())
+
+    def _close_spool(self):
+        with self._spool_lock:
+            f, self._spool_file = self._spool_file, None
+            if f is None:
+                return
+            # Teslim edilemeyenler dosyada kalır; bir sonraki açılış yeniden dener
+            if not self._spooled:
+                os.unlink(self._spool_path)
+            f.close()
+
+    def _run_digests(self):
+        while True:
+            with self._batch_cond:
+                while not self._stopping:
+                    now = time.monotonic()
+                    due = [recipients for recipients, (opened, _, _) in self._batches.items()
+                           if now - opened >= self.digest_window]
+                    if due:
+                        break
+                    oldest = min((opened for opened, _, _ in self._batches.values()), default=None)
+                    self._batch_cond.wait(None if oldest is None else oldest + self.digest_window - now)
+                if self._stopping:
+                    return
+                batches = [(recipients, self._batches.pop(recipients)) for recipients in due]
+            for recipients, (_, entries, ids) in batches:
+                self._send_digest(recipients, entries, ids)
+
+    def flush(self, timeout=None):
+        # Kuyruktaki tüm e-postalar gönderilene (veya vazgeçilene) kadar bekle
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=30):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        if not threads:
+            return True
+        workers = [thread for thread in threads if thread.name != "mail-digest"]
+        with self._batch_cond:
+            self._stopping = True
+            self._batch_cond.notify_all()
+        for thread in threads:
+            if thread not in workers:
+                thread.join(timeout=5)
+        # Kapanırken eldeki özetler pencere dolmadan gönderilir
+        self.flush_digests()
+        flushed = self.flush(timeout)
+        for _ in workers:
+            self._queue.put((2, next(self._order), None, None))
+        for thread in workers:
+            thread.join(timeout=5)
+        self._close_spool()
+        return flushed
+
+    def _run(self):
+        server = None
+        while True:
+            try:
+                _, _, msg, delivered = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                server = self._close(server)
+                continue
+            if msg is None:
+                self._queue.task_done()
+                self._close(server)
+                return
+            try:
+                server = self._deliver(server, msg, delivered)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, server, msg, delivered=None):
+        payload = msg.as_string()
+        attempt = 0
+        while True:
+            try:
+                if server is None:
+                    server = self.connect()
+                server.sendmail(msg["From"], recipients_of(msg), payload)
+                self.sent += 1
+                print(f"Email sent successfully: {msg['Subject']}")
+                if delivered is not None:
+                    delivered()
+                return server
+            except smtplib.SMTPServerDisconnected:
+                # Yeniden kullanılan bağlantı sunucu tarafından kapatılmış; hemen yeniden bağlan
+                server = None
+                if attempt == 0:
+                    attempt += 1
+                    continue
+                error = "server disconnected"
+            except (smtplib.SMTPException, OSError) as e:
+                server = self._close(server)
+                error = e
+            if attempt >= self.max_retries:
+                self.failed += 1
+                print(f"Error sending email: {error}")
+                return server
+            time.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
+
+    @staticmethod
+    def _close(server):
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                pass
+        return None
+
+
+dispatcher = MailDispatcher()
+atexit.register(dispatcher.shutdown)
+
+
+def enqueue_email(transcript, call_sid, metadata):
+    return dispatcher.enqueue(transcript, call_sid, metadata)
@@ -0,0 +1,318 @@
+"""Twilio Media Streams: caller audio over a WebSocket, end of speech detected locally.
+
+Twilio sends 20 ms frames of 8 kHz μ-law audio as base64 in JSON "media"
+messages. Each frame is decoded straight into a preallocated PCM ring,
+and an energy VAD with an adaptive noise floor decides when the caller
+has stopped talking, usually a few hundred milliseconds after the last
+word instead of <Gather>'s five second timeout. The utterance then goes
+to the speech-to-text backend and the same turn logic as /webhook, and
+the reply is synthesized, encoded back to μ-law and sent on the socket.
+"""
+import asyncio
+import base64
+import functools
+import json
+import logging
+import os
+import time
+
+import metrics
+import twiml
+
+SAMPLE_RATE = 8000
+FRAME_MS = 20
+VAD_START_MS = int(os.getenv("VAD_START_MS", "60"))
+VAD_END_MS = int(os.getenv("VAD_END_MS", "600"))
+VAD_MAX_UTTERANCE_MS = int(os.getenv("VAD_MAX_UTTERANCE_MS", "15000"))
+# Konuşma eşiği: gürültü tabanının VAD_RATIO katı enerji, en az VAD_MIN_RMS
+VAD_RATIO = float(os.getenv("VAD_RATIO", "8"))
+VAD_MIN_RMS = int(os.getenv("VAD_MIN_RMS", "300"))
+NOISE_ADAPT = 0.05
+# Gürültü tabanı akışın ilk 200 ms'sindeki en sessiz kareden başlar; hat baştan gürültülüyse yanlış başlangıç olmaz
+CALIBRATION_MS = 200
+PREROLL_MS = 200
+TAIL_MS = 100
+# Cevap sesi Twilio'ya 1 saniyelik parçalar halinde gönderilir
+SEND_CHUNK = SAMPLE_RATE
+
+START = "start"
+END = "end"
+
+
+def _ulaw_decode(byte):
+    byte = ~byte & 0xFF
+    exponent = (byte >> 4) & 0x07
+    magnitude = ((((byte & 0x0F) << 3) + 0x84) << exponent) - 0x84
+    return -magnitude if byte & 0x80 else magnitude
+
+
+def _ulaw_encode(sample):
+    # G.711: 14 bit büyüklük, bias 33, 8 segment
+    sample >>= 2
+    mask = 0x7F if sample < 0 else 0xFF
+    sample = min(abs(sample), 8159) + 33
+    segment = sample.bit_length() - 6
+    if segment > 7:
+        return 0x7F ^ mask
+    return ((segment << 4) | ((sample >> (segment + 1)) & 0x0F)) ^ mask
+
+
+ULAW_TO_PCM = [_ulaw_decode(byte) for byte in range(256)]
+# μ-law baytından PCM16'nın düşük ve yüksek baytına; bytes.translate ile örnek başına Python döngüsü olmadan çözülür
+_PCM_LOW = bytes(value & 0xFF for value in ULAW_TO_PCM)
+_PCM_HIGH = bytes((value >> 8) & 0xFF for value in ULAW_TO_PCM)
+_ENERGY = tuple(value * value for value in ULAW_TO_PCM)
+
+
+@functools.lru_cache(maxsize=1)
+def _encode_table():
+    # İşaretsiz 16 bit örnek -> μ-law; ilk cevapta bir kez kurulur
+    return bytes(_ulaw_encode(value - 65536 if value >= 32768 else value) for value in range(65536))
+
+
+def pcm_to_ulaw(pcm):
+    samples = memoryview(pcm).cast("H")
+    return bytes(map(_encode_table().__getitem__, samples))
+
+
+def frame_energy(frame):
+    return sum(map(_ENERGY.__getitem__, frame)) / len(frame)
+
+
+class PcmRing:
+    """Preallocated ring of 16-bit PCM that μ-law frames are decoded into."""
+
+    def __init__(self, seconds):
+        self.capacity = int(seconds * SAMPLE_RATE)
+        self.data = bytearray(2 * self.capacity)
+        self.written = 0
+
+    def write_ulaw(self, frame):
+        count = len(frame)
+        low, high = frame.translate(_PCM_LOW), frame.translate(_PCM_HIGH)
+        start = self.written % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[2 * start:2 * (start + first):2] = low[:first]
+        self.data[2 * start + 1:2 * (start + first):2] = high[:first]
+        if first < count:
+            self.data[0:2 * (count - first):2] = low[first:]
+            self.data[1:2 * (count - first):2] = high[first:]
+        self.written += count
+
+    def read(self, start, end):
+        """PCM bytes of samples [start, end) counted from the start of the stream."""
+        start = max(start, self.written - self.capacity, 0)
+        end = min(end, self.written)
+        if start >= end:
+            return b""
+        first, last = start % self.capacity, end % self.capacity
+        if first < last or last == 0:
+            return bytes(self.data[2 * first:2 * (last or self.capacity)])
+        return bytes(self.data[2 * first:]) + bytes(self.data[:2 * last])
+
+
+class VoiceActivityDetector:
+    """Energy VAD over fixed-length frames.
+
+    A frame is voiced when its mean energy is above both VAD_MIN_RMS² and
+    ratio times the noise floor, which is measured over the first
+    CALIBRATION_MS and then follows the energy of unvoiced frames. Speech
+    starts after start_ms of voiced frames in a row, so clicks do not
+    count, and ends after end_ms without a voiced frame or after max_ms.
+    """
+
+    def __init__(self, start_ms=VAD_START_MS, end_ms=VAD_END_MS, max_ms=VAD_MAX_UTTERANCE_MS,
+                 ratio=VAD_RATIO, min_rms=VAD_MIN_RMS, frame_ms=FRAME_MS):
+        self.start_frames = max(1, start_ms // frame_ms)
+        self.end_frames = max(1, end_ms // frame_ms)
+        self.max_frames = max_ms // frame_ms
+        self.ratio = ratio
+        self.min_energy = float(min_rms * min_rms)
+        self.noise = self.min_energy / ratio
+        self.calibration = max(1, CALIBRATION_MS // frame_ms)
+        self.calibrated = 0
+        self.quietest = None
+        self.speaking = False
+        self.voiced_run = 0
+        self.silent_run = 0
+        self.frames = 0
+
+    def process(self, energy):
+        """START, END or None for the next frame."""
+        if self.calibrated < self.calibration:
+            self.calibrated += 1
+            self.noise = energy if self.calibrated == 1 else min(self.noise, energy)
+            return None
+        voiced = energy > self.min_energy and energy > self.noise * self.ratio
+        if not self.speaking:
+            if voiced:
+                self.voiced_run += 1
+                if self.voiced_run >= self.start_frames:
+                    self.speaking = True
+                    self.frames = self.voiced_run
+                    self.silent_run = 0
+                    self.quietest = energy
+                    return START
+            else:
+                self.voiced_run = 0
+                self.noise += (energy - self.noise) * NOISE_ADAPT
+            return None
+        self.frames += 1
+        self.quietest = min(self.quietest, energy)
+        self.silent_run = 0 if voiced else self.silent_run + 1
+        if self.silent_run >= self.end_frames or self.frames >= self.max_frames:
+            if self.silent_run < self.end_frames:
+                # Sessizlik hiç gelmedi: gürültü yükselmiş olabilir, taban en sessiz kareye çekilir
+                self.noise = max(self.noise, self.quietest)
+            self.speaking = False
+            self.voiced_run = 0
+            return END
+        return None
+
+
+@functools.lru_cache(maxsize=128)
+def speech_ulaw(backend, text, voice, language):
+    # Betikli cümleler tekrar tekrar söylenir; sentez ve kodlama bir kez yapılır
+    return pcm_to_ulaw(backend.pcm(text, voice, language))
+
+
+class MediaStream:
+    """One Media Streams connection: caller audio in, replies out on the same socket.
+
+    on_speech(call_sid, text, lang, caller) and on_digits(call_sid,
+    digits, lang) are coroutines returning the reply text; turns run one
+    at a time in the order the caller finished them.
+    """
+
+    def __init__(self, send, on_speech, on_digits, stt, tts, vad=None):
+        self.send = send
+        self.on_speech = on_speech
+        self.on_digits = on_digits
+        self.stt = stt
+        self.tts = tts
+        self.vad = vad or VoiceActivityDetector()
+        self.ring = PcmRing((VAD_MAX_UTTERANCE_MS + PREROLL_MS + VAD_END_MS) / 1000 + 1)
+        self.stream_sid = None
+        self.call_sid = None
+        self.lang = "en"
+        self.caller = {}
+        self.utterance_start = 0
+        self.frame_samples = SAMPLE_RATE * FRAME_MS // 1000
+        self.last_voiced_frame = 0
+        self.digits = ""
+        self.expect_digits = False
+        self.playing = None
+        self.closing = False
+        self.replies = 0
+        self.turns = asyncio.Queue()
+        self.worker = None
+        self.stats = {"frames": 0, "frame_seconds": 0.0, "max_frame_seconds": 0.0, "utterances": 0,
+                      "end_of_speech_ms": [], "barge_ins": 0}
+
+    async def handle(self, text):
+        """Processes one WebSocket text message; False once the socket should be closed."""
+        message = json.loads(text)
+        event = message.get("event")
+        if event == "media":
+            if message["media"].get("track", "inbound") == "inbound":
+                await self.audio(base64.b64decode(message["media"]["payload"]))
+        elif event == "start":
+            self.start(message)
+        elif event == "dtmf":
+            self.digit(message["dtmf"]["digit"])
+        elif event == "mark":
+            if message["mark"]["name"] == self.playing:
+                self.playing = None
+                if self.closing:
+                    return False
+        elif event == "stop":
+            return False
+        return True
+
+    def start(self, message):
+        start = message["start"]
+        parameters = start.get("customParameters", {})
+        self.stream_sid = message.get("streamSid") or start.get("streamSid")
+        self.call_sid = start.get("callSid")
+        self.lang = twiml.normalize_lang(parameters.get("lang", "en"))
+        self.caller = {field: parameters.get(field) for field in ("From", "CallerCity", "CallerState")}
+        self.worker = asyncio.create_task(self.run_turns())
+        logging.info(f"🎙️ Media stream {self.stream_sid} started for {self.call_sid} ({self.lang})")
+
+    async def audio(self, frame):
+        started = time.perf_counter()
+        self.ring.write_ulaw(frame)
+        self.frame_samples = len(frame)
+        event = self.vad.process(frame_energy(frame))
+        stats = self.stats
+        stats["frames"] += 1
+        if self.vad.speaking and not self.vad.silent_run:
+            self.last_voiced_frame = stats["frames"]
+        if event == START:
+            lead = (self.vad.start_frames * self.frame_samples) + PREROLL_MS * SAMPLE_RATE // 1000
+            self.utterance_start = self.ring.written - lead
+            if self.playing is not None:
+                # Arayan cevabın üstüne konuştu; Twilio'daki sesi kes
+                stats["barge_ins"] += 1
+                self.playing = None
+                await self.send({"event": "clear", "streamSid": self.stream_sid})
+        elif event == END:
+            silent = max(self.vad.silent_run - TAIL_MS // FRAME_MS, 0)
+            pcm = self.ring.read(self.utterance_start, self.ring.written - silent * self.frame_samples)
+            stats["utterances"] += 1
+            stats["end_of_speech_ms"].append((stats["frames"] - self.last_voiced_frame) * FRAME_MS)
+            self.turns.put_nowait(("speech", pcm, time.perf_counter()))
+        elapsed = time.perf_counter() - started
+        stats["frame_seconds"] += elapsed
+        if elapsed > stats["max_frame_seconds"]:
+            stats["max_frame_seconds"] = elapsed
+
+    def digit(self, digit):
+        if not self.expect_digits:
+            return
+        if digit != "#":
+            self.digits += digit
+            return
+        digits, self.digits = self.digits, ""
+        self.expect_digits = False
+        self.turns.put_nowait(("digits", digits, time.perf_counter()))
+
+    async def run_turns(self):
+        while True:
+            kind, payload, detected = await self.turns.get()
+            try:
+                if kind == "speech":
+                    _, language = twiml.VOICES[self.lang]
+                    text = (await asyncio.to_thread(self.stt.transcribe, payload, SAMPLE_RATE, language)).strip()
+                    if not text:
+                        logging.info("🔇 Utterance had no words, ignoring")
+                        continue
+                    logging.info(f"Caller said: {text}")
+                    reply = await self.on_speech(self.call_sid, text, self.lang, self.caller)
+                else:
+                    logging.info(f"Received DTMF digits: {payload}")
+                    reply = await self.on_digits(self.call_sid, payload, self.lang)
+                await self.say(reply, detected)
+            except Exception as e:
+                logging.error(f"❌ Media stream turn failed for {self.call_sid}: {e}")
+
+    async def say(self, text, detected=None):
+        kind = twiml.classify(text, self.lang)
+        self.expect_digits = kind == twiml.GATHER_DTMF
+        self.closing = kind == twiml.FINAL
+        voice, language = twiml.VOICES[self.lang]
+        audio = await asyncio.to_thread(speech_ulaw, self.tts, text.strip(), voice, language)
+        if detected is not None:
+            metrics.STREAM_REPLY_SECONDS.observe(time.perf_counter() - detected)
+        self.replies += 1
+        name = f"reply-{self.replies}"
+        for offset in range(0, len(audio), SEND_CHUNK):
+            payload = base64.b64encode(audio[offset:offset + SEND_CHUNK]).decode("ascii")
+            await self.send({"event": "media", "streamSid": self.stream_sid, "media": {"payload": payload}})
+        # Twilio mark'ı ses çalınıp bitince geri gönderir
+        await self.send({"event": "mark", "streamSid": self.stream_sid, "mark": {"name": name}})
+        self.playing = name
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
@@ -0,0 +1,219 @@
+import bisect
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+TRACE_DIR = os.getenv("METRICS_TRACE_DIR")
+
+_registry = []
+# Thread başına ve asyncio görevi başına ayrı trace
+_trace = contextvars.ContextVar("metrics_trace", default=None)
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(label_name, label_value, extra=""):
+    parts = []
+    if label_name is not None:
+        parts.append(f'{label_name}="{label_value}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _HistogramChild:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, label=None):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._children = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, label_value=None):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._children.get(label_value)
+            if child is None:
+                child = self._children[label_value] = _HistogramChild(len(self.buckets) + 1)
+            child.counts[index] += 1
+            child.sum += value
+            child.count += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, child in sorted(self._children.items(), key=lambda item: str(item[0])):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                    cumulative += count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.label, label_value, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.label, label_value)} {child.sum}")
+                lines.append(f"{self.name}_count{_labels(self.label, label_value)} {child.count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label=None):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, label_value=None):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def value(self, label_value=None):
+        return self._values.get(label_value, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_value, value in sorted(self._values.items(), key=lambda item: str(item[0])):
+                lines.append(f"{self.name}{_labels(self.label, label_value)} {value}")
+        return lines
+
+
+class Gauge:
+    # Değeri okunurken hesaplanan metrik (kuyruk uzunluğu, başka modüllerin sayaçları)
+    def __init__(self, name, help_text, read, kind="gauge"):
+        self.name = name
+        self.help = help_text
+        self.read = read
+        self.kind = kind
+        _registry.append(self)
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", f"{self.name} {self.read()}"]
+
+
+REQUEST_SECONDS = Histogram("voicebot_request_seconds", "HTTP request latency by route.", label="route")
+STAGE_SECONDS = Histogram("voicebot_stage_seconds", "Time spent in each stage of a turn.", label="stage")
+TURN_SECONDS = Histogram("voicebot_turn_seconds", "Time to produce the assistant reply for a turn.")
+CALL_TURNS = Histogram("voicebot_call_turns", "Caller turns per call.", buckets=COUNT_BUCKETS)
+CALL_LLM_CALLS = Histogram("voicebot_call_llm_calls", "OpenAI calls per call.", buckets=COUNT_BUCKETS)
+CALL_PROMPT_TOKENS = Histogram("voicebot_call_prompt_tokens", "Prompt tokens per call.", buckets=TOKEN_BUCKETS)
+CALL_COMPLETION_TOKENS = Histogram("voicebot_call_completion_tokens", "Completion tokens per call.", buckets=TOKEN_BUCKETS)
+CALL_TALK_SECONDS = Histogram("voicebot_call_talk_latency_seconds", "Total reply latency over a call.",
+                              buckets=(0.5, 1, 2.5, 5, 10, 20, 40, 80, 160))
+TURNS = Counter("voicebot_turns_total", "Caller turns by how they were answered.", label="source")
+TOKENS = Counter("voicebot_tokens_total", "OpenAI tokens used.", label="kind")
+LLM_HEDGES = Counter("voicebot_llm_hedges_total", "Hedged duplicate completions sent.")
+LLM_ANSWERS = Counter("voicebot_llm_answers_total", "Completions used, by the request that answered first.",
+                      label="request")
+LLM_FALLBACKS = Counter("voicebot_llm_fallbacks_total", "Turns answered by a fallback.", label="kind")
+BUSY_CALLS = Counter("voicebot_busy_calls_total", "New calls turned away with the busy message.")
+COMPACTIONS = Counter("voicebot_compactions_total", "Times older turns were folded into the call summary.")
+STREAMED_TURNS = Counter("voicebot_streamed_turns_total", "Turns in streaming mode, answered whole or split after the first sentences.",
+                         label="delivery")
+STREAM_REPLY_SECONDS = Histogram("voicebot_stream_reply_seconds",
+                                 "Media Streams: time from the detected end of speech to the reply audio.")
+FIRST_SENTENCE_SECONDS = Histogram("voicebot_first_sentence_seconds",
+                                   "Time from the caller's turn to the first streamed sentence.")
+
+
+class Trace:
+    __slots__ = ("call_sid", "route", "started", "stages")
+
+    def __init__(self, call_sid, route):
+        self.call_sid = call_sid
+        self.route = route
+        self.started = time.perf_counter()
+        self.stages = {}
+
+
+class stage:
+    """Times a block: stage("llm") adds to the stage histogram and the current trace."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(elapsed, self.name)
+        trace = _trace.get()
+        if trace is not None:
+            trace.stages[self.name] = trace.stages.get(self.name, 0.0) + elapsed
+        return False
+
+
+def begin_trace(call_sid, route):
+    trace = Trace(call_sid, route)
+    _trace.set(trace)
+    return trace
+
+
+def end_trace():
+    trace = _trace.get()
+    _trace.set(None)
+    if trace is None:
+        return None
+    total = time.perf_counter() - trace.started
+    if TRACE_DIR and trace.call_sid:
+        _write_trace(trace, total)
+    return total
+
+
+def _write_trace(trace, total):
+    record = {
+        "call_sid": trace.call_sid,
+        "route": trace.route,
+        "ts": time.time(),
+        "total_ms": round(total * 1000, 3),
+        "stages_ms": {name: round(value * 1000, 3) for name, value in trace.stages.items()},
+    }
+    # CallSid istekten geldiği için dosya adında yalnızca güvenli karakterler kalsın
+    safe_sid = re.sub(r"[^\w-]", "_", trace.call_sid)
+    path = os.path.join(TRACE_DIR, f"{safe_sid}.jsonl")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+def active_trace():
+    return _trace.get()
+
+
+def observe_call(turns, llm_calls, prompt_tokens, completion_tokens, talk_seconds):
+    CALL_TURNS.observe(turns)
+    CALL_LLM_CALLS.observe(llm_calls)
+    CALL_PROMPT_TOKENS.observe(prompt_tokens)
+    CALL_COMPLETION_TOKENS.observe(completion_tokens)
+    CALL_TALK_SECONDS.observe(talk_seconds)
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,377 @@
+import abc
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+SESSION_MAX_CALLS = int(os.getenv("SESSION_MAX_CALLS", "1000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Rol kodları: her mesaj tek karakterlik rol + içerik olarak saklanır
+ROLE_CODES = {"system": "s", "user": "u", "assistant": "a"}
+CODE_ROLES = {code: role for role, code in ROLE_CODES.items()}
+
+# Bilinen system prompt'lar metin yerine kısa bir anahtarla saklanır
+_prompt_refs = {}
+_prompt_texts = {}
+
+
+def register_prompt(key, text):
+    _prompt_refs[text] = key
+    _prompt_texts[key] = text
+
+
+def encode_message(msg):
+    if msg["role"] == "system" and msg["content"] in _prompt_refs:
+        return "S" + _prompt_refs[msg["content"]]
+    code = ROLE_CODES.get(msg["role"])
+    if code is None:
+        return "j" + json.dumps(msg, ensure_ascii=False, separators=(",", ":"))
+    return code + msg["content"]
+
+
+def decode_message(data):
+    code, body = data[0], data[1:]
+    if code == "S":
+        return {"role": "system", "content": _prompt_texts[body]}
+    if code == "j":
+        return json.loads(body)
+    return {"role": CODE_ROLES[code], "content": body}
+
+
+class TTLCache:
+    """Ordered dict with LRU order, idle expiry and an item cap.
+
+    on_evict gets every entry that leaves other than through pop(); if
+    on_overflow is set it gets the entries pushed out by the cap instead,
+    so that hook only ever sees entries that sat idle for ttl.
+    """
+
+    def __init__(self, max_items=SESSION_MAX_CALLS, ttl=SESSION_TTL, on_evict=None, on_overflow=None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.on_overflow = on_overflow
+        self._items = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return default
+            value, touched = entry
+            if time.monotonic() - touched > self.ttl:
+                self._evict(key)
+                return default
+            self._items[key] = (value, time.monotonic())
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (value, time.monotonic())
+            self._items.move_to_end(key)
+            self.expire()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._items.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def expire(self):
+        # LRU sırası sayesinde süresi dolanlar her zaman baştadır
+        with self._lock:
+            now = time.monotonic()
+            while self._items:
+                key, (_, touched) = next(iter(self._items.items()))
+                if now - touched > self.ttl:
+                    self._evict(key)
+                elif len(self._items) > self.max_items:
+                    self._evict(key, overflow=True)
+                else:
+                    break
+
+    def evict_oldest(self, keep=None):
+        with self._lock:
+            for key in self._items:
+                if key != keep:
+                    self._evict(key, overflow=True)
+                    return True
+            return False
+
+    def _evict(self, key, overflow=False):
+        value, _ = self._items.pop(key)
+        hook = self.on_overflow if overflow and self.on_overflow is not None else self.on_evict
+        if hook is not None:
+            hook(key, value)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._items)
+
+
+class SessionStore(abc.ABC):
+    """Transcript storage keyed by CallSid.
+
+    Backends append one message per call to append() instead of rewriting
+    the transcript, so a turn costs the same regardless of call length.
+    """
+
+    def create(self, call_sid, messages):
+        for msg in messages:
+            self.append(call_sid, msg)
+
+    @abc.abstractmethod
+    def append(self, call_sid, message):
+        """Appends one message and returns its index in the transcript."""
+
+    @abc.abstractmethod
+    def append_at(self, call_sid, index, message):
+        """Appends the message only if the transcript has exactly index messages; returns whether it did."""
+
+    @abc.abstractmethod
+    def get(self, call_sid):
+        """Returns the transcript as a list of messages, or None."""
+
+    @abc.abstractmethod
+    def delete(self, call_sid):
+        """Drops the transcript without calling the eviction hook."""
+
+    def __contains__(self, call_sid):
+        return self.get(call_sid) is not None
+
+
+class InMemorySessionStore(SessionStore):
+    """Per-process store capped at max_calls and max_bytes of message text.
+
+    on_evict gets calls that were idle for ttl. Calls pushed out by a cap
+    may still be on the line, so they go to on_overflow instead.
+    """
+
+    def __init__(self, max_calls=SESSION_MAX_CALLS, max_bytes=SESSION_MAX_BYTES, ttl=SESSION_TTL, on_evict=None,
+                 on_overflow=None):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._sizes = {}
+        self._on_evict = on_evict
+        self._on_overflow = on_overflow
+        self._cache = TTLCache(max_items=max_calls, ttl=ttl, on_evict=self._evicted, on_overflow=self._overflowed)
+        self._lock = threading.RLock()
+
+    def _evicted(self, call_sid, messages):
+        self.total_bytes -= self._sizes.pop(call_sid, 0)
+        if self._on_evict is not None:
+            self._on_evict(call_sid, messages)
+
+    def _overflowed(self, call_sid, messages):
+        self.total_bytes -= self._sizes.pop(call_sid, 0)
+        if self._on_overflow is not None:
+            self._on_overflow(call_sid, messages)
+
+    def append(self, call_sid, message):
+        with self._lock:
+            return self._append(call_sid, message)
+
+    def append_at(self, call_sid, index, message):
+        with self._lock:
+            messages = self._cache.get(call_sid)
+            if len(messages or ()) != index:
+                return False
+            self._append(call_sid, message)
+            return True
+
+    def _append(self, call_sid, message):
+        messages = self._cache.get(call_sid)
+        if messages is None:
+            messages = []
+            self._cache.set(call_sid, messages)
+        messages.append(message)
+        # SESSION_MAX_BYTES bayt cinsindendir; aksanlı harfler ve emoji birden fazla bayt tutar
+        size = len(message["content"].encode("utf-8"))
+        self._sizes[call_sid] = self._sizes.get(call_sid, 0) + size
+        self.total_bytes += size
+        # Bellek sınırı aşılırsa en uzun süredir kullanılmayan çağrılardan başlayarak at
+        while self.total_bytes > self.max_bytes and self._cache.evict_oldest(keep=call_sid):
+            pass
+        return len(messages) - 1
+
+    def get(self, call_sid):
+        return self._cache.get(call_sid)
+
+    def delete(self, call_sid):
+        self._cache.pop(call_sid)
+        self.total_bytes -= self._sizes.pop(call_sid, 0)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Shared store for several worker processes on one host.
+
+    Calls idle for longer than ttl are deleted every expire_every appends;
+    on_evict gets each of them with its transcript, in the worker that
+    deleted it.
+    """
+
+    def __init__(self, path, ttl=SESSION_TTL, expire_every=200, on_evict=None):
+        self.path = path
+        self.ttl = ttl
+        self.expire_every = expire_every
+        self.on_evict = on_evict
+        self._appends = 0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    call_sid TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    updated REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    call_sid TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (call_sid, seq)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated);
+            """)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, call_sid, message):
+        return self._append(call_sid, message)
+
+    def append_at(self, call_sid, index, message):
+        return self._append(call_sid, message, index) is not None
+
+    def _append(self, call_sid, message, index=None):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT size FROM sessions WHERE call_sid = ?", (call_sid,)).fetchone()
+            seq = row[0] if row else 0
+            if index is not None and seq != index:
+                # Başka bir worker bu sıraya önce yazdı
+                conn.execute("ROLLBACK")
+                return None
+            conn.execute("INSERT INTO messages (call_sid, seq, data) VALUES (?, ?, ?)",
+                         (call_sid, seq, encode_message(message)))
+            conn.execute("INSERT OR REPLACE INTO sessions (call_sid, size, updated) VALUES (?, ?, ?)",
+                         (call_sid, seq + 1, time.time()))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._appends += 1
+        if self._appends % self.expire_every == 0:
+            self.expire()
+        return seq
+
+    def get(self, call_sid):
+        conn = self._connect()
+        rows = conn.execute("SELECT data FROM messages WHERE call_sid = ? ORDER BY seq", (call_sid,)).fetchall()
+        if not rows:
+            return None
+        return [decode_message(data) for (data,) in rows]
+
+    def __contains__(self, call_sid):
+        row = self._connect().execute("SELECT 1 FROM sessions WHERE call_sid = ?", (call_sid,)).fetchone()
+        return row is not None
+
+    def delete(self, call_sid):
+        conn = self._connect()
+        conn.execute("DELETE FROM messages WHERE call_sid = ?", (call_sid,))
+        conn.execute("DELETE FROM sessions WHERE call_sid = ?", (call_sid,))
+
+    def expire(self):
+        conn = self._connect()
+        cutoff = time.time() - self.ttl
+        expired = {}
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.on_evict is not None:
+                # Silinmeden önce okunur; aynı çağrıyı iki worker birden bildirmesin diye aynı işlemde
+                rows = conn.execute("""
+                    SELECT m.call_sid, m.data FROM messages m JOIN sessions s ON s.call_sid = m.call_sid
+                    WHERE s.updated < ? ORDER BY m.call_sid, m.seq""", (cutoff,)).fetchall()
+                for call_sid, data in rows:
+                    expired.setdefault(call_sid, []).append(decode_message(data))
+            conn.execute("DELETE FROM messages WHERE call_sid IN (SELECT call_sid FROM sessions WHERE updated < ?)",
+                         (cutoff,))
+            conn.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        for call_sid, messages in expired.items():
+            self.on_evict(call_sid, messages)
+
+
+class RedisSessionStore(SessionStore):
+    """Store shared across hosts. Redis expires idle calls itself, so there
+    is no eviction hook; those calls are only summarized through the
+    call-status callback or journal recovery.
+    """
+
+    def __init__(self, url, ttl=SESSION_TTL, prefix="session:"):
+        import redis  # opsiyonel bağımlılık
+
+        self.redis = redis.Redis.from_url(url)
+        self.ttl = int(ttl)
+        self.prefix = prefix
+        # Uzunluk kontrolü ve ekleme tek adımda; worker'lar arasında yarış olmasın
+        self._append_at = self.redis.register_script("""
+            if redis.call('LLEN', KEYS[1]) ~= tonumber(ARGV[1]) then return 0 end
+            redis.call('RPUSH', KEYS[1], ARGV[2])
+            redis.call('EXPIRE', KEYS[1], ARGV[3])
+            return 1
+        """)
+
+    def append(self, call_sid, message):
+        key = self.prefix + call_sid
+        pipe = self.redis.pipeline()
+        pipe.rpush(key, encode_message(message).encode("utf-8"))
+        pipe.expire(key, self.ttl)
+        length, _ = pipe.execute()
+        return length - 1
+
+    def append_at(self, call_sid, index, message):
+        data = encode_message(message).encode("utf-8")
+        return bool(self._append_at(keys=[self.prefix + call_sid], args=[index, data, self.ttl]))
+
+    def get(self, call_sid):
+        key = self.prefix + call_sid
+        rows = self.redis.lrange(key, 0, -1)
+        if not rows:
+            return None
+        self.redis.expire(key, self.ttl)
+        return [decode_message(row.decode("utf-8")) for row in rows]
+
+    def __contains__(self, call_sid):
+        return bool(self.redis.exists(self.prefix + call_sid))
+
+    def delete(self, call_sid):
+        self.redis.delete(self.prefix + call_sid)
+
+
+def create_session_store(url=None, on_evict=None, on_overflow=None):
+    # Redis'te anahtarların süresi sunucuda dolar; on_evict hiç çağrılmaz (bkz. RedisSessionStore)
+    url = url if url is not None else os.getenv("SESSION_STORE", "memory")
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionStore(url[len("sqlite:///"):], on_evict=on_evict)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionStore(url)
+    if url == "memory":
+        return InMemorySessionStore(on_evict=on_evict, on_overflow=on_overflow)
+    raise ValueError(f"Unknown SESSION_STORE: {url}")
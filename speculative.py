@@ -0,0 +1,126 @@
+import difflib
+import re
+import threading
+import time
+
+_NORMALIZE_RE = re.compile(r"[^\w@']+")
+
+
+def normalize(text):
+    return _NORMALIZE_RE.sub(" ", text.lower()).strip()
+
+
+def similarity(a, b):
+    if a == b:
+        return 1.0
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+class Speculation:
+    __slots__ = ("text", "future", "started", "finished")
+
+    def __init__(self, text):
+        self.text = text
+        self.future = None
+        self.started = time.monotonic()
+        self.finished = None
+
+
+class SpeculativeCompletions:
+    """Starts a completion from Twilio's partial speech results.
+
+    A partial is considered stable once the same text has been reported
+    stable_repeats times in a row. When the final SpeechResult arrives,
+    claim() hands back the speculation if the final text is close enough,
+    otherwise it is cancelled and the caller recomputes.
+
+    A discarded speculation that already reached OpenAI keeps running until
+    the request returns, so at most max_inflight of them run per call; new
+    stable partials are skipped until one finishes.
+    """
+
+    def __init__(self, executor, stable_repeats=2, min_chars=8, match_threshold=0.9, max_inflight=2):
+        self.executor = executor
+        self.stable_repeats = stable_repeats
+        self.min_chars = min_chars
+        self.match_threshold = match_threshold
+        self.max_inflight = max_inflight
+        self.stats = {"started": 0, "hits": 0, "misses": 0, "discarded": 0, "skipped": 0, "saved_seconds": 0.0}
+        self._partials = {}
+        self._inflight = {}
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def observe_partial(self, call_sid, text, compute):
+        norm = normalize(text)
+        with self._lock:
+            previous, count = self._partials.get(call_sid, (None, 0))
+            count = count + 1 if norm == previous else 1
+            self._partials[call_sid] = (norm, count)
+            if count < self.stable_repeats or len(norm) < self.min_chars:
+                return False
+            current = self._inflight.get(call_sid)
+            if current is not None and current.text == norm:
+                return False
+            if self._running.get(call_sid, 0) >= self.max_inflight:
+                # Bırakılan tahminler hâlâ OpenAI'da; yenisi kota ve maliyet demek
+                self.stats["skipped"] += 1
+                return False
+            if current is not None:
+                # Kısmi sonuç değişti; eski tahmini bırak
+                self._discard(current, call_sid)
+            speculation = Speculation(norm)
+
+            def run():
+                try:
+                    return compute(text)
+                finally:
+                    speculation.finished = time.monotonic()
+                    with self._lock:
+                        self._finish(call_sid)
+
+            speculation.future = self.executor.submit(run)
+            self._inflight[call_sid] = speculation
+            self._running[call_sid] = self._running.get(call_sid, 0) + 1
+            self.stats["started"] += 1
+        return True
+
+    def claim(self, call_sid, final_text):
+        with self._lock:
+            self._partials.pop(call_sid, None)
+            speculation = self._inflight.pop(call_sid, None)
+            if speculation is None or speculation.future is None:
+                return None
+            if similarity(speculation.text, normalize(final_text)) < self.match_threshold:
+                self.stats["misses"] += 1
+                self._discard(speculation, call_sid)
+                return None
+            self.stats["hits"] += 1
+            # Kazanılan süre: final sonuç gelmeden önce tahminin çalıştığı süre
+            end = speculation.finished or time.monotonic()
+            self.stats["saved_seconds"] += end - speculation.started
+            return speculation
+
+    def forget(self, call_sid):
+        with self._lock:
+            self._partials.pop(call_sid, None)
+            speculation = self._inflight.pop(call_sid, None)
+            if speculation is not None:
+                self._discard(speculation, call_sid)
+
+    def hit_rate(self):
+        claimed = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / claimed if claimed else 0.0
+
+    def _discard(self, speculation, call_sid):
+        self.stats["discarded"] += 1
+        # cancel() yalnızca henüz başlamamış işi durdurabilir; başlamışsa bitince sayılır
+        if speculation.future is not None and speculation.future.cancel():
+            self._finish(call_sid)
+
+    def _finish(self, call_sid):
+        running = self._running.get(call_sid, 0) - 1
+        if running > 0:
+            self._running[call_sid] = running
+        else:
+            self._running.pop(call_sid, None)
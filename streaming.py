@@ -0,0 +1,90 @@
+import re
+import threading
+import time
+
+# Ardından boşluk gelen noktalama cümle sonu sayılır; "gmail.com", "3.5" bölünmez
+_SENTENCE_END_RE = re.compile(r"(\S*?)([.!?…]+)[\"'”»)]*(?=\s)")
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "vs", "etc", "approx", "e.g", "i.e", "mme", "mlle"}
+
+
+class StreamClaimed(Exception):
+    """Another request of the same turn is already streaming to the caller."""
+
+
+def sentence_ends(text):
+    """Offsets just past each complete sentence of text."""
+    for match in _SENTENCE_END_RE.finditer(text):
+        word, mark = match.group(1).lstrip("([\"'“«").lower(), match.group(2)
+        # "A... B..." gibi harf harf okunan kısımlar ve kısaltmalar cümleyi bitirmez
+        if ".." in mark or "…" in mark:
+            continue
+        if mark == "." and (len(word) == 1 or word.isdigit() or word in ABBREVIATIONS):
+            continue
+        yield match.end()
+
+
+def release_point(text, min_chars):
+    # O ana kadar tamamlanan cümlelerin hepsi; ilk parça en az min_chars olmalı
+    last = None
+    for end in sentence_ends(text):
+        last = end
+    return last if last is not None and last >= min_chars else None
+
+
+class TurnStream:
+    """Completion text of one turn as it streams in, handed to the caller in whole sentences.
+
+    The first request of the turn to produce a token owns the stream;
+    hedged or fallback requests that arrive later are cut off. Once a
+    prefix has been released it is spoken no matter what the final
+    reply turns out to be, so settle() keeps it in front of the text.
+    """
+
+    def __init__(self, min_chars, hold=None):
+        self.min_chars = min_chars
+        self.hold = hold
+        self.owner = None
+        self.text = ""
+        self.released = ""
+        self.result = None
+        self.done = False
+        self.started = time.monotonic()
+        self.first_token_after = None
+        self.cond = threading.Condition()
+
+    def feed(self, attempt, delta):
+        with self.cond:
+            if self.done or self.owner not in (None, attempt):
+                return False
+            if self.owner is None:
+                self.owner = attempt
+                self.first_token_after = time.monotonic() - self.started
+            self.text += delta
+            self.cond.notify_all()
+            return True
+
+    def settle(self, text):
+        """Marks the turn done; returns the reply as the caller hears it."""
+        with self.cond:
+            if self.released and not text.startswith(self.released):
+                # İlk cümleler söylendi, cevap sonradan yeniden yazıldı
+                text = f"{self.released.rstrip()} {text.lstrip()}"
+            self.result = text
+            self.done = True
+            self.cond.notify_all()
+            return text
+
+    def wait_first(self, timeout):
+        """The prefix to speak right away, or None once the turn is done or timeout passes."""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while not self.done:
+                cut = release_point(self.text, self.min_chars)
+                if cut is not None and not (self.hold is not None and self.hold(self.text[:cut])):
+                    self.released = self.text[:cut]
+                    return self.released
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+            return None
@@ -0,0 +1,37 @@
+import os
+
+import tts
+
+STT_MODEL = os.getenv("STT_MODEL", "whisper-1")
+STT_TIMEOUT = float(os.getenv("STT_TIMEOUT", "10"))
+
+
+class OpenAISTT:
+    """OpenAI transcription of one utterance of 8 kHz PCM, sent as a WAV file."""
+
+    name = "openai"
+
+    def __init__(self, client=None, model=STT_MODEL):
+        if client is None:
+            from openai import OpenAI
+
+            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        self.client = client
+        self.model = model
+
+    def transcribe(self, pcm, sample_rate, language):
+        # language: "en-US" gibi; API yalnızca ISO-639-1 kodunu bekler
+        result = self.client.audio.transcriptions.create(
+            model=self.model,
+            file=("utterance.wav", tts.to_wav(pcm, sample_rate), "audio/wav"),
+            language=language.split("-", 1)[0],
+            timeout=STT_TIMEOUT,
+        )
+        return result.text
+
+
+def create_stt_backend(name=None):
+    name = name if name is not None else os.getenv("STT_BACKEND", "openai")
+    if name == "openai":
+        return OpenAISTT()
+    raise ValueError(f"Unsupported STT_BACKEND: {name}")
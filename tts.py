@@ -0,0 +1,84 @@
+import io
+import logging
+import math
+import os
+import wave
+
+# Twilio <Play> 8 kHz telefon sesini doğrudan çalar; daha yüksek örnekleme boşa bayt
+SAMPLE_RATE = 8000
+SECONDS_PER_CHAR = 0.06
+
+
+def to_wav(pcm, sample_rate=SAMPLE_RATE):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class LocalTTS:
+    """Offline stand-in that renders a quiet tone as long as the text would take to speak."""
+
+    name = "local"
+    extension = "wav"
+
+    def synthesize(self, text, voice, language):
+        return to_wav(self.pcm(text, voice, language))
+
+    def pcm(self, text, voice, language):
+        # 8 kHz, 16 bit little-endian mono; Media Streams cevapları bundan μ-law'a çevrilir
+        frames = int(SAMPLE_RATE * max(0.5, len(text) * SECONDS_PER_CHAR))
+        # Her ses için farklı frekans; dinlerken hangi sesin çalındığı anlaşılır
+        frequency = 220 + sum(map(ord, voice)) % 220
+        samples = bytearray()
+        for i in range(frames):
+            value = int(1200 * math.sin(2 * math.pi * frequency * i / SAMPLE_RATE))
+            samples += value.to_bytes(2, "little", signed=True)
+        return bytes(samples)
+
+
+class PollyTTS:
+    """Amazon Polly, the same voices Twilio uses for <Say voice="Polly.*">."""
+
+    name = "polly"
+    extension = "mp3"
+
+    def __init__(self, engine=None):
+        import boto3  # opsiyonel bağımlılık
+
+        self.polly = boto3.client("polly")
+        self.engine = engine or os.getenv("POLLY_ENGINE", "standard")
+
+    def synthesize(self, text, voice, language):
+        return self._speech(text, voice, language, OutputFormat="mp3")
+
+    def pcm(self, text, voice, language):
+        return self._speech(text, voice, language, OutputFormat="pcm", SampleRate=str(SAMPLE_RATE))
+
+    def _speech(self, text, voice, language, **output):
+        if "<speak>" in text:
+            # E-posta onayı gibi metnin ortasındaki SSML; Polly tüm metnin tek <speak> içinde olmasını ister
+            text = "<speak>" + text.replace("<speak>", "").replace("</speak>", "") + "</speak>"
+            output["TextType"] = "ssml"
+        result = self.polly.synthesize_speech(
+            Text=text,
+            VoiceId=voice.split(".", 1)[-1],
+            LanguageCode=language,
+            Engine=self.engine,
+            **output,
+        )
+        return result["AudioStream"].read()
+
+
+def create_tts_backend(name=None):
+    name = name if name is not None else os.getenv("TTS_BACKEND", "polly")
+    if name == "local":
+        # Yalnızca benchmark'lar için; arayana bip sesi çalar
+        logging.warning("⚠️ TTS_BACKEND=local renders placeholder tones, not speech")
+        return LocalTTS()
+    if name == "polly":
+        return PollyTTS()
+    raise ValueError(f"Unsupported TTS_BACKEND: {name}")
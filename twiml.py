@@ -0,0 +1,350 @@
+import hashlib
+import os
+import re
+from xml.sax.saxutils import escape
+
+import audio_cache
+import call_flow
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+VOICES = {
+    "en": ("Polly.Joanna", "en-US"),
+    "fr": ("Polly.Celine", "fr-CA"),
+}
+
+# Twilio kısmi konuşma sonuçlarını bu adrese gönderir (spekülatif tamamlama)
+PARTIAL_RESULT_CALLBACK = os.getenv("SPECULATIVE_COMPLETIONS", "0") == "1"
+# Media Streams modu: dil seçiminden sonra <Gather> yerine <Connect><Stream> (yalnızca async_app)
+MEDIA_STREAMS = os.getenv("MEDIA_STREAMS", "0") == "1"
+VOICE_PATH = "/voice-stream" if MEDIA_STREAMS else "/voice"
+
+GATHER_DTMF = "dtmf"
+FINAL = "final"
+SPEECH = "speech"
+
+TRIGGER_PHRASES = ["press the pound key", "press #", "type your order number", "enter your order number",
+                   "appuyez sur la touche dièse", "touche dièse", "tapez votre numéro de commande"]
+
+FINAL_CLOSURES = {
+    "en": [
+        "Thank you for contacting Neatliner Customer Service.",
+        "Thank you for calling Neatliner Customer Service.",
+        "We’ll follow up with you as soon as possible. Goodbye!"
+    ],
+    "fr": [
+        "Merci d’avoir contacté le service client Neatliner.",
+        "Nous vous recontacterons dans les plus brefs délais. Au revoir !"
+    ]
+}
+
+SKIP_GATHER_PHRASES = {
+    "en": [
+        "Welcome to Neatliner Customer Service",
+        "Thank you for contacting Neatliner Customer Service",
+        "Unfortunately, I cannot assist with other topics"
+    ],
+    "fr": [
+        "Bienvenue au service client Neatliner",
+        "Merci d’avoir contacté le service client Neatliner",
+        "Malheureusement, je ne peux pas vous aider"
+    ]
+}
+
+WELCOME_MESSAGES = {
+    "en": "Welcome to Neatliner Customer Service.",
+    "fr": "Bienvenue au service client Neatliner. Pour le service en français, appuyez sur 9."
+}
+
+VOICE_WELCOME_LINES = {
+    "en": "I’m here to assist you with anything related to Neatliner products. How can I assist you today?",
+    "fr": "Je suis ici pour vous aider concernant les produits Neatliner. Comment puis-je vous aider aujourd'hui ?"
+}
+
+BUSY_MESSAGES = {
+    "en": "Thank you for calling Neatliner Customer Service. All of our lines are busy right now. Please call back in a few minutes.",
+    "fr": "Merci d’avoir appelé le service client Neatliner. Toutes nos lignes sont occupées pour le moment. Veuillez rappeler dans quelques minutes."
+}
+
+REPEAT_ORDER_MESSAGES = {
+    "en": (
+        "You didn’t press any keys. Please enter your order number using the keypad and press the pound key.",
+        "I'm sorry, I still didn’t receive any input. I will now end the call."
+    ),
+    "fr": (
+        "Vous n'avez appuyé sur aucune touche. Veuillez entrer votre numéro de commande au clavier téléphonique, puis appuyez sur la touche dièse.",
+        "Je suis désolé, je n’ai toujours pas reçu d’entrée. Je vais maintenant mettre fin à l’appel."
+    )
+}
+
+FILLER_MESSAGES = {
+    "en": "One moment, please.",
+    "fr": "Un instant, s'il vous plaît."
+}
+
+# Önceden render edilmiş sesler; AUDIO_CACHE_DIR yoksa her şey <Say> ile okunur
+AUDIO = audio_cache.load_audio_cache()
+
+# Tek geçişte eşleşme için tüm tetikleyiciler tek bir regex'te
+_TRIGGER_RE = re.compile("|".join(re.escape(phrase) for phrase in TRIGGER_PHRASES))
+_PASSIVE_PREFIXES = {lang: tuple(FINAL_CLOSURES[lang] + SKIP_GATHER_PHRASES[lang]) for lang in VOICES}
+
+
+def normalize_lang(lang):
+    return "fr" if lang == "fr" else "en"
+
+
+def is_ssml(text):
+    return "<break" in text or "<speak>" in text
+
+
+def say_body(text, ssml):
+    if ssml:
+        # CDATA içinde "]]>" geçerse bölerek kaçır
+        return "<![CDATA[" + text.replace("]]>", "]]]]><![CDATA[>") + "]]>"
+    return escape(text)
+
+
+def say(text, lang):
+    voice, language = VOICES[normalize_lang(lang)]
+    ssml = is_ssml(text)
+    ssml_attr = ' ssml="true"' if ssml else ""
+    return f'<Say voice="{voice}" language="{language}"{ssml_attr}>{say_body(text, ssml)}</Say>'
+
+
+def play(url):
+    return f"<Play>{escape(url)}</Play>"
+
+
+def audio_url(text, lang):
+    if AUDIO is None or is_ssml(text):
+        return None
+    voice, language = VOICES[normalize_lang(lang)]
+    return AUDIO.url(text, voice, language)
+
+
+def speak(text, lang):
+    # Önbellekte sesi varsa <Play>, yoksa <Say>
+    cached = audio_url(text, lang)
+    return play(cached) if cached is not None else say(text, lang)
+
+
+def _template_parts(template, field):
+    # "Sabit: {alan}. Sabit" -> ("Sabit:", "Sabit"); alanı izleyen noktalama alanla birlikte okunur
+    prefix, suffix = template.split("{" + field + "}")
+    return prefix.strip(), suffix.lstrip(" .,:;!?").strip()
+
+
+# Değişken bir parça içeren sabit cevaplar: sabit kısımlar çalınır, değişken kısım okunur
+AUDIO_TEMPLATES = {lang: [_template_parts(call_flow.ORDER_CONFIRMATION[lang], "order_number")] for lang in VOICES}
+
+
+def audio_segments(text, lang):
+    """<Play>/<Say> tags for a turn when its fixed parts are cached, else None."""
+    if AUDIO is None or is_ssml(text):
+        return None
+    lang = normalize_lang(lang)
+    cached = audio_url(text, lang)
+    if cached is not None:
+        return play(cached)
+    for prefix, rest in AUDIO_TEMPLATES[lang]:
+        if not (text.startswith(prefix) and text.endswith(rest)) or len(text) <= len(prefix) + len(rest):
+            continue
+        head, tail = audio_url(prefix, lang), audio_url(rest, lang)
+        if head is None or tail is None:
+            return None
+        value = text[len(prefix):len(text) - len(rest)].strip()
+        return f"{play(head)}\n  {say(value, lang)}\n  {play(tail)}"
+    return None
+
+
+def fixed_prompts():
+    # Ses önbelleğine render edilecek sabit cümleler: (metin, ses, dil)
+    texts = {lang: [WELCOME_MESSAGES[lang], VOICE_WELCOME_LINES[lang], BUSY_MESSAGES[lang], FILLER_MESSAGES[lang],
+                    *REPEAT_ORDER_MESSAGES[lang], *call_flow.SCRIPT[lang].values(),
+                    call_flow.ANYTHING_ELSE_QUESTION[lang], call_flow.REPEAT_REQUEST[lang]]
+             for lang in VOICES}
+    for lang, templates in AUDIO_TEMPLATES.items():
+        for prefix, rest in templates:
+            texts[lang] += [prefix, rest]
+    prompts = []
+    for lang, lang_texts in texts.items():
+        voice, language = VOICES[lang]
+        prompts += [(text, voice, language) for text in dict.fromkeys(lang_texts)]
+    return prompts
+
+
+def url(path, **params):
+    query = "&".join(f"{key}={value}" for key, value in params.items())
+    return escape(f"{path}?{query}" if query else path)
+
+
+def speech_gather(lang):
+    _, language = VOICES[lang]
+    partial = f' partialResultCallback="{url("/partial-speech", lang=lang)}"' if PARTIAL_RESULT_CALLBACK else ""
+    return f'<Gather input="speech" timeout="5" action="{url("/webhook", lang=lang)}" method="POST" language="{language}"{partial}/>'
+
+
+class StaticTwiml:
+    def __init__(self, body):
+        self.body = (XML_HEADER + body).encode("utf-8")
+        self.etag = hashlib.sha1(self.body).hexdigest()
+
+    def __len__(self):
+        return len(self.body)
+
+
+class TurnTwiml:
+    __slots__ = ("kind", "body")
+
+    def __init__(self, kind, body):
+        self.kind = kind
+        self.body = body
+
+    @property
+    def size(self):
+        return len(self.body)
+
+
+def _welcome():
+    return StaticTwiml(f"""<Response>
+  <Gather action="/handle-selection" method="POST" input="dtmf" numDigits="1" timeout="5">
+    {speak(WELCOME_MESSAGES["en"], "en")}
+    {speak(WELCOME_MESSAGES["fr"], "fr")}
+  </Gather>
+  <Redirect>{url(VOICE_PATH, lang="en")}</Redirect>
+</Response>""")
+
+
+def _busy():
+    return StaticTwiml(f"""<Response>
+  {speak(BUSY_MESSAGES["en"], "en")}
+  {speak(BUSY_MESSAGES["fr"], "fr")}
+  <Hangup/>
+</Response>""")
+
+
+def _selection(lang):
+    return StaticTwiml(f"""<Response>
+  <Redirect>{url(VOICE_PATH, lang=lang)}</Redirect>
+</Response>""")
+
+
+def _voice_flow(lang):
+    return StaticTwiml(f"""<Response>
+  {speak(VOICE_WELCOME_LINES[lang], lang)}
+  {speech_gather(lang)}
+</Response>""")
+
+
+def voice_stream(lang, stream_url, parameters):
+    # Arayan bilgisi ve dil, Stream'in "start" mesajında customParameters olarak geri gelir
+    tags = "".join(f'\n      <Parameter name="{escape(name)}" value="{escape(value, {chr(34): "&quot;"})}"/>'
+                   for name, value in parameters.items() if value)
+    return (XML_HEADER + f"""<Response>
+  {speak(VOICE_WELCOME_LINES[lang], lang)}
+  <Connect>
+    <Stream url="{escape(stream_url)}">{tags}
+    </Stream>
+  </Connect>
+</Response>""").encode("utf-8")
+
+
+def _repeat_order_number(lang):
+    _, language = VOICES[lang]
+    repeat_msg, goodbye_msg = REPEAT_ORDER_MESSAGES[lang]
+    return StaticTwiml(f"""<Response>
+  <Gather input="dtmf" timeout="10" finishOnKey="#" action="{url("/order-number", lang=lang)}" method="POST" language="{language}">
+    {speak(repeat_msg, lang)}
+  </Gather>
+  {speak(goodbye_msg, lang)}
+  <Hangup/>
+</Response>""")
+
+
+def _turn_templates(lang):
+    # Her tür için <Say>'den önceki ve sonraki baytlar önceden hazırlanır
+    voice, language = VOICES[lang]
+    head = (XML_HEADER + "<Response>\n").encode("utf-8")
+    return {
+        "say_plain": f'<Say voice="{voice}" language="{language}">'.encode("utf-8"),
+        "say_ssml": f'<Say voice="{voice}" language="{language}" ssml="true">'.encode("utf-8"),
+        "say_close": b"</Say>",
+        GATHER_DTMF: (
+            head + f'  <Gather input="dtmf" timeout="15" finishOnKey="#" action="{url("/order-number", lang=lang)}" method="POST">\n    '.encode("utf-8"),
+            f'\n  </Gather>\n  <Redirect>{url("/repeat-order-number", lang=lang)}</Redirect>\n</Response>'.encode("utf-8"),
+        ),
+        FINAL: (head + b"  ", b"\n</Response>"),
+        SPEECH: (
+            head + b"  ",
+            f'\n  {speech_gather(lang)}\n</Response>'.encode("utf-8"),
+        ),
+    }
+
+
+WELCOME = _welcome()
+BUSY = _busy()
+SELECTION = {lang: _selection(lang) for lang in VOICES}
+VOICE_FLOW = {lang: _voice_flow(lang) for lang in VOICES}
+REPEAT_ORDER_NUMBER = {lang: _repeat_order_number(lang) for lang in VOICES}
+_TEMPLATES = {lang: _turn_templates(lang) for lang in VOICES}
+# Senaryodaki sabit turların hazır cevapları (warm-up'ta doldurulur)
+_PRERENDERED = {}
+
+
+def wants_dtmf(text):
+    return _TRIGGER_RE.search(text.lower()) is not None
+
+
+def classify(text, lang):
+    text_clean = text.strip()
+    if wants_dtmf(text):
+        return GATHER_DTMF
+    if text_clean.startswith(_PASSIVE_PREFIXES[normalize_lang(lang)]):
+        return FINAL
+    return SPEECH
+
+
+def build_turn_response(text, lang, kind=None):
+    # kind verilirse (akıtılan turun kalanı) tür tüm cevaptan önceden belirlenmiştir
+    lang = normalize_lang(lang)
+    text_clean = text.strip()
+    if kind is None:
+        prerendered = _PRERENDERED.get((lang, text_clean))
+        if prerendered is not None:
+            return prerendered
+        kind = classify(text, lang)
+    templates = _TEMPLATES[lang]
+    head, tail = templates[kind]
+    if not text_clean:
+        return TurnTwiml(kind, head + tail)
+    ssml = is_ssml(text_clean)
+    audio = audio_segments(text_clean, lang)
+    if audio is not None:
+        return TurnTwiml(kind, b"".join((head, audio.encode("utf-8"), tail)))
+    body = b"".join((
+        head,
+        templates["say_ssml" if ssml else "say_plain"],
+        say_body(text_clean, ssml).encode("utf-8"),
+        templates["say_close"],
+        tail,
+    ))
+    return TurnTwiml(kind, body)
+
+
+def prerender_turns():
+    # Sabit cümlelerin turları bir kez üretilir; ses önbelleği yüklendikten sonra çağrılmalı
+    for lang in VOICES:
+        for text in (*call_flow.SCRIPT[lang].values(), call_flow.ANYTHING_ELSE_QUESTION[lang],
+                     call_flow.REPEAT_REQUEST[lang]):
+            _PRERENDERED.pop((lang, text.strip()), None)
+            _PRERENDERED[(lang, text.strip())] = build_turn_response(text, lang)
+    return len(_PRERENDERED)
+
+
+def redirect_response(lead, target):
+    return (XML_HEADER + f"<Response>\n  {lead}\n  <Redirect method=\"POST\">{target}</Redirect>\n</Response>").encode("utf-8")
+
+
+def pause(length):
+    return f'<Pause length="{int(length)}"/>'
@@ -0,0 +1,161 @@
+"""Startup warm-up and readiness.
+
+The tokenizer, the system prompt token counts, the scripted turn TwiML
+and a few keep-alive connections to OpenAI are prepared in the
+background right after import, so the first caller after a deploy does
+not pay for them. /ready answers 503 until every required step is done.
+
+Tokenizer files are read from TIKTOKEN_CACHE_DIR (tiktoken_cache/ next
+to the code by default). Fill it once where there is network, e.g. in
+the build step, and the app starts without downloading anything:
+
+    python warmup.py --vendor-tiktoken
+"""
+import argparse
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+WARMUP = os.getenv("WARMUP", "1") == "1"
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+VENDORED_MODELS = ("gpt-4o", "gpt-4o-mini")
+# tiktoken BPE dosyalarını ağdan değil bu dizinden okur (python warmup.py --vendor-tiktoken ile doldurulur)
+TIKTOKEN_CACHE_DIR = os.getenv("TIKTOKEN_CACHE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "tiktoken_cache")
+
+
+class Warmup:
+    """Named startup steps; ready once every required step has finished without error."""
+
+    def __init__(self):
+        self.steps = {}
+        self.started = time.monotonic()
+        self.ready_after = None
+        self.lock = threading.Lock()
+
+    def expect(self, name, required=True):
+        with self.lock:
+            self.steps[name] = {"required": required, "done": False, "seconds": None, "result": None, "error": None}
+            self.ready_after = None
+
+    def finish(self, name, seconds, result=None, error=None):
+        with self.lock:
+            self.steps[name].update(done=True, seconds=round(seconds, 4), result=result, error=error)
+            if self.ready_after is None and self._ready():
+                self.ready_after = time.monotonic() - self.started
+                logging.info(f"✅ Ready {self.ready_after * 1000:.0f} ms after startup")
+
+    def run(self, name, fn):
+        start = time.perf_counter()
+        try:
+            result, error = fn(), None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+            logging.warning(f"⚠️ Warm-up step {name} failed: {error}")
+        self.finish(name, time.perf_counter() - start, result, error)
+
+    async def run_async(self, name, fn):
+        start = time.perf_counter()
+        try:
+            result, error = await fn(), None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+            logging.warning(f"⚠️ Warm-up step {name} failed: {error}")
+        self.finish(name, time.perf_counter() - start, result, error)
+
+    def start(self, steps):
+        # steps: (ad, fonksiyon, zorunlu); birbirinden bağımsız, her biri kendi thread'inde
+        for name, _, required in steps:
+            self.expect(name, required)
+        for name, fn, _ in steps:
+            threading.Thread(target=self.run, args=(name, fn), name=f"warmup-{name}", daemon=True).start()
+
+    def _ready(self):
+        return all(step["done"] and (step["error"] is None or not step["required"]) for step in self.steps.values())
+
+    def ready(self):
+        with self.lock:
+            return self._ready()
+
+    def status(self):
+        with self.lock:
+            return {
+                "ready": self._ready(),
+                "ready_after": round(self.ready_after, 4) if self.ready_after is not None else None,
+                "steps": {name: dict(step) for name, step in self.steps.items()},
+            }
+
+
+def open_connections(client, count=WARMUP_CONNECTIONS, timeout=WARMUP_TIMEOUT):
+    """Opens count pooled keep-alive connections to the API at once; returns how many answered."""
+    if count <= 0:
+        return 0
+    warm = client.with_options(max_retries=0, timeout=timeout)
+
+    def touch(_):
+        try:
+            warm.models.with_raw_response.list()
+        except openai.APIStatusError:
+            # Hata cevabı da bağlantının açılıp havuza döndüğünü gösterir
+            pass
+
+    with ThreadPoolExecutor(max_workers=count, thread_name_prefix="warmup-connect") as pool:
+        results = [pool.submit(touch, i) for i in range(count)]
+    errors = [future.exception() for future in results if future.exception() is not None]
+    if len(errors) == count:
+        raise errors[0]
+    return count - len(errors)
+
+
+async def open_connections_async(client, count=WARMUP_CONNECTIONS, timeout=WARMUP_TIMEOUT):
+    if count <= 0:
+        return 0
+    warm = client.with_options(max_retries=0, timeout=timeout)
+
+    async def touch():
+        try:
+            await warm.models.with_raw_response.list()
+        except openai.APIStatusError:
+            pass
+
+    results = await asyncio.gather(*(touch() for _ in range(count)), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if len(errors) == count:
+        raise errors[0]
+    return count - len(errors)
+
+
+def use_tiktoken_cache(directory=TIKTOKEN_CACHE_DIR):
+    # tiktoken dizini her dosya yüklemesinde ortamdan okur; ilk encoding yüklenmeden önce çağrılmalı
+    return os.environ.setdefault("TIKTOKEN_CACHE_DIR", directory)
+
+
+def vendor_tiktoken(directory, models=VENDORED_MODELS):
+    # tiktoken indirdiği dosyayı TIKTOKEN_CACHE_DIR'e yazar; sonraki yüklemeler ağa çıkmaz
+    os.environ["TIKTOKEN_CACHE_DIR"] = directory
+    import tiktoken
+
+    return {model: tiktoken.encoding_for_model(model).name for model in models}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vendor-tiktoken", action="store_true", help="download tokenizer files for offline starts")
+    parser.add_argument("--dir", default=TIKTOKEN_CACHE_DIR)
+    args = parser.parse_args()
+    if not args.vendor_tiktoken:
+        parser.error("nothing to do; pass --vendor-tiktoken")
+
+    encodings = vendor_tiktoken(args.dir)
+    files = sorted(os.listdir(args.dir)) if os.path.isdir(args.dir) else []
+    print(f"{', '.join(f'{m}={e}' for m, e in encodings.items())}; {len(files)} files in {args.dir}")
+
+
+if __name__ == "__main__":
+    main()